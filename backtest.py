@@ -0,0 +1,222 @@
+import numpy as np
+import builtins
+import argparse
+import logging
+from typing import List, Dict, Tuple
+from types import CodeType
+from price import compile_formula, OrderBook, CalculationFormulaWrongException
+from item import Item, retrieve_items, hash_descriptions
+from dry_run import load_snapshot
+from common.variables import config, wallet, setup_logging
+
+logger = logging.getLogger(__name__)
+
+_fee_cache: Dict[Tuple[int, float], float] = {}  # (cents, publisher_fee): fee
+
+
+class HistoryArrays(object):
+    """
+    The price history of an item in numpy arrays, every helper answers for all the time points at once
+    """
+
+    def __init__(self, history: List[List], points: np.ndarray):
+        """
+        :param history: List[List[timestamp, price, amount]] in time order
+        :param points: the time points to replay, timestamps
+        """
+        history = [record for record in history if isinstance(record[0], (int, float))]
+        self.timestamps = np.array([record[0] for record in history], dtype=np.float64)
+        self.prices = np.array([record[1] for record in history], dtype=np.float64)
+        amounts = np.array([record[2] for record in history], dtype=np.float64)
+        self.points = points
+        # Prefix sums, the sum of records [i, j) is cum[j] - cum[i]
+        self.cum_amounts = np.concatenate(([0.0], np.cumsum(amounts)))
+        self.cum_values = np.concatenate(([0.0], np.cumsum(self.prices * amounts)))
+        # Only the records before the time point are known at that time
+        self.ends = np.searchsorted(self.timestamps, points, side='right')
+        # Sparse table for range max queries
+        self.max_table = [self.prices]
+        while len(self.max_table[-1]) > 1 and 2 ** len(self.max_table) <= len(self.prices):
+            last = self.max_table[-1]
+            half = 2 ** (len(self.max_table) - 1)
+            self.max_table.append(np.maximum(last[:-half], last[half:]))
+
+    def range_max(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """
+        The highest price in the records [starts, ends), 0.0 when there is no record
+
+        :return: np.ndarray of the highest prices
+        """
+        lengths = ends - starts
+        result = np.zeros(len(starts), dtype=np.float64)
+        valid = lengths > 0
+        if not valid.any():
+            return result
+        levels = np.floor(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+        for level in np.unique(levels[valid]):
+            mask = valid & (levels == level)
+            table = self.max_table[level]
+            result[mask] = np.maximum(table[starts[mask]], table[ends[mask] - 2 ** level])
+        return result
+
+    def starts(self, hours: int) -> np.ndarray:
+        if not isinstance(hours, (int, float)) or hours < 0 or hours > 999999:
+            raise CalculationFormulaWrongException
+        return np.minimum(np.searchsorted(self.timestamps, self.points - int(hours) * 3600, side='left'), self.ends)
+
+    def get_history_sales_num(self, hours: int) -> np.ndarray:
+        starts = self.starts(hours)
+        return self.cum_amounts[self.ends] - self.cum_amounts[starts]
+
+    def get_history_average_price(self, hours: int, weighted: bool = True) -> np.ndarray:
+        if not isinstance(weighted, bool):
+            raise CalculationFormulaWrongException
+        starts = self.starts(hours)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if weighted:
+                return (self.cum_values[self.ends] - self.cum_values[starts]) / \
+                       (self.cum_amounts[self.ends] - self.cum_amounts[starts])
+            prices = np.concatenate(([0.0], np.cumsum(self.prices)))
+            return (prices[self.ends] - prices[starts]) / (self.ends - starts)
+
+    def get_history_highest_price(self, hours: int) -> np.ndarray:
+        return self.range_max(self.starts(hours), self.ends)
+
+    def get_future_highest_price(self, hours: int) -> np.ndarray:
+        """
+        The highest sale price in the hours after every time point
+        """
+        ends = np.searchsorted(self.timestamps, self.points + hours * 3600, side='right')
+        return self.range_max(self.ends, ends)
+
+
+def __array_max(*args):
+    if len(args) > 1 and any(isinstance(arg, np.ndarray) for arg in args):
+        return np.maximum.reduce(np.broadcast_arrays(*args))
+    return builtins.max(*args)
+
+
+def __array_min(*args):
+    if len(args) > 1 and any(isinstance(arg, np.ndarray) for arg in args):
+        return np.minimum.reduce(np.broadcast_arrays(*args))
+    return builtins.min(*args)
+
+
+def evaluate_formula(code: CodeType, history: HistoryArrays, order_book: OrderBook) -> np.ndarray:
+    """
+    Evaluate the formula for all the time points at once.
+    The order book in the past is unknown, so the order values are taken from the snapshot's graph
+
+    :param code: the compiled formula
+    :param history: :class:`HistoryArrays`
+    :param order_book: :class:`OrderBook` of the snapshot's price graph
+    :return: the selling prices, NaN when the formula has no answer
+    """
+    variables = order_book.get_helpers()
+    variables.update({
+        'get_history_sales_num': history.get_history_sales_num,
+        'get_history_average_price': history.get_history_average_price,
+        'get_history_highest_price': history.get_history_highest_price,
+        'max': __array_max,
+        'min': __array_min,
+        'np': np
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = eval(code, dict(variables, __builtins__=builtins))
+    return np.broadcast_to(np.asarray(result, dtype=np.float64), history.points.shape)
+
+
+def calculate_fees(prices: np.ndarray, publisher_fee: float = None) -> np.ndarray:
+    """
+    Calculate the steam market fees of the prices with ``Wallet.calculate_fee``, every distinct price once
+
+    :param prices: the selling prices
+    :param publisher_fee: The item's publisher fee percent, the wallet's default if None
+    :return: the fees in the same unit as the prices
+    """
+    if len(prices) == 0:
+        return prices
+    cents, inverse = np.unique(np.round(prices * 100).astype(np.int64), return_inverse=True)
+    for cent in cents:
+        if (cent, publisher_fee) not in _fee_cache:
+            _fee_cache[(cent, publisher_fee)] = wallet.calculate_fee(cent / 100, publisher_fee) / 100
+    fees = np.array([_fee_cache[(cent, publisher_fee)] for cent in cents], dtype=np.float64)
+    return fees[inverse]
+
+
+def backtest(formulas: List[str], snapshot: Dict, days: int = 30, step_hours: int = 24,
+             horizon_hours: int = 48) -> List[Dict]:
+    """
+    Replay the past for every formula: at every time point the selling price is calculated with the history before it,
+    and the listing is filled if a later sale in ``horizon_hours`` reached the price
+
+    :param formulas: the calculation formulas to compare
+    :param snapshot: the snapshot from function ``dry_run.load_snapshot``
+    :param days: how many days to replay
+    :param step_hours: the hours between two time points
+    :param horizon_hours: the hours a listing waits to be filled
+    :return: List[{'formula': str, 'listings': int, 'fills': int, 'fill_rate': float, 'net_revenue': float,
+                   'errors': int}]
+    """
+    items: Dict[str, Item] = {}
+    for item in retrieve_items(snapshot['inventory']['assets'],
+                               hash_descriptions(snapshot['inventory']['descriptions'])):
+        if item.judge_can_sell():
+            items.setdefault('%d/%s' % (item.appid, item.market_hash_name), item)
+    now = snapshot['time']
+    points = np.arange(now - days * 86400, now - horizon_hours * 3600, step_hours * 3600, dtype=np.float64)
+    codes = [compile_formula(formula) for formula in formulas]
+    results = [{'formula': formula, 'listings': 0, 'fills': 0, 'fill_rate': 0.0, 'net_revenue': 0.0, 'errors': 0}
+               for formula in formulas]
+
+    for key, item in items.items():
+        data = snapshot['market'].get(key)
+        if data is None:
+            continue
+        history = HistoryArrays(data['history'], points)
+        order_book = OrderBook(data['graph'])
+        if order_book.total_buy_orders < config.price_setting['least_buy_orders'] or \
+                order_book.total_sell_orders < config.price_setting['least_sell_orders']:
+            continue
+        can_list = history.get_history_sales_num(config.price_setting['least_sells_hours']) >= \
+            config.price_setting['hours_least_sells']
+        lowest_price, highest_price = item.get_price_bounds()
+        future_highest_price = history.get_future_highest_price(horizon_hours)
+        # The snapshots saved before the publisher fee was recorded fall back to the item's
+        publisher_fee = data.get('publisher_fee', item.publisher_fee)
+        for code, result in zip(codes, results):
+            try:
+                prices = evaluate_formula(code, history, order_book)
+            except Exception as e:
+                logger.debug('Formula error on %s: %s', key, repr(e))
+                result['errors'] += 1
+                continue
+            listed = can_list & np.isfinite(prices) & (prices > 0)
+            if lowest_price is not None:
+                listed &= prices >= lowest_price
+            if highest_price is not None:
+                listed &= prices <= highest_price
+            filled = listed & (future_highest_price >= prices)
+            result['listings'] += int(listed.sum())
+            result['fills'] += int(filled.sum())
+            result['net_revenue'] += float((prices[filled] - calculate_fees(prices[filled], publisher_fee)).sum())
+
+    for result in results:
+        result['fill_rate'] = result['fills'] / result['listings'] if result['listings'] else 0.0
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest calculation formulas over the dry run snapshot')
+    parser.add_argument('formulas', nargs='+', help='the calculation formulas to compare')
+    parser.add_argument('--snapshot', default=None, help='the snapshot file, dry_run.snapshot_file by default')
+    parser.add_argument('--days', type=int, default=30, help='how many days to replay')
+    parser.add_argument('--step', type=int, default=24, help='the hours between two time points')
+    parser.add_argument('--horizon', type=int, default=48, help='the hours a listing waits to be filled')
+    args = parser.parse_args()
+    setup_logging()
+    for row in backtest(args.formulas, load_snapshot(args.snapshot or config.dry_run['snapshot_file']),
+                        args.days, args.step, args.horizon):
+        logger.info('Listings: %8d, Fills: %8d, Fill rate: %6.2f%%, Net revenue: %12.2f, Errors: %d, Formula: %s',
+                    row['listings'], row['fills'], row['fill_rate'] * 100, row['net_revenue'], row['errors'],
+                    row['formula'])
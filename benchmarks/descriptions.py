@@ -0,0 +1,123 @@
+"""
+Compare the nested description index with the flat one on a synthetic inventory.
+Run from the project folder: ``python -m benchmarks.descriptions [--assets 100000]``
+"""
+import gc
+import argparse
+import tracemalloc
+from json import dumps, loads
+from time import perf_counter
+from typing import List, Dict, Callable
+from item import Item, hash_descriptions, retrieve_items
+
+
+def generate_inventory(assets_num: int, descriptions_num: int) -> str:
+    """
+    Generate the json of an inventory like the Inventory API returns
+
+    :param assets_num: the number of assets
+    :param descriptions_num: the number of distinct descriptions
+    :return: json text {'assets': List, 'descriptions': List}
+    """
+    descriptions = []
+    for i in range(descriptions_num):
+        foil = i % 5 == 0
+        descriptions.append({
+            'appid': 753,
+            'classid': str(100000000 + i),
+            'instanceid': '0',
+            'currency': 0,
+            'background_color': '',
+            'icon_url': 'IzMF03bk9WpSBq-S-ekoE33L-iLqGFHVaU25ZzQNQcXdEH9myp0erOEX%dXXXXXXXXXXXXXXXXXXXXXXXXXX' % i,
+            'icon_url_large': 'IzMF03bk9WpSBq-S-ekoE33L-iLqGFHVaU25ZzQNQcXdEH9myp0erOEY%dYYYYYYYYYYYYYYYYYYYYYY' % i,
+            'descriptions': [{'type': 'html', 'value': 'A trading card of game %d, collect them all' % (i // 8)}],
+            'tradable': 1,
+            'actions': [{'link': 'https://steamcommunity.com/my/gamecards/%d/' % (i // 8), 'name': 'View badge'}],
+            'owner_descriptions': [{'type': 'html', 'value': 'You have %d of %d cards' % (i % 8, 8)}],
+            'name': 'Card %d' % i,
+            'name_color': '',
+            'type': 'Game %d %s' % (i // 8, 'Foil Trading Card' if foil else 'Trading Card'),
+            'market_name': 'Card %d' % i,
+            'market_hash_name': '%d-Card %d' % (i // 8, i),
+            'market_fee_app': i // 8,
+            'commodity': 1,
+            'market_tradable_restriction': 7,
+            'market_marketable_restriction': 7,
+            'marketable': 1,
+            'tags': [
+                {'category': 'Game', 'internal_name': 'app_%d' % (i // 8), 'localized_category_name': 'Game',
+                 'localized_tag_name': 'Game %d' % (i // 8)},
+                {'category': 'item_class', 'internal_name': 'item_class_2', 'localized_category_name': 'Item Type',
+                 'localized_tag_name': 'Trading Card'},
+                {'category': 'cardborder', 'internal_name': 'cardborder_1' if foil else 'cardborder_0',
+                 'localized_category_name': 'Card Border', 'localized_tag_name': 'Foil' if foil else 'Normal'}
+            ]
+        })
+    assets = [{'appid': 753, 'contextid': '6', 'assetid': str(20000000000 + i),
+               'classid': str(100000000 + i % descriptions_num), 'instanceid': '0', 'amount': '1'}
+              for i in range(assets_num)]
+    return dumps({'assets': assets, 'descriptions': descriptions})
+
+
+def nested_hash_descriptions(descriptions: List[Dict]) -> Dict[int, Dict[str, Dict[str, Dict]]]:
+    """The nested index used before, kept for the comparison"""
+    index = {}
+    for description in descriptions:
+        index.setdefault(description['appid'], {}).setdefault(description['classid'],
+                                                              {})[description['instanceid']] = description
+    return index
+
+
+def nested_retrieve_items(assets: List[Dict], descriptions: Dict[int, Dict[str, Dict[str, Dict]]]) -> List[Item]:
+    """The nested lookup used before, kept for the comparison"""
+    items = []
+    for asset in assets:
+        description = descriptions[asset['appid']][asset['classid']][asset['instanceid']]
+        items.append(Item(appid=description['appid'], contextid=asset['contextid'], assetid=asset['assetid'],
+                          classid=description['classid'], instanceid=description['instanceid'],
+                          amount=asset['amount'], tradable=description['tradable'], name=description['name'],
+                          type_detail=description['type'], market_name=description['market_name'],
+                          market_hash_name=description['market_hash_name'], marketable=description['marketable'],
+                          tags=description['tags'], publisher_fee=description.get('publisher_fee', None)))
+    return items
+
+
+def measure(text: str, hash_function: Callable, retrieve_function: Callable) -> Dict:
+    """
+    Parse the inventory and retrieve the items like ``main.start``, the raw inventory is freed afterwards.
+    The time is measured without tracing the memory
+
+    :return: {'seconds': float, 'peak': int, 'retained': int},
+             the memory is in bytes and doesn't count the raw inventory
+    """
+    inventory = loads(text)
+    gc.collect()
+    start_time = perf_counter()
+    items = retrieve_function(inventory['assets'], hash_function(inventory['descriptions']))
+    seconds = perf_counter() - start_time
+    del inventory, items
+    gc.collect()
+
+    tracemalloc.start()
+    inventory = loads(text)
+    loaded = tracemalloc.get_traced_memory()[0]
+    items = retrieve_function(inventory['assets'], hash_function(inventory['descriptions']))
+    del inventory
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return {'seconds': seconds, 'peak': peak - loaded, 'retained': retained}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the description index')
+    parser.add_argument('--assets', type=int, default=100000, help='the number of assets')
+    parser.add_argument('--descriptions', type=int, default=20000, help='the number of distinct descriptions')
+    args = parser.parse_args()
+    inventory_text = generate_inventory(args.assets, args.descriptions)
+    for name, functions in (('nested', (nested_hash_descriptions, nested_retrieve_items)),
+                            ('flat', (hash_descriptions, retrieve_items))):
+        result = measure(inventory_text, *functions)
+        print('%-8s index + items: %7.3f s, peak over the raw inventory: %7.1f MB, retained items: %7.1f MB' %
+              (name, result['seconds'], result['peak'] / 1024 ** 2, result['retained'] / 1024 ** 2))
@@ -0,0 +1,232 @@
+"""
+Time the pure-Python hot paths on synthetic data and compare them with the baseline kept in the repo.
+No network and no config.json is needed, the config and the wallet are built in memory.
+The timings are only comparable on the machine which saved the baseline.
+Run from the project folder: ``python -m benchmarks.suite [--scales 1000 10000 100000] [--save-baseline]``
+"""
+import gc
+import os
+import sys
+import argparse
+import tracemalloc
+from json import dumps, loads
+from random import Random
+from time import perf_counter
+from typing import List, Dict, Callable
+from config import Config, config
+from wallet import Wallet
+from common.variables import wallet
+from common.common import parse_datetime
+from item import hash_descriptions, retrieve_items
+from price import Price
+from benchmarks.descriptions import generate_inventory
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SCALES = [1000, 10000, 100000]
+# A month name for every record, like the price history API returns
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+MIN_SECONDS = 0.2
+
+CONFIG = {
+    'steam_login_secure': '76561198000000000%7C%7Cbenchmark',
+    'steam_id': '76561198000000000',
+    'allow_to_sell_item': {'enable': True, 'item_type': [6, 20, 21]},
+    'disallow_to_sell_item': {'enable': True, 'item_type': [3]},
+    'allow_to_sell_item_detail': {'enable': False},
+    'disallow_to_sell_item_detail': {'enable': True, 'item_detail_type': ['Game 1 Foil Trading Card']},
+    'price_setting': {
+        'calculation_formula': 'max(get_history_average_price(168), sales_push_back(3), price_at_quantile(0.1)) '
+                               '* 0.98 if spread() < get_history_highest_price(72) else lowest_sell_price',
+        'least_sells_hours': 168,
+        'hours_least_sells': 1,
+        'least_buy_orders': 1,
+        'least_sell_orders': 1,
+        'other_item': {}
+    }
+}
+
+
+def generate_history(records_num: int, rng: Random) -> List[List]:
+    """
+    Generate the raw price history like the price history API returns, one record per hour
+
+    :return: List[[datetime string, price, amount string]]
+    """
+    history = []
+    for i in range(records_num):
+        day, hour = divmod(i, 24)
+        history.append(['%s %02d %d %02d: +0' % (MONTHS[day // 28 % 12], day % 28 + 1, 2015 + day // 336, hour),
+                        round(rng.uniform(0.03, 2.0), 3), str(rng.randint(1, 50))])
+    return history
+
+
+def generate_graph(orders_num: int, rng: Random) -> Dict:
+    """
+    Generate the price graph like the orders histogram API returns
+
+    :return: {'highest_buy_order': float, 'lowest_sell_order': float,
+              'sell_order_graph': List, 'buy_order_graph': List}
+    """
+    sell_order_graph, buy_order_graph = [], []
+    sell_total, buy_total = 0, 0
+    for i in range(orders_num):
+        sell_total += rng.randint(1, 20)
+        buy_total += rng.randint(1, 20)
+        sell_order_graph.append([round(1.0 + i * 0.01, 2), sell_total, ''])
+        buy_order_graph.append([round(0.99 - i * 0.99 / orders_num, 4), buy_total, ''])
+    return {'highest_buy_order': buy_order_graph[0][0], 'lowest_sell_order': sell_order_graph[0][0],
+            'sell_order_graph': sell_order_graph, 'buy_order_graph': buy_order_graph}
+
+
+def bench_hash_descriptions(scale: int, rng: Random) -> Callable:
+    descriptions = loads(generate_inventory(scale, max(scale // 5, 1)))['descriptions']
+    return lambda: hash_descriptions(descriptions)
+
+
+def bench_retrieve_items(scale: int, rng: Random) -> Callable:
+    inventory = loads(generate_inventory(scale, max(scale // 5, 1)))
+    index = hash_descriptions(inventory['descriptions'])
+    return lambda: retrieve_items(inventory['assets'], index)
+
+
+def bench_judge_can_sell(scale: int, rng: Random) -> Callable:
+    inventory = loads(generate_inventory(scale, max(scale // 5, 1)))
+    items = retrieve_items(inventory['assets'], hash_descriptions(inventory['descriptions']))
+    return lambda: [item.judge_can_sell() for item in items]
+
+
+def bench_parse_datetime(scale: int, rng: Random) -> Callable:
+    datetime_strs = [record[0] for record in generate_history(scale, rng)]
+    return lambda: [parse_datetime(datetime_str) for datetime_str in datetime_strs]
+
+
+def bench_calculate_price(scale: int, rng: Random) -> Callable:
+    """The history and the order book helpers on a history of ``scale`` records"""
+    history = generate_history(scale, rng)
+    for record in history:
+        record[0] = parse_datetime(record[0])
+        record[2] = int(record[2])
+    start = history[-1][0].timestamp()
+    graph = generate_graph(max(scale // 10, 1), rng)
+
+    def work() -> float:
+        price = Price(753, 'benchmark', item_price_history=history, item_price_graph=graph, now=start)
+        price.calculate_price()
+        return price.sell_price
+
+    return work
+
+
+def bench_calculate_fee(scale: int, rng: Random) -> Callable:
+    prices = [round(rng.uniform(0.03, 100.0), 2) for _ in range(scale)]
+    return lambda: [wallet.calculate_fee(price) for price in prices]
+
+
+BENCHMARKS = {
+    'hash_descriptions': bench_hash_descriptions,
+    'retrieve_items': bench_retrieve_items,
+    'judge_can_sell': bench_judge_can_sell,
+    'parse_datetime': bench_parse_datetime,
+    'calculate_price': bench_calculate_price,
+    'calculate_fee': bench_calculate_fee
+}
+
+
+def measure(work: Callable, repeat: int) -> Dict:
+    """
+    Time the work without tracing the memory, then run it once more to trace the peak memory.
+    A fast work is looped until a timing takes ``MIN_SECONDS``, so the timer noise doesn't count
+
+    :param work: the function to measure, the data it needs is built beforehand
+    :param repeat: the timings to take, the fastest counts
+    :return: {'seconds': float, 'peak': int}, the seconds of one run,
+             the memory is in bytes and doesn't count the input data
+    """
+    loops = 1
+    timings = []
+    while len(timings) < repeat:
+        gc.collect()
+        start_time = perf_counter()
+        for _ in range(loops):
+            work()
+        elapsed = perf_counter() - start_time
+        if elapsed < MIN_SECONDS and not timings:
+            loops *= 2
+            continue
+        timings.append(elapsed / loops)
+    gc.collect()
+    tracemalloc.start()
+    result = work()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return {'seconds': min(timings), 'peak': peak}
+
+
+def run(names: List[str], scales: List[int], repeat: int) -> Dict[str, Dict]:
+    """
+    :return: {'<name>@<scale>': {'seconds': float, 'peak': int}}
+    """
+    config.set_object(Config(loads(dumps(CONFIG))))
+    wallet.set_object(Wallet(wallet_fee_base=0, wallet_fee_percent=0.05, wallet_fee_minimum=1, currency=1,
+                             wallet_publisher_fee_percent_default=0.1))
+    results = {}
+    for scale in scales:
+        for name in names:
+            work = BENCHMARKS[name](scale, Random(scale))
+            results['%s@%d' % (name, scale)] = result = measure(work, repeat)
+            del work
+            print('%-18s %7d: %9.4f s, peak %8.2f MB' % (name, scale, result['seconds'], result['peak'] / 1024 ** 2))
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """
+    :param threshold: the allowed slowdown or memory growth, 0.5 = 50%
+    :return: the regressions
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ('seconds', 'peak'):
+            if result[metric] > baseline[key][metric] * (1 + threshold):
+                regressions.append('%s %s: %s -> %s (+%.0f%%)' % (
+                    key, metric, baseline[key][metric], result[metric],
+                    (result[metric] / baseline[key][metric] - 1) * 100 if baseline[key][metric] else float('inf')))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the CPU hot paths on synthetic data')
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES, help='the numbers of assets or records')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help='the benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='the runs to time, the fastest counts')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='the slowdown or memory growth over the baseline reported as a regression')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='the baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    args = parser.parse_args()
+
+    measured = run(args.only, args.scales, args.repeat)
+    if args.save_baseline:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                saved = loads(f.read())
+        saved.update(measured)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(dumps(saved, indent=2, sort_keys=True))
+        print('Saved the baseline to %s' % args.baseline)
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print('No baseline at %s, run with --save-baseline first' % args.baseline)
+        sys.exit(0)
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        found = compare(measured, loads(f.read()), args.threshold)
+    for regression in found:
+        print('REGRESSION %s' % regression)
+    if found:
+        sys.exit(1)
+    print('No regression over %.0f%%' % (args.threshold * 100))
@@ -0,0 +1,136 @@
+import os
+from json import loads, dumps, JSONDecodeError
+from typing import List, Dict, Optional, TextIO
+from common.cache import CACHE_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.path.join(CACHE_DIR, 'checkpoint.jsonl')
+
+# The asset states
+LISTING = 'listing'  # The listing request may have been sent, the result is unknown
+LISTED = 'listed'
+SKIPPED = 'skipped'
+
+
+class Checkpoint(object):
+    def __init__(self, path: Optional[str] = CHECKPOINT_PATH):
+        """
+        A write-ahead log of a run, every line is a json record:
+        ``{'type': 'inventory', 'time': float, 'assets': List, 'descriptions': List}`` as the first line,
+        ``{'type': 'price', 'key': 'appid/market_hash_name', 'sell_price': float or None}``
+        and ``{'type': 'asset', 'assetid': str, 'state': str}``.
+        An asset is recorded as ``LISTING`` before the listing request is sent, so it's never listed twice
+
+        :param path: the checkpoint file path, None to disable the checkpoint
+        """
+        self.path: Optional[str] = path
+        self.file: Optional[TextIO] = None
+        self.inventory: Optional[Dict] = None
+        self.prices: Dict[str, Optional[float]] = {}  # key: sell_price, None means can't be sold
+        self.assets: Dict[str, str] = {}  # assetid: state
+        self.size: int = 0  # The size of the complete lines loaded, a torn last line is cut off on resume
+
+    def load(self) -> bool:
+        """
+        Load the checkpoint of the last run. A broken last line is the record being written when it crashed,
+        so it's dropped, and so is a record in a wrong format
+
+        :return: Loaded = True
+        """
+        if self.path is None:
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        self.size = data.rfind(b'\n') + 1
+        for line in data.decode('utf-8', errors='replace').splitlines():
+            try:
+                record = loads(line)
+                if record['type'] == 'inventory':
+                    self.inventory = record
+                elif record['type'] == 'price':
+                    self.prices[record['key']] = record['sell_price']
+                elif record['type'] == 'asset':
+                    self.assets[record['assetid']] = record['state']
+            except (JSONDecodeError, KeyError, TypeError):
+                logger.warning('Drop a broken record in the checkpoint: %s', self.path)
+        if self.inventory is None:
+            logger.warning("The checkpoint: %s doesn't have the inventory, ignore it", self.path)
+            self.prices.clear()
+            self.assets.clear()
+            return False
+        logger.info('Load checkpoint: %d prices, %d assets done', len(self.prices), len(self.assets))
+        return True
+
+    def start(self, assets: List[Dict], descriptions: List[Dict], now: float) -> None:
+        """
+        Start a new checkpoint with the inventory snapshot, the last checkpoint is replaced
+
+        :param assets: Assets obtained from the Inventory API
+        :param descriptions: Descriptions obtained from the Inventory API
+        :param now: the time the inventory is fetched
+        :return: None
+        """
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.prices.clear()
+        self.assets.clear()
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.__write({'type': 'inventory', 'time': now, 'assets': assets, 'descriptions': descriptions}, sync=True)
+
+    def resume(self) -> (List[Dict], List[Dict]):
+        """
+        Continue writing the loaded checkpoint, the torn last line is cut off first so the next record
+        starts on a line of its own
+
+        :return: (assets, descriptions) of the inventory snapshot
+        """
+        inventory, self.inventory = self.inventory, None
+        os.truncate(self.path, self.size)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        return inventory['assets'], inventory['descriptions']
+
+    def record_price(self, key: str, sell_price: Optional[float]) -> None:
+        """
+        :param key: 'appid/market_hash_name'
+        :param sell_price: the selling price, None means the item can't be sold
+        :return: None
+        """
+        self.prices[key] = sell_price
+        self.__write({'type': 'price', 'key': key, 'sell_price': sell_price})
+
+    def record_asset(self, assetid: str, state: str) -> None:
+        """
+        :param assetid: the item's assetid
+        :param state: ``LISTING``, ``LISTED`` or ``SKIPPED``
+        :return: None
+        """
+        self.assets[assetid] = state
+        self.__write({'type': 'asset', 'assetid': assetid, 'state': state}, sync=state == LISTING)
+
+    def close(self, finished: bool = False) -> None:
+        """
+        Close the checkpoint, a finished run has nothing to resume so its checkpoint is removed
+
+        :param finished: all the items are done
+        :return: None
+        """
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if finished:
+            os.remove(self.path)
+
+    def __write(self, record: Dict, sync: bool = False) -> None:
+        if self.file is None:
+            return
+        self.file.write(dumps(record, ensure_ascii=False) + '\n')
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
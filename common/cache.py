@@ -0,0 +1,43 @@
+import os
+from json import loads, dumps, JSONDecodeError
+from logging import getLogger
+from typing import Dict
+
+logger = getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '../cache')
+
+
+def load_json_cache(name: str) -> Dict:
+    """
+    Load a json cache file from the cache folder
+
+    :param name: the cache file's name
+    :return: the cached dict, empty dict if the file doesn't exist or is broken
+    """
+    path = os.path.join(CACHE_DIR, name)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except (OSError, JSONDecodeError):
+        logger.warning('The cache file: %s is broken, ignore it', name)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_json_cache(name: str, data: Dict) -> None:
+    """
+    Save a dict into the cache folder. The file is replaced atomically, so a crash never leaves a broken cache
+
+    :param name: the cache file's name
+    :param data: the dict to save
+    :return: None
+    """
+    path = os.path.join(CACHE_DIR, name)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(dumps(data))
+    os.replace(tmp_path, path)
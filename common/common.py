@@ -1,4 +1,9 @@
 from datetime import datetime, timezone
+from typing import Optional, Tuple, Callable, Any
+from threading import Lock
+from json import JSONEncoder
+import os
+import sys
 
 MONTH = {
     'Jan': 1,
@@ -28,3 +33,145 @@ def parse_datetime(datetime_str: str) -> datetime:
     return datetime(int(datetime_list[2]), MONTH[datetime_list[0]],
                     int(datetime_list[1]), int(datetime_list[3]), tzinfo=timezone.utc)
 
+
+class Truncated(object):
+    """
+    Wrap a payload for logging, it's only serialized when the record is emitted and cut to ``limit`` chars.
+    Only the part within the limit is serialized, a streamed response is read up to the limit
+    """
+    limit: int = 4096
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def __read_response(self) -> Tuple[bytes, bool]:
+        """
+        :return: (the body, or its first ``limit`` bytes and one more, whether it's the whole body)
+        """
+        rp = self.payload
+        if rp._content_consumed:
+            return rp.content, True
+        body = b''
+        try:
+            for chunk in rp.iter_content(self.limit + 1):
+                body += chunk
+                if len(body) > self.limit:
+                    break
+        except Exception as e:
+            return ('<failed to read the response: %r>' % e).encode('utf-8'), True
+        return body, len(body) <= self.limit
+
+    def __str__(self) -> str:
+        payload = self.payload
+        complete = True
+        if hasattr(payload, 'iter_content'):  # requests.Response
+            payload, complete = self.__read_response()
+        if isinstance(payload, (bytes, bytearray)):
+            text = payload[:self.limit].decode('utf-8', errors='replace')
+            cut = len(payload) > self.limit
+            rest = len(payload) - self.limit if complete else None
+        elif isinstance(payload, str):
+            text = payload[:self.limit]
+            rest = len(payload) - self.limit
+            cut = rest > 0
+        else:
+            if isinstance(payload, (dict, list, tuple)):
+                chunks = JSONEncoder(ensure_ascii=False, default=str).iterencode(payload)
+            else:
+                chunks = [str(payload)]
+            text = ''
+            for chunk in chunks:
+                text += chunk
+                if len(text) > self.limit:
+                    break
+            cut = len(text) > self.limit
+            text = text[:self.limit]
+            rest = None
+        if not cut:
+            return text
+        return '%s... (%d more truncated)' % (text, rest) if rest is not None else '%s... (truncated)' % text
+
+
+def get_memory_usage() -> Tuple[Optional[int], Optional[int]]:
+    """
+    Get the current and the peak resident memory of this process
+
+    :return: (current bytes, peak bytes), None if the platform doesn't support it
+    """
+    current = None
+    peak = None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, IndexError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == 'darwin' else peak * 1024  # Linux reports in KB
+    except ImportError:  # Windows
+        pass
+    return current, peak
+
+
+def format_memory_usage() -> str:
+    """
+    Format the memory usage for logging
+
+    :return: 'current: x MB, peak: y MB'
+    """
+    current, peak = get_memory_usage()
+    return 'current: %s, peak: %s' % ('%.1f MB' % (current / 1048576) if current is not None else 'unknown',
+                                      '%.1f MB' % (peak / 1048576) if peak is not None else 'unknown')
+
+
+class LazyObject(object):
+    """
+    A proxy which creates the wrapped object on first use, so importing a module doesn't need any I/O
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        """
+        :param factory: the function to create the wrapped object
+        """
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_wrapped', None)
+        object.__setattr__(self, '_lock', Lock())
+
+    def get_object(self) -> Any:
+        """
+        Get the wrapped object, create it if it's not created yet
+
+        :return: the wrapped object
+        """
+        wrapped = object.__getattribute__(self, '_wrapped')
+        if wrapped is None:
+            with object.__getattribute__(self, '_lock'):
+                wrapped = object.__getattribute__(self, '_wrapped')
+                if wrapped is None:
+                    wrapped = object.__getattribute__(self, '_factory')()
+                    object.__setattr__(self, '_wrapped', wrapped)
+        return wrapped
+
+    def set_object(self, wrapped: Any) -> None:
+        """
+        Replace the wrapped object
+
+        :param wrapped: the new object
+        :return: None
+        """
+        object.__setattr__(self, '_wrapped', wrapped)
+
+    def is_resolved(self) -> bool:
+        """
+        Whether the wrapped object has been created
+
+        :return: Created = True
+        """
+        return object.__getattribute__(self, '_wrapped') is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get_object(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.get_object(), name, value)
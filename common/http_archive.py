@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import zlib
+from json import loads, dumps
+from logging import getLogger
+from threading import local, Lock
+from time import sleep
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from config import config
+from common import metrics
+from common.cache import CACHE_DIR
+
+logger = getLogger(__name__)
+
+RECORD = 'record'
+REPLAY = 'replay'
+# The headers never written into the archive, the body is stored decoded
+DROPPED_HEADERS = {'set-cookie', 'cookie', 'content-encoding', 'content-length', 'transfer-encoding'}
+
+_http_archive: Optional['HttpArchive'] = None
+_http_archive_lock = Lock()
+
+
+class HttpArchive(object):
+    def __init__(self, path: str, mode: str, ignored_params: Set[str] = frozenset(), latency_scale: float = 0.0):
+        """
+        Record the responses of a run into a SQLite file and serve them back offline.
+        A response is keyed by the method, the url and the sorted params, the same request sent again
+        gets the next recorded response, the last one is repeated after they're used up.
+        Only the status, the headers without the cookies, the zlib body and the latency are written
+
+        :param path: the archive file path
+        :param mode: ``RECORD`` clears the archive first, ``REPLAY`` reads it
+        :param ignored_params: the params left out of the key, e.g. the timestamps
+        :param latency_scale: sleep the recorded latency times this on replay, 0 to reply at once
+        """
+        self.path: str = path
+        self.mode: str = mode
+        self.ignored_params: Set[str] = set(ignored_params)
+        self.latency_scale: float = latency_scale
+        self.sequences: Dict[str, int] = {}  # The next sequence number of every key
+        self.lock = Lock()
+        self.__local = local()
+        connection = self.__get_connection()
+        if mode == RECORD:
+            connection.execute('DELETE FROM responses')
+
+    def __get_connection(self) -> sqlite3.Connection:
+        """
+        Get the connection of the current thread
+
+        :return: :class:`sqlite3.Connection`
+        """
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT NOT NULL, seq INTEGER NOT NULL, '
+                               'endpoint TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, '
+                               'body BLOB NOT NULL, latency REAL NOT NULL, PRIMARY KEY (key, seq))')
+            self.__local.connection = connection
+        return connection
+
+    def get_key(self, method: str, url: str, params: Any = None, data: Any = None) -> str:
+        """
+        :param method: 'GET' or 'POST'
+        :param url: the url, its query is merged with the params
+        :param params: the query params, a dict or a list of pairs
+        :param data: the form data, a dict or a list of pairs
+        :return: 'METHOD scheme://host/path?sorted params'
+        """
+        parts = urlsplit(url)
+        pairs = parse_qsl(parts.query, keep_blank_values=True)
+        for extra in (params, data):
+            if isinstance(extra, dict):
+                pairs.extend(extra.items())
+            elif isinstance(extra, (list, tuple)):
+                pairs.extend(extra)
+            elif extra is not None:
+                pairs.append(('body', extra))
+        pairs = sorted((str(key), str(value)) for key, value in pairs if key not in self.ignored_params)
+        return '%s %s://%s%s?%s' % (method.upper(), parts.scheme, parts.netloc, parts.path, urlencode(pairs))
+
+    def record(self, endpoint: str, key: str, rp: requests.Response) -> None:
+        """
+        Write a response, a streamed response is read to the end
+
+        :param endpoint: the endpoint's name
+        :param key: the key from ``get_key``
+        :param rp: the response
+        :return: None
+        """
+        body = rp.content
+        headers = {name: value for name, value in rp.headers.items() if name.lower() not in DROPPED_HEADERS}
+        with self.lock:
+            seq = self.sequences[key] = self.sequences.get(key, -1) + 1
+        self.__get_connection().execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                        (key, seq, endpoint, rp.status_code, dumps(headers), zlib.compress(body),
+                                         rp.elapsed.total_seconds()))
+        metrics.increase('http_archive.recorded')
+
+    def replay(self, key: str) -> requests.Response:
+        """
+        Serve the next recorded response of the key
+
+        :param key: the key from ``get_key``
+        :return: :class:`requests.Response` with the body loaded
+        :raises (RequestException) if the request is not in the archive
+        """
+        with self.lock:
+            seq = self.sequences[key] = self.sequences.get(key, -1) + 1
+        row = self.__get_connection().execute(
+            'SELECT status, headers, body, latency FROM responses WHERE key = ? AND seq <= ? ORDER BY seq DESC '
+            'LIMIT 1', (key, seq)).fetchone()
+        if row is None:
+            metrics.increase('http_archive.missed')
+            logger.warning('Request: %s is not in the archive', key)
+            raise requests.exceptions.RequestException('Not in the archive: %s' % key)
+        status, headers, body, latency = row
+        if self.latency_scale > 0:
+            sleep(latency * self.latency_scale)
+        rp = requests.Response()
+        rp.status_code = status
+        rp.headers = CaseInsensitiveDict(loads(headers))
+        rp.encoding = get_encoding_from_headers(rp.headers)
+        rp.url = key.split(' ', 1)[1]
+        rp._content = zlib.decompress(body)
+        rp._content_consumed = True  # iter_content serves the loaded body, so streamed reads work too
+        metrics.increase('http_archive.replayed')
+        return rp
+
+
+def get_http_archive() -> Optional[HttpArchive]:
+    """
+    Get the http archive set in the config
+
+    :return: :class:`HttpArchive`, None if it's disabled
+    """
+    global _http_archive
+    mode = config.http_archive['mode']
+    if mode is None:
+        return None
+    path = config.http_archive['path'] or os.path.join(CACHE_DIR, 'http_archive.sqlite3')
+    with _http_archive_lock:
+        if _http_archive is None or _http_archive.path != path or _http_archive.mode != mode:
+            _http_archive = HttpArchive(path, mode, config.http_archive['ignored_params'],
+                                        config.http_archive['latency_scale'])
+            logger.info('%s the http responses: %s', 'Record' if mode == RECORD else 'Replay', path)
+        _http_archive.latency_scale = config.http_archive['latency_scale']
+        return _http_archive
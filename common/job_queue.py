@@ -0,0 +1,194 @@
+import os
+import sqlite3
+from json import loads, dumps
+from logging import getLogger
+from threading import local
+from time import time
+from typing import Any, Dict, List, Optional
+
+logger = getLogger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue(object):
+    def __init__(self, path: str, lease: int = 120, max_attempts: int = 3):
+        """
+        A durable job queue in a SQLite file, shared by the coordinator and the workers.
+        A worker leases a job and must finish it before the lease expires, or the job is given to another worker
+
+        :param path: the database file path
+        :param lease: the seconds a worker holds a job
+        :param max_attempts: the attempts of a job before it fails
+        """
+        self.path: str = path
+        self.lease: int = lease
+        self.max_attempts: int = max_attempts
+        self.__local = local()
+        self.__get_connection()
+
+    def __get_connection(self) -> sqlite3.Connection:
+        """
+        Get the connection of the current thread
+
+        :return: :class:`sqlite3.Connection`
+        """
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, appid INTEGER NOT NULL, '
+                               'market_hash_name TEXT NOT NULL, currency INTEGER NOT NULL, state TEXT NOT NULL, '
+                               'attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL, result TEXT, '
+                               'error TEXT, collected INTEGER NOT NULL DEFAULT 0, '
+                               'UNIQUE (appid, market_hash_name, currency))')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until)')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.__local.connection = connection
+        return connection
+
+    def clear(self) -> None:
+        """
+        Remove all the jobs of the last run
+
+        :return: None
+        """
+        connection = self.__get_connection()
+        connection.execute('DELETE FROM jobs')
+        connection.execute('DELETE FROM meta')
+
+    def set_meta(self, key: str, value: Any) -> None:
+        """
+        Share a value with the workers, e.g. the price setting of the run
+
+        :return: None
+        """
+        self.__get_connection().execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, dumps(value)))
+
+    def get_meta(self, key: str) -> Any:
+        """
+        :return: the shared value, None if it's not set
+        """
+        row = self.__get_connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def push(self, jobs: List[Dict]) -> int:
+        """
+        Add the jobs, a job already in the queue is ignored
+
+        :param jobs: List[{'appid': int, 'market_hash_name': str, 'currency': int}]
+        :return: the number of the added jobs
+        """
+        connection = self.__get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            added = 0
+            for job in jobs:
+                added += connection.execute(
+                    'INSERT OR IGNORE INTO jobs (appid, market_hash_name, currency, state) VALUES (?, ?, ?, ?)',
+                    (job['appid'], job['market_hash_name'], job['currency'], PENDING)).rowcount
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return added
+
+    def lease_jobs(self, worker: str, count: int = 1, currency: Optional[int] = None) -> List[Dict]:
+        """
+        Lease the pending jobs and the jobs whose lease is expired
+
+        :param worker: the worker's id
+        :param count: the max number of jobs
+        :param currency: only lease the jobs in this currency, any currency if None
+        :return: List[{'id': int, 'appid': int, 'market_hash_name': str, 'currency': int, 'attempts': int}]
+        """
+        connection = self.__get_connection()
+        now = time()
+        # Take the write lock first, so two workers never lease the same job
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = connection.execute(
+                'SELECT id, appid, market_hash_name, currency, attempts FROM jobs '
+                'WHERE (state = ? OR (state = ? AND lease_until < ?)) AND (? IS NULL OR currency = ?) '
+                'ORDER BY id LIMIT ?', (PENDING, LEASED, now, currency, currency, count)).fetchall()
+            jobs = []
+            for job_id, appid, market_hash_name, currency, attempts in rows:
+                if attempts >= self.max_attempts:
+                    # The workers holding it died or hung every time
+                    connection.execute('UPDATE jobs SET state = ?, error = ? WHERE id = ?',
+                                       (FAILED, 'lease expired %d times' % attempts, job_id))
+                    continue
+                connection.execute('UPDATE jobs SET state = ?, attempts = ?, worker = ?, lease_until = ? WHERE id = ?',
+                                   (LEASED, attempts + 1, worker, now + self.lease, job_id))
+                jobs.append({'id': job_id, 'appid': appid, 'market_hash_name': market_hash_name,
+                             'currency': currency, 'attempts': attempts + 1})
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return jobs
+
+    def complete(self, job_id: int, worker: str, result: Dict) -> bool:
+        """
+        Save the result of a leased job
+
+        :return: Saved = True, False if the lease was lost to another worker
+        """
+        return self.__get_connection().execute(
+            'UPDATE jobs SET state = ?, result = ?, lease_until = NULL WHERE id = ? AND worker = ? AND state = ?',
+            (DONE, dumps(result), job_id, worker, LEASED)).rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str, retry: bool = True) -> None:
+        """
+        Give the leased job back, it fails after ``max_attempts`` attempts
+
+        :param retry: False to fail the job at once
+        :return: None
+        """
+        self.__get_connection().execute(
+            'UPDATE jobs SET state = CASE WHEN ? AND attempts < ? THEN ? ELSE ? END, error = ?, lease_until = NULL '
+            'WHERE id = ? AND worker = ? AND state = ?',
+            (retry, self.max_attempts, PENDING, FAILED, error, job_id, worker, LEASED))
+
+    def collect(self) -> List[Dict]:
+        """
+        Get the finished jobs which are not collected yet, every job is collected once
+
+        :return: List[{'appid': int, 'market_hash_name': str, 'currency': int, 'state': str,
+                       'result': Dict or None, 'error': str or None}]
+        """
+        connection = self.__get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = connection.execute(
+                'SELECT id, appid, market_hash_name, currency, state, result, error FROM jobs '
+                'WHERE state IN (?, ?) AND collected = 0', (DONE, FAILED)).fetchall()
+            connection.executemany('UPDATE jobs SET collected = 1 WHERE id = ?', [(row[0],) for row in rows])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return [{'appid': appid, 'market_hash_name': market_hash_name, 'currency': currency, 'state': state,
+                 'result': loads(result) if result is not None else None, 'error': error}
+                for _, appid, market_hash_name, currency, state, result, error in rows]
+
+    def count(self, state: Optional[str] = None, currency: Optional[int] = None) -> int:
+        """
+        :param state: count the jobs in this state, all the jobs if None
+        :param currency: count the jobs in this currency, any currency if None
+        :return: the number of the jobs
+        """
+        return self.__get_connection().execute(
+            'SELECT COUNT(*) FROM jobs WHERE (? IS NULL OR state = ?) AND (? IS NULL OR currency = ?)',
+            (state, state, currency, currency)).fetchone()[0]
+
+    def count_live_leases(self) -> int:
+        """
+        :return: the number of the jobs held by a worker whose lease is not expired
+        """
+        return self.__get_connection().execute('SELECT COUNT(*) FROM jobs WHERE state = ? AND lease_until >= ?',
+                                               (LEASED, time())).fetchone()[0]
@@ -0,0 +1,48 @@
+from threading import Lock
+from typing import Dict
+
+_lock = Lock()
+_counters: Dict[str, int] = {}
+
+
+def increase(name: str, value: int = 1) -> None:
+    """
+    Increase a counter
+
+    :param name: the counter's name
+    :param value: the value to add
+    :return: None
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get(name: str) -> int:
+    """
+    Get a counter's value
+
+    :param name: the counter's name
+    :return: the counter's value, 0 if never increased
+    """
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> Dict[str, int]:
+    """
+    Get a copy of all counters
+
+    :return: {name: value}
+    """
+    with _lock:
+        return dict(_counters)
+
+
+def reset() -> None:
+    """
+    Reset all counters
+
+    :return: None
+    """
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,146 @@
+from logging import getLogger
+from threading import Lock
+from time import monotonic, sleep
+from typing import Dict, List, Optional
+from config import config
+from common import metrics
+
+logger = getLogger(__name__)
+
+OK = 'ok'
+RATE_LIMITED = 'rate_limited'
+FAILED = 'failed'
+
+_proxy_pool: Optional['ProxyPool'] = None
+_proxy_pool_settings: Optional[tuple] = None  # The settings the pool was built with
+_proxy_pool_lock = Lock()
+
+
+class Proxy(object):
+    def __init__(self, url: str, rate: float, burst: int):
+        """
+        A proxy with its own token bucket and health state
+
+        :param url: the proxy url
+        :param rate: the requests per second refilled into the bucket
+        :param burst: the size of the bucket
+        """
+        self.url: str = url
+        self.proxies: Dict[str, str] = {'http': url, 'https': url}
+        self.rate: float = rate
+        self.burst: int = burst
+        self.tokens: float = burst
+        self.refilled: float = monotonic()
+        self.in_flight: int = 0
+        self.failures: int = 0
+        self.paused_until: float = 0.0  # Backing off after 429 or ejected after failures
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def get_wait(self, now: float) -> float:
+        """
+        :return: the seconds until the proxy can send a request
+        """
+        return max(self.paused_until - now, (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0, 0.0)
+
+
+class ProxyPool(object):
+    def __init__(self, urls: List[str], rate: float, burst: int, eject_threshold: int, eject_time: int,
+                 rate_limit_backoff: int):
+        """
+        Route the requests over several proxies, every proxy has its own rate limit
+
+        :param urls: the proxy urls
+        :param rate: the requests per second of every proxy
+        :param burst: the requests a proxy may send at once after idling
+        :param eject_threshold: the failures in a row to eject a proxy
+        :param eject_time: the seconds an ejected proxy rests before it's readmitted
+        :param rate_limit_backoff: the seconds a proxy rests after 429
+        """
+        self.proxies: List[Proxy] = [Proxy(url, rate, burst) for url in urls]
+        self.eject_threshold: int = eject_threshold
+        self.eject_time: int = eject_time
+        self.rate_limit_backoff: int = rate_limit_backoff
+        self.pinned: Dict[str, Proxy] = {}  # endpoint: the proxy it's pinned to
+        self.lock = Lock()
+
+    def acquire(self, endpoint: str) -> Proxy:
+        """
+        Take a token of the least loaded available proxy, block until one is available.
+        A pinned endpoint keeps using the same proxy as long as it's healthy, because steam binds the session
+        to the IP, every pinned endpoint has its own pin so they don't crowd into one proxy
+
+        :param endpoint: the endpoint's name
+        :return: :class:`Proxy`, must be released with ``release``
+        """
+        pinned = endpoint in config.proxy_pool['pinned_endpoints']
+        while True:
+            with self.lock:
+                now = monotonic()
+                for proxy in self.proxies:
+                    proxy.refill(now)
+                pinned_proxy = self.pinned.get(endpoint) if pinned else None
+                if pinned_proxy is not None and pinned_proxy.paused_until <= now:
+                    candidates = [pinned_proxy]
+                else:
+                    candidates = [proxy for proxy in self.proxies if proxy.paused_until <= now] or self.proxies
+                ready = [proxy for proxy in candidates if proxy.get_wait(now) == 0.0]
+                if ready:
+                    proxy = min(ready, key=lambda x: (x.in_flight, -x.tokens))
+                    proxy.tokens -= 1
+                    proxy.in_flight += 1
+                    if pinned and pinned_proxy is not proxy:
+                        logger.info('Pin endpoint: %s to proxy: %s', endpoint, proxy.url)
+                        self.pinned[endpoint] = proxy
+                    return proxy
+                wait = min(proxy.get_wait(now) for proxy in candidates)
+            metrics.increase('proxy_pool.waits')
+            sleep(wait)
+
+    def release(self, proxy: Proxy, outcome: str) -> None:
+        """
+        Return the proxy with the request's outcome
+
+        :param proxy: the proxy from ``acquire``
+        :param outcome: ``OK``, ``RATE_LIMITED`` or ``FAILED``
+        :return: None
+        """
+        with self.lock:
+            proxy.in_flight -= 1
+            if outcome == OK:
+                proxy.failures = 0
+            elif outcome == RATE_LIMITED:
+                proxy.paused_until = monotonic() + self.rate_limit_backoff
+                metrics.increase('proxy_pool.rate_limited')
+                logger.warning('Proxy: %s is rate limited, rest %d seconds', proxy.url, self.rate_limit_backoff)
+            else:
+                proxy.failures += 1
+                if proxy.failures >= self.eject_threshold:
+                    # Readmitted after the rest, one more failure ejects it again
+                    proxy.failures = self.eject_threshold - 1
+                    proxy.paused_until = monotonic() + self.eject_time
+                    metrics.increase('proxy_pool.ejected')
+                    logger.warning('Proxy: %s keeps failing, eject it for %d seconds', proxy.url, self.eject_time)
+
+
+def get_proxy_pool() -> Optional[ProxyPool]:
+    """
+    Get the proxy pool set in the config, it's rebuilt when the config of the pool is reloaded with other settings
+
+    :return: :class:`ProxyPool`, None if it's disabled
+    """
+    global _proxy_pool, _proxy_pool_settings
+    if not config.proxy_pool['enable']:
+        return None
+    settings = (tuple(config.proxy_pool['proxies']), config.proxy_pool['rate'], config.proxy_pool['burst'],
+                config.proxy_pool['eject_threshold'], config.proxy_pool['eject_time'],
+                config.proxy_pool['rate_limit_backoff'])
+    with _proxy_pool_lock:
+        if _proxy_pool is None or _proxy_pool_settings != settings:
+            if _proxy_pool is not None:
+                logger.info('The proxy pool settings changed, rebuild the pool')
+            _proxy_pool = ProxyPool(*settings)
+            _proxy_pool_settings = settings
+        return _proxy_pool
@@ -1,43 +1,272 @@
+import re
 import requests
-from time import sleep
+from time import sleep, monotonic
+from random import random
 from logging import getLogger
-from threading import Lock
+from threading import Condition, Lock, local
+from typing import Optional, Dict
+from urllib3.util.request import ACCEPT_ENCODING
 from config import config
+from common import metrics
+from common import proxy_pool
+from common.http_archive import get_http_archive, RECORD, REPLAY
 
 
 logger = getLogger(__name__)
 
+_thread_local = local()
+_breakers: Dict[str, 'CircuitBreaker'] = {}
+_breakers_lock = Lock()
 
-def requests_get(**kwargs) -> requests.Response:
-    return __requests_request(method='GET', **kwargs)
 
+def requests_get(endpoint: str = 'default', **kwargs) -> requests.Response:
+    return __requests_request(endpoint=endpoint, method='GET', **kwargs)
 
-def requests_post(**kwargs) -> requests.Response:
-    return __requests_request(method='POST', **kwargs)
 
+def requests_post(endpoint: str = 'default', **kwargs) -> requests.Response:
+    return __requests_request(endpoint=endpoint, method='POST', **kwargs)
 
-def __requests_request(**kwargs) -> requests.Response:
-    session = requests.Session()
-    _lock = Lock()
-    for _ in range(10):
+
+def get_session() -> requests.Session:
+    """
+    Get the session of the current thread, so the connections can be reused
+
+    :return: :class:`requests.Session`
+    """
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        # Every encoding urllib3 can decode, br is added when brotli is installed
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        _thread_local.session = session
+    return session
+
+
+def record_bandwidth(rp: requests.Response, decompressed_bytes: int) -> None:
+    """
+    Record the bytes of a response body on the wire and after decoding, per endpoint and in total
+
+    :param rp: the response returned by ``requests_get`` or ``requests_post``
+    :param decompressed_bytes: the decoded bytes read from the body
+    :return: None
+    """
+    endpoint = getattr(rp, 'endpoint', 'default')
+    tell = getattr(rp.raw, 'tell', None)
+    compressed_bytes = tell() if tell is not None else decompressed_bytes
+    metrics.increase('bandwidth.compressed', compressed_bytes)
+    metrics.increase('bandwidth.compressed.%s' % endpoint, compressed_bytes)
+    metrics.increase('bandwidth.decompressed.%s' % endpoint, decompressed_bytes)
+    logger.debug('Endpoint: %s, %d bytes on the wire, %d bytes decoded (%s)', endpoint, compressed_bytes,
+                 decompressed_bytes, rp.headers.get('Content-Encoding', 'identity'))
+
+
+def throttle_bandwidth(endpoint: str) -> None:
+    """
+    Slow down the low priority endpoints once the bandwidth budget of the run is used up
+
+    :param endpoint: the endpoint's name
+    :return: None
+    """
+    budget = config.bandwidth['budget']
+    if budget is None or endpoint not in config.bandwidth['low_priority']:
+        return
+    if metrics.get('bandwidth.compressed') >= budget:
+        metrics.increase('bandwidth.throttled.%s' % endpoint)
+        logger.debug('The bandwidth budget is used up, delay endpoint: %s', endpoint)
+        sleep(config.bandwidth['throttle_delay'])
+
+
+def search_in_stream(rp: requests.Response, pattern: re.Pattern, metric_name: str,
+                     chunk_size: int = 16384) -> Optional[re.Match]:
+    """
+    Read a streamed response chunk by chunk and stop as soon as the line with the pattern is complete.
+    Only the complete lines are searched, every line once, so a match never depends on where the chunks are cut,
+    and the unfinished line at the end of the body is searched too.
+    The response is closed before returning, so the rest of the body is never downloaded.
+
+    :param rp: the response requested with ``stream=True``
+    :param pattern: the compiled bytes pattern, a match must not go across lines
+    :param metric_name: the name of the byte-count metric
+    :param chunk_size: the size of every chunk
+    :return: the match, None if not found
+    :raises (RequestException)
+    """
+    line_parts = []  # The unfinished line
+    read_bytes = 0
+    try:
+        chunks = rp.iter_content(chunk_size=chunk_size)
+        for chunk in chunks:
+            read_bytes += len(chunk)
+            last_line = chunk.rfind(b'\n')
+            if last_line == -1:
+                line_parts.append(chunk)
+                continue
+            line_parts.append(chunk[:last_line + 1])
+            match = pattern.search(b''.join(line_parts))
+            if match is not None:
+                return match
+            line_parts = [chunk[last_line + 1:]]
+        return pattern.search(b''.join(line_parts))
+    finally:
+        rp.close()
+        metrics.increase(metric_name, read_bytes)
+        record_bandwidth(rp, read_bytes)
+        logger.debug('Read %d bytes for %s', read_bytes, metric_name)
+
+
+class CircuitBreaker(object):
+    # The seconds a probe may take before another request takes over, in case it never reports back
+    probe_timeout: float = 30.0
+
+    def __init__(self, endpoint: str):
+        """
+        Stop sending requests to a failing endpoint for a while, so every item doesn't rediscover the failure
+
+        :param endpoint: the endpoint's name
+        """
+        self.endpoint: str = endpoint
+        self.failures: int = 0
+        self.open_until: float = 0.0
+        self.half_open: bool = False  # Opened before, the next request is a probe
+        self.probe_started: Optional[float] = None  # The probe in flight
+        self.lock = Lock()
+        self.condition = Condition(self.lock)
+
+    def wait(self) -> None:
+        """
+        Block until the breaker is closed or half-open, this pauses the whole pipeline while the endpoint is failing.
+        When it's half-open only one request is let through as the probe, the others wait for its outcome
+
+        :return: None
+        """
+        paused = False
+        with self.condition:
+            while True:
+                now = monotonic()
+                delay = self.open_until - now
+                if delay > 0:
+                    if not paused:
+                        logger.warning('Endpoint: %s is failing, pause %.1f seconds', self.endpoint, delay)
+                        metrics.increase('circuit_breaker.paused.%s' % self.endpoint)
+                        paused = True
+                    self.condition.wait(delay)
+                    continue
+                if not self.half_open:
+                    return
+                if self.probe_started is None or now - self.probe_started >= self.probe_timeout:
+                    self.probe_started = now
+                    metrics.increase('circuit_breaker.probes.%s' % self.endpoint)
+                    return
+                self.condition.wait(self.probe_timeout - (now - self.probe_started))
+
+    def record_success(self) -> None:
+        with self.condition:
+            self.failures = 0
+            if self.half_open:
+                self.half_open = False
+                self.probe_started = None
+                self.condition.notify_all()
+
+    def record_failure(self) -> None:
+        with self.condition:
+            self.failures += 1
+            self.probe_started = None
+            if config.circuit_breaker['enable'] and self.failures >= config.circuit_breaker['failure_threshold']:
+                # Half-open after the cooldown: the next request is a probe, and one more failure opens it again
+                self.failures = config.circuit_breaker['failure_threshold'] - 1
+                self.open_until = monotonic() + config.circuit_breaker['cooldown']
+                self.half_open = True
+                metrics.increase('circuit_breaker.opened.%s' % self.endpoint)
+                logger.error('Endpoint: %s keeps failing, open the circuit breaker for %d seconds',
+                             self.endpoint, config.circuit_breaker['cooldown'])
+            self.condition.notify_all()
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """
+    Get the circuit breaker of an endpoint
+
+    :param endpoint: the endpoint's name
+    :return: :class:`CircuitBreaker`
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def get_retry_delay(policy: Dict, attempt: int, rate_limited: bool = False) -> float:
+    """
+    Exponential backoff with jitter
+
+    :param policy: the endpoint's retry policy
+    :param attempt: the attempt number, from 0
+    :param rate_limited: the request got 429
+    :return: seconds to sleep
+    """
+    delay = min(policy['backoff_max'], policy['backoff_base'] * 2 ** attempt) * (1 - policy['jitter'] * random())
+    if rate_limited:
+        # The jitter never shortens the wait after 429 below the floor
+        delay = max(delay, policy['rate_limit_backoff'])
+    return delay
+
+
+def __requests_request(endpoint: str = 'default', **kwargs) -> requests.Response:
+    """
+    Send a request with the endpoint's retry policy. 429, 5xx and network errors are retried,
+    any other response (e.g. 400 for expired cookie, 403 for private inventory) is returned to the caller at once
+
+    :param endpoint: the endpoint's name in ``config.retry_policy``
+    :raises (RequestException)
+    """
+    archive = get_http_archive()
+    key = archive.get_key(kwargs['method'], kwargs['url'], kwargs.get('params'), kwargs.get('data')) \
+        if archive is not None else None
+    if archive is not None and archive.mode == REPLAY:
+        rp = archive.replay(key)
+        rp.endpoint = endpoint
+        if not kwargs.get('stream', False):
+            record_bandwidth(rp, len(rp.content))
+        return rp
+    policy = config.retry_policy.get(endpoint, config.retry_policy['default'])
+    breaker = get_circuit_breaker(endpoint)
+    session = get_session()
+    pool = proxy_pool.get_proxy_pool()
+    for attempt in range(policy['max_attempts']):
+        breaker.wait()
+        throttle_bandwidth(endpoint)
+        proxy = pool.acquire(endpoint) if pool is not None else None
         try:
-            rp = session.request(timeout=10, proxies=config.proxy, **kwargs)
-            if rp.status_code != 429:  # 429发生后大概5分钟左右结束限制
-                if _lock.locked():
-                    _lock.release()
-                return rp
-            else:
-                if not _lock.locked():
-                    _lock.acquire()
-                logger.warning('Request failed! %d retry. Reason: Too Many Requests' % (_ + 1))
-                sleep(30)
+            metrics.increase('requests')
+            rp = session.request(timeout=10, proxies=proxy.proxies if proxy is not None else config.proxy, **kwargs)
         except requests.exceptions.RequestException as e:
-            if _lock.locked():
-                _lock.release()
-            logger.warning('Request failed! %d retry. Reason: %s' % (_ + 1, str(e)))
-            sleep(1)
-    if _lock.locked():
-        _lock.release()
-    logger.error("Request failed! Please check your network")
+            reason = str(e)
+            rate_limited = False
+            if proxy is not None:
+                pool.release(proxy, proxy_pool.FAILED)
+        else:
+            if proxy is not None:
+                pool.release(proxy, proxy_pool.RATE_LIMITED if rp.status_code == 429
+                             else proxy_pool.FAILED if rp.status_code >= 500 else proxy_pool.OK)
+            if rp.status_code != 429 and rp.status_code < 500:
+                breaker.record_success()
+                rp.endpoint = endpoint
+                if archive is not None and archive.mode == RECORD:
+                    archive.record(endpoint, key, rp)
+                if not kwargs.get('stream', False):
+                    record_bandwidth(rp, len(rp.content))
+                return rp
+            rp.close()
+            reason = 'Too Many Requests' if rp.status_code == 429 else 'Status code: %d' % rp.status_code
+            rate_limited = rp.status_code == 429  # 429发生后大概5分钟左右结束限制
+        breaker.record_failure()
+        metrics.increase('retries.%s' % endpoint)
+        if attempt + 1 < policy['max_attempts']:
+            # With a proxy pool only the limited proxy rests, the retry goes to another one
+            delay = 0.0 if rate_limited and pool is not None else get_retry_delay(policy, attempt, rate_limited)
+            logger.warning('Request %s failed! %d retry in %.1f seconds. Reason: %s',
+                           endpoint, attempt + 1, delay, reason)
+            sleep(delay)
+    logger.error("Request %s failed! Please check your network", endpoint)
     raise requests.exceptions.RequestException
-
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+from json import loads, dumps
+from datetime import datetime
+from logging import getLogger
+from threading import local, Lock, get_ident
+from time import time, sleep
+from typing import Any, Callable, Optional
+from config import config
+from common import metrics
+from common.cache import CACHE_DIR
+
+logger = getLogger(__name__)
+
+_shared_cache: Optional['SharedCache'] = None
+_shared_cache_lock = Lock()
+
+
+class SharedCache(object):
+    def __init__(self, path: str, lease: float = 60.0, poll_interval: float = 0.2):
+        """
+        The market data cache shared by the processes on the same host, stored in a SQLite database in WAL mode.
+        The values are json, an entry expires after its ttl
+
+        :param path: the database file path
+        :param lease: the max seconds a process may take to fill a key, then the others take over
+        :param poll_interval: the seconds between two checks while another process is filling the key
+        """
+        self.path: str = path
+        self.lease: float = lease
+        self.poll_interval: float = poll_interval
+        self.__local = local()
+        connection = self.__get_connection()
+        connection.execute('DELETE FROM market_data WHERE expires < ?', (time(),))
+
+    def __get_connection(self) -> sqlite3.Connection:
+        """
+        Get the connection of the current thread, a connection can't be shared between threads
+
+        :return: :class:`sqlite3.Connection`
+        """
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Autocommit, every statement is atomic
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS market_data (kind TEXT NOT NULL, appid INTEGER NOT NULL, '
+                               'market_hash_name TEXT NOT NULL, currency INTEGER NOT NULL, value TEXT NOT NULL, '
+                               'expires REAL, PRIMARY KEY (kind, appid, market_hash_name, currency))')
+            connection.execute('CREATE INDEX IF NOT EXISTS market_data_item '
+                               'ON market_data (appid, market_hash_name, currency)')
+            connection.execute('CREATE TABLE IF NOT EXISTS fill_locks (kind TEXT NOT NULL, appid INTEGER NOT NULL, '
+                               'market_hash_name TEXT NOT NULL, currency INTEGER NOT NULL, owner TEXT NOT NULL, '
+                               'until REAL NOT NULL, PRIMARY KEY (kind, appid, market_hash_name, currency))')
+            self.__local.connection = connection
+        return connection
+
+    def get(self, kind: str, appid: int, market_hash_name: str, currency: int = 0) -> Any:
+        """
+        :param kind: the kind of the data, e.g. 'nameid', 'history', 'graph'
+        :param appid: the game's appid
+        :param market_hash_name: The item market hash name
+        :param currency: the currency of the data, 0 if the data doesn't depend on it
+        :return: the cached value, None if it's missing or expired
+        """
+        row = self.__get_connection().execute(
+            'SELECT value FROM market_data WHERE kind = ? AND appid = ? AND market_hash_name = ? AND currency = ? '
+            'AND (expires IS NULL OR expires >= ?)', (kind, appid, market_hash_name, currency, time())).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def set(self, kind: str, appid: int, market_hash_name: str, currency: int, value: Any,
+            ttl: Optional[int]) -> None:
+        """
+        :param ttl: the seconds the value is valid, None for ever
+        :return: None
+        """
+        self.__get_connection().execute(
+            'INSERT OR REPLACE INTO market_data VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, appid, market_hash_name, currency, dumps(value, default=self.__encode),
+             time() + ttl if ttl is not None else None))
+
+    def get_or_fill(self, kind: str, appid: int, market_hash_name: str, currency: int, ttl: Optional[int],
+                    fill: Callable[[], Any]) -> Any:
+        """
+        Get the cached value, or fill it with ``fill`` if it's missing.
+        Only one process fills a key at a time, the others wait for its value.
+        If the filling process fails or dies, one of the waiting processes fills it instead
+
+        :param fill: the function to fetch the value, its exceptions are raised to the caller
+        :return: the value
+        """
+        key = (kind, appid, market_hash_name, currency)
+        waited = False
+        while True:
+            value = self.get(*key)
+            if value is not None:
+                metrics.increase('shared_cache.wait_hit' if waited else 'shared_cache.hit')
+                return value
+            if self.__acquire(key):
+                break
+            if not waited:
+                logger.debug('Wait for another process to fill %s', key)
+                waited = True
+            sleep(self.poll_interval)
+
+        try:
+            # Filled by another process between the check and the lock
+            value = self.get(*key)
+            if value is None:
+                metrics.increase('shared_cache.miss')
+                value = fill()
+                self.set(kind, appid, market_hash_name, currency, value, ttl)
+            return value
+        finally:
+            self.__release(key)
+
+    def __acquire(self, key: tuple) -> bool:
+        """
+        Take the fill lock of the key, an expired lock is taken over
+
+        :return: Acquired = True
+        """
+        now = time()
+        cursor = self.__get_connection().execute(
+            'INSERT INTO fill_locks VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (kind, appid, market_hash_name, currency) '
+            'DO UPDATE SET owner = excluded.owner, until = excluded.until WHERE fill_locks.until < ?',
+            key + (self.__owner(), now + self.lease, now))
+        return cursor.rowcount == 1
+
+    def __release(self, key: tuple) -> None:
+        self.__get_connection().execute(
+            'DELETE FROM fill_locks WHERE kind = ? AND appid = ? AND market_hash_name = ? AND currency = ? '
+            'AND owner = ?', key + (self.__owner(),))
+
+    @staticmethod
+    def __owner() -> str:
+        return '%d-%d' % (os.getpid(), get_ident())
+
+    @staticmethod
+    def __encode(value: Any) -> Any:
+        if isinstance(value, datetime):
+            return value.timestamp()
+        raise TypeError('%s is not JSON serializable' % type(value).__name__)
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """
+    Get the shared cache set in the config
+
+    :return: :class:`SharedCache`, None if it's disabled
+    """
+    global _shared_cache
+    if not config.shared_cache['enable']:
+        return None
+    path = config.shared_cache['path'] or os.path.join(CACHE_DIR, 'market.sqlite3')
+    with _shared_cache_lock:
+        if _shared_cache is None or _shared_cache.path != path:
+            _shared_cache = SharedCache(path)
+        return _shared_cache
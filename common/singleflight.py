@@ -0,0 +1,84 @@
+from functools import wraps
+from logging import getLogger
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable
+from common import metrics
+
+logger = getLogger(__name__)
+
+
+class Call(object):
+    def __init__(self):
+        """
+        A call in flight, the callers of the same key wait for it
+        """
+        self.done = Event()
+        self.result: Any = None
+        self.exception: BaseException = None
+
+
+class SingleFlight(object):
+    def __init__(self, name: str):
+        """
+        Coalesce the concurrent calls with the same key into one call, all the callers get its result or exception
+
+        :param name: the name in the ``coalesced.<name>`` metric
+        """
+        self.name: str = name
+        self.calls: Dict[Hashable, Call] = {}
+        self.lock = Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Call the function, or wait for the call in flight with the same key
+
+        :param key: the key of the call
+        :param function: the function to call
+        :return: the result of the function
+        :raises the exception of the function
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+        if not leader:
+            metrics.increase('coalesced.%s' % self.name)
+            # The key is never logged, it may hold the cookie
+            logger.debug('Wait for the %s call in flight', self.name)
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            # The later calls start a new flight, so a result is never reused after the call
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+def coalesce(name: str, key: Callable[..., Hashable] = None) -> Callable:
+    """
+    Decorate a function, so its concurrent calls with the same arguments share one call
+
+    :param name: the name in the ``coalesced.<name>`` metric
+    :param key: get the key from the arguments of a call, all the arguments are the key if None
+    :return: the decorator
+    """
+    group = SingleFlight(name)
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            call_key = key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+            return group.do(call_key, lambda: function(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -1,42 +1,130 @@
 from config import config
 from steam.api import get_wallet_fee_info
+from common.common import LazyObject, Truncated
+from common.cache import load_json_cache, save_json_cache
+from wallet import Wallet
+from time import time
+from queue import Queue
+from json import dumps
+import atexit
 import logging
 from logging import handlers
 import os
 import sys
 
-time_handler_info = handlers.TimedRotatingFileHandler(filename=os.path.join(os.path.dirname(__file__),
-                                                                            '../logs/info.log'),
-                                                      when='D', backupCount=10)
-time_handler_info.setLevel(logging.INFO)
-log_format = '%(asctime)s - %(levelname)s Thread: %(threadName)s Message: %(message)s'
-time_handler_info.setFormatter(logging.Formatter(log_format))
+WALLET_CACHE = 'wallet.json'
 
+logger = logging.getLogger(__name__)
 
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)
-log_format = '%(asctime)s - %(levelname)s Thread: %(threadName)s Message: %(message)s'
-stream_handler.setFormatter(logging.Formatter(log_format))
 
-logging.basicConfig(level=logging.NOTSET, handlers=(stream_handler, time_handler_info))
+class JsonFormatter(logging.Formatter):
+    """Format the log record as a json line"""
 
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'func': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return dumps(data, ensure_ascii=False, default=str)
 
-if config.debug:
-    time_handler_debug = handlers.TimedRotatingFileHandler(filename=os.path.join(os.path.dirname(__file__),
-                                                                                 '../logs/debug.log'),
-                                                           when='D', backupCount=10)
-    time_handler_debug.setLevel(logging.DEBUG)
-    log_format = '%(asctime)s - %(levelname)s Thread: %(threadName)s Func: %(funcName)s-%(lineno)d: %(message)s'
-    time_handler_debug.setFormatter(logging.Formatter(log_format))
 
-    logging.root.addHandler(time_handler_debug)
+class LazyQueueHandler(handlers.QueueHandler):
+    """
+    Put the record into the queue as it is, the message is formatted by the listener's thread.
+    The queue never leaves this process, so the arguments don't need to be pickled
+    """
 
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
 
-logger = logging.getLogger(__name__)
 
-logger.info('Success to load config file')
+def setup_logging() -> handlers.QueueListener:
+    """
+    Set up the log handlers, this loads the config.
+    The handlers run on a background thread behind a queue, so writing the logs never blocks the workers
+
+    :return: the started :class:`QueueListener`
+    """
+    time_handler_info = handlers.TimedRotatingFileHandler(filename=os.path.join(os.path.dirname(__file__),
+                                                                                '../logs/info.log'),
+                                                          when='D', backupCount=10)
+    time_handler_info.setLevel(logging.INFO)
+    log_format = '%(asctime)s - %(levelname)s Thread: %(threadName)s Message: %(message)s'
+    time_handler_info.setFormatter(logging.Formatter(log_format))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.INFO)
+    log_format = '%(asctime)s - %(levelname)s Thread: %(threadName)s Message: %(message)s'
+    stream_handler.setFormatter(logging.Formatter(log_format))
+
+    log_handlers = [stream_handler, time_handler_info]
+
+    if config.debug:
+        time_handler_debug = handlers.TimedRotatingFileHandler(filename=os.path.join(os.path.dirname(__file__),
+                                                                                     '../logs/debug.log'),
+                                                               when='D', backupCount=10)
+        time_handler_debug.setLevel(logging.DEBUG)
+        log_format = '%(asctime)s - %(levelname)s Thread: %(threadName)s Func: %(funcName)s-%(lineno)d: %(message)s'
+        time_handler_debug.setFormatter(logging.Formatter(log_format))
+        log_handlers.append(time_handler_debug)
+
+    if config.json_log:
+        time_handler_json = handlers.TimedRotatingFileHandler(filename=os.path.join(os.path.dirname(__file__),
+                                                                                    '../logs/log.jsonl'),
+                                                              when='D', backupCount=10)
+        time_handler_json.setLevel(logging.DEBUG if config.debug else logging.INFO)
+        time_handler_json.setFormatter(JsonFormatter())
+        log_handlers.append(time_handler_json)
+
+    Truncated.limit = config.log_payload_limit
+
+    # The records under every handler's level are dropped before they are queued
+    queue_handler = LazyQueueHandler(Queue())
+    queue_handler.setLevel(min(handler.level for handler in log_handlers))
+    listener = handlers.QueueListener(queue_handler.queue, *log_handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logging.basicConfig(level=logging.NOTSET, handlers=(queue_handler,))
+
+    logger.info('Success to load config file')
+    return listener
+
+
+def load_wallet() -> Wallet:
+    """
+    Get the wallet info from the cache, or from steam if the cache is missing or expired
+
+    :return: :class:`Wallet`
+    :raises (LoginCookieExpiredException, RequestException, UnknownSteamErrorException)
+    """
+    cache = load_json_cache(WALLET_CACHE).get(config.steam_id)
+    if cache and config.wallet_cache_ttl > 0 and time() - cache.get('time', 0) < config.wallet_cache_ttl:
+        try:
+            wallet = Wallet(**cache['wallet'])
+        except (KeyError, TypeError):
+            logger.warning('The cached wallet info is broken, get it from steam')
+        else:
+            logger.info('Success to get wallet info from cache')
+            logger.debug("Wallet info: %s", str(wallet.__dict__))
+            return wallet
+
+    wallet = get_wallet_fee_info(config.steam_login_secure, config.steam_id)
+    if config.wallet_cache_ttl > 0:
+        data = load_json_cache(WALLET_CACHE)
+        data[config.steam_id] = {'time': time(), 'wallet': wallet.__dict__}
+        save_json_cache(WALLET_CACHE, data)
+
+    logger.info("Success to get wallet info")
+    logger.debug("Wallet info: %s", str(wallet.__dict__))
+    return wallet
 
-wallet = get_wallet_fee_info(config.steam_login_secure, config.steam_id)
 
-logger.info("Success to get wallet info")
-logger.debug("Wallet info: %s" % str(wallet.__dict__))
+wallet = LazyObject(load_wallet)
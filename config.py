@@ -1,14 +1,29 @@
 import re
+import logging
 from typing import Dict, Union
 from json import loads
-from os.path import dirname
+from os.path import dirname, getmtime
+from time import monotonic
+from common.common import LazyObject
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = dirname(__file__) + '/config.json'
+
+_last_check: float = 0.0
 
 
 class Config(object):
     debug: bool = False  # Enable debug log
     proxy: Dict = {}  # Set proxy
     mobile_confirmation: bool = False  # Need mobile confirmation after list on market
+    low_memory: bool = False  # Release the raw market data once the item's price is calculated
+    wallet_cache_ttl: int = 86400  # Seconds to reuse the cached wallet info, 0 to disable
+    json_log: bool = False  # Also write the logs as json lines into logs/log.jsonl
+    log_payload_limit: int = 4096  # The max chars of a payload in the debug log
+    checkpoint: bool = True  # Record the progress into cache/checkpoint.jsonl, run main.py --resume to continue
     language: str = 'english'  # !important the language user preferred
+    mtime: float = None  # The modification time of config.json when it's loaded, None if not loaded from the file
     steam_login_secure: str = None  # The steam website cookie
     steam_id: str = None  # Steam id
     app_id: int = 753  # The game which want to sell
@@ -29,6 +44,87 @@ class Config(object):
         'enable': False,
         'item_detail_type': set()  # Type: str
     }
+    scheduler = {
+        'enable': False,  # List the items in descending expected value instead of inventory order
+        'time_budget': None,  # Type: int; Stop pricing after time_budget seconds
+        'request_budget': None  # Type: int; Stop pricing after request_budget requests
+    }
+    market_prefetch = {
+        'enable': False,  # Bulk load the market summaries before pricing to reject the items early
+        'price_tolerance': 0.5,  # Type: float; How far the lowest listing price may be out of the price bounds
+        'max_pages': 10  # Type: int; The max search pages of a game or an app
+    }
+    my_listings = {
+        'enable': False,  # Load the account's market listings and skip the assets already on the market
+        'max_per_item': None  # Type: int; Don't list an item which already has max_per_item listings
+    }
+    shared_cache = {
+        'enable': False,  # Share the market data with the other processes on the host through a SQLite file
+        'path': None,  # Type: str; The database file, cache/market.sqlite3 if None. Use the same file in every process
+        'nameid_ttl': None,  # Type: int; Seconds to keep an item_nameid, None for ever
+        'history_ttl': 3600,  # Type: int; Seconds to keep a price history
+        'graph_ttl': 300  # Type: int; Seconds to keep a price graph
+    }
+    bandwidth = {
+        'budget': None,  # Type: int; The bytes on the wire a run may use before the low priority endpoints slow down
+        'low_priority': {'search', 'mylistings'},  # The endpoints slowed down when the budget is used up
+        'throttle_delay': 5  # Type: int; Seconds to wait before every request of a low priority endpoint
+    }
+    proxy_pool = {
+        'enable': False,  # Route the requests over several proxies instead of the single proxy
+        'proxies': [],  # The proxy urls
+        'rate': 0.5,  # Type: float; The requests per second of every proxy
+        'burst': 3,  # Type: int; The requests a proxy may send at once after idling
+        'eject_threshold': 3,  # Type: int; The failures in a row to eject a proxy
+        'eject_time': 300,  # Type: int; Seconds an ejected proxy rests before it's readmitted
+        'rate_limit_backoff': 300,  # Type: int; Seconds a proxy rests after steam returns 429
+        'pinned_endpoints': {'sellitem', 'mobileconf'}  # The endpoints always sent from the same proxy
+    }
+    distributed = {  # python distributed.py coordinator|worker
+        'queue_file': None,  # Type: str; The job queue file shared by all the nodes, cache/jobs.sqlite3 if None
+        'lease': 120,  # Type: int; Seconds a worker holds a job before it's given to another worker
+        'max_attempts': 3,  # Type: int; The attempts of a job before it fails
+        'poll_interval': 2,  # Type: int; Seconds between two checks of the queue
+        'timeout': None,  # Type: int; Seconds the coordinator waits for all the jobs, no limit if None
+        'worker_timeout': 300  # Type: int; Seconds the coordinator waits without any worker working before it stops
+    }
+    process_pool = {  # Used by distributed.py worker
+        'enable': False,  # Parse the market data and calculate the prices in other processes
+        'processes': None,  # Type: int; The pricing processes, the number of cores if None
+        'io_threads': 8  # Type: int; The threads fetching the market data, a worker leases at least this many jobs
+    }
+    http_archive = {  # Capture a run and replay it offline on the same workload
+        'mode': None,  # Type: str; 'record' writes the responses, 'replay' serves them without network, None to disable
+        'path': None,  # Type: str; The archive file, cache/http_archive.sqlite3 if None
+        'latency_scale': 0.0,  # Type: float; Sleep the recorded latency times this on replay, 0 to reply at once
+        'ignored_params': {'t', 'k'}  # The params which change every time and are left out of the key
+    }
+    mobile_confirmation_setting = {  # Accept the listings in bulk at the end of a run if mobile_confirmation is true
+        'identity_secret': None,  # Type: str; The identity_secret of the account's steam guard, base64
+        'device_id': None,  # Type: str; The steam guard device id, derived from steam_id if None
+        'batch_size': 50,  # Type: int; The confirmations accepted in one request
+        'url': 'https://steamcommunity.com/mobileconf'  # The confirmation endpoint, change it to a local stand-in
+    }
+    retry_policy = {  # The retry policy of every endpoint, the endpoint not set uses the default one
+        'default': {
+            'max_attempts': 10,  # Type: int; The max attempts of a request
+            'backoff_base': 1,  # Type: float; The seconds to wait after the first failure, doubled every retry
+            'backoff_max': 60,  # Type: float; The max seconds to wait between retries
+            'jitter': 0.5,  # Type: float; Randomly shorten the wait by up to this ratio
+            'rate_limit_backoff': 30  # Type: float; The min seconds to wait after 429
+        }
+    }
+    circuit_breaker = {
+        'enable': True,  # Pause all requests to an endpoint which keeps failing
+        'failure_threshold': 5,  # Type: int; Open the breaker after failure_threshold failures in a row
+        'cooldown': 60  # Type: int; The seconds to pause
+    }
+    dry_run = {
+        'enable': False,  # Only evaluate the prices, never list the items on market
+        'offline': False,  # Never fetch the market data which is not in the snapshot
+        'snapshot_file': None,  # Type: str; The market data snapshot to read and write
+        'report_file': None  # Type: str; The csv report of the would-be prices and rejection reasons
+    }
     price_setting = {
         'lowest_price': None,  # Type: float; The item selling price must above the lowest_price
         'highest_price': None,  # Type: float; The item selling price must lower than the highest_price
@@ -61,6 +157,11 @@ class Config(object):
         'debug': (bool,),
         'proxy': (str,),
         'mobile_confirmation': (bool,),
+        'low_memory': (bool,),
+        'wallet_cache_ttl': (int,),
+        'json_log': (bool,),
+        'log_payload_limit': (int,),
+        'checkpoint': (bool,),
         'language': (str,),
         'steam_login_secure': (str,),
         'steam_id': (str,),
@@ -90,6 +191,95 @@ class Config(object):
             'item_detail_type': (set,),
             'item_detail_type_value': str,
         },
+        'scheduler': (dict,),
+        'scheduler_value': {
+            'enable': (bool,),
+            'time_budget': (int, type(None)),
+            'request_budget': (int, type(None))
+        },
+        'market_prefetch': (dict,),
+        'market_prefetch_value': {
+            'enable': (bool,),
+            'price_tolerance': (float, int),
+            'max_pages': (int,)
+        },
+        'my_listings': (dict,),
+        'my_listings_value': {
+            'enable': (bool,),
+            'max_per_item': (int, type(None))
+        },
+        'shared_cache': (dict,),
+        'shared_cache_value': {
+            'enable': (bool,),
+            'path': (str, type(None)),
+            'nameid_ttl': (int, type(None)),
+            'history_ttl': (int, type(None)),
+            'graph_ttl': (int, type(None))
+        },
+        'bandwidth': (dict,),
+        'bandwidth_value': {
+            'budget': (int, type(None)),
+            'low_priority': (set,),
+            'low_priority_value': str,
+            'throttle_delay': (int, float)
+        },
+        'proxy_pool': (dict,),
+        'proxy_pool_value': {
+            'enable': (bool,),
+            'proxies': (list,),
+            'rate': (float, int),
+            'burst': (int,),
+            'eject_threshold': (int,),
+            'eject_time': (int,),
+            'rate_limit_backoff': (int,),
+            'pinned_endpoints': (set,),
+            'pinned_endpoints_value': str
+        },
+        'distributed': (dict,),
+        'distributed_value': {
+            'queue_file': (str, type(None)),
+            'lease': (int,),
+            'max_attempts': (int,),
+            'poll_interval': (int, float),
+            'timeout': (int, type(None)),
+            'worker_timeout': (int,)
+        },
+        'process_pool': (dict,),
+        'process_pool_value': {
+            'enable': (bool,),
+            'processes': (int, type(None)),
+            'io_threads': (int,)
+        },
+        'http_archive': (dict,),
+        'http_archive_value': {
+            'mode': (str, type(None)),
+            'path': (str, type(None)),
+            'latency_scale': (float, int),
+            'ignored_params': (set,),
+            'ignored_params_value': str
+        },
+        'mobile_confirmation_setting': (dict,),
+        'mobile_confirmation_setting_value': {
+            'identity_secret': (str, type(None)),
+            'device_id': (str, type(None)),
+            'batch_size': (int,),
+            'url': (str,)
+        },
+        'retry_policy': (dict,),
+        'retry_policy_value': {},  # Checked in __set_config, the endpoints are not fixed
+        'circuit_breaker': (dict,),
+        'circuit_breaker_value': {
+            'enable': (bool,),
+            'failure_threshold': (int,),
+            'cooldown': (int,)
+        },
+        'dry_run': (dict,),
+        'dry_run_value': {
+            'enable': (bool,),
+            'offline': (bool,),
+            'snapshot_file': (str, type(None)),
+            'report_file': (str, type(None))
+        },
         'price_setting': (dict,),
         'price_setting_value': {
             'lowest_price': (float, int, type(None)),
@@ -117,8 +307,14 @@ class Config(object):
         }
     }
 
-    def __init__(self):
-        data = self.__load_config()
+    def __init__(self, data: Dict = None):
+        """
+        :param data: the raw config dict, load from config.json if None
+        :raises (ConfigFileErrorException, KeyNotConfigException, FileNotFoundError, JSONDecodeError)
+        """
+        if data is None:
+            self.mtime = getmtime(CONFIG_PATH)
+            data = self.__load_config()
         self.__check_config_type(data)
         self.__set_config(data)
         self.__check_must_config()
@@ -181,7 +377,7 @@ class Config(object):
 
         proxy: str = config_data.get('proxy', '')
         if proxy != '':
-            if not re.match(r'http|socks5|https://.*', proxy):
+            if not re.match(r'(http|https|socks5)://.+', proxy):
                 raise ConfigFileErrorException('Key: proxy is in a wrong format')
             else:
                 self.proxy = {
@@ -193,6 +389,20 @@ class Config(object):
 
         self.mobile_confirmation: bool = config_data.get('mobile_confirmation', False)
 
+        self.low_memory: bool = config_data.get('low_memory', False)
+
+        self.wallet_cache_ttl: int = config_data.get('wallet_cache_ttl', 86400)
+        if self.wallet_cache_ttl < 0:
+            raise ConfigFileErrorException("Key: wallet_cache_ttl isn't correct")
+
+        self.json_log: bool = config_data.get('json_log', False)
+
+        self.log_payload_limit: int = config_data.get('log_payload_limit', 4096)
+        if self.log_payload_limit < 0:
+            raise ConfigFileErrorException("Key: log_payload_limit isn't correct")
+
+        self.checkpoint: bool = config_data.get('checkpoint', True)
+
         self.language: str = config_data.get('language', 'english')
 
         self.steam_login_secure: str = config_data.get('steam_login_secure', '').replace('%7C', '|').replace('%7c', '|')
@@ -229,6 +439,12 @@ class Config(object):
         self.disallow_to_sell_item_detail['item_detail_type'] = set(config_data.get('disallow_to_sell_item_detail')
                                                                     .get('item_detail_type', set()))
 
+        self.dry_run = config_data.setdefault('dry_run', {})
+        self.dry_run['enable'] = config_data.get('dry_run').get('enable', False)
+        self.dry_run['offline'] = config_data.get('dry_run').get('offline', False)
+        self.dry_run['snapshot_file'] = config_data.get('dry_run').get('snapshot_file', None) or None
+        self.dry_run['report_file'] = config_data.get('dry_run').get('report_file', None) or None
+
         self.price_setting = config_data.setdefault('price_setting', {'lowest_price': None,
                                                                       'highest_price': None,
                                                                       'calculation_formula': None,
@@ -330,6 +546,130 @@ class Config(object):
                                                                           .get('highest_price', None),
                                                                           'price_setting.other_item.highest_price')
 
+        self.scheduler = config_data.setdefault('scheduler', {})
+        self.scheduler['enable'] = config_data.get('scheduler').get('enable', False)
+        self.scheduler['time_budget'] = config_data.get('scheduler').get('time_budget', None)
+        if self.scheduler['time_budget'] is not None:
+            __check_int(self.scheduler['time_budget'], 'scheduler.time_budget')
+        self.scheduler['request_budget'] = config_data.get('scheduler').get('request_budget', None)
+        if self.scheduler['request_budget'] is not None:
+            __check_int(self.scheduler['request_budget'], 'scheduler.request_budget')
+
+        self.market_prefetch = config_data.setdefault('market_prefetch', {})
+        self.market_prefetch['enable'] = config_data.get('market_prefetch').get('enable', False)
+        self.market_prefetch['price_tolerance'] = __price_check(config_data.get('market_prefetch')
+                                                                .get('price_tolerance', 0.5),
+                                                                'market_prefetch.price_tolerance')
+        self.market_prefetch['max_pages'] = config_data.get('market_prefetch').get('max_pages', 10)
+        if self.market_prefetch['max_pages'] < 1:
+            raise ConfigFileErrorException("Key: market_prefetch.max_pages isn't correct")
+
+        self.my_listings = config_data.setdefault('my_listings', {})
+        self.my_listings['enable'] = config_data.get('my_listings').get('enable', False)
+        self.my_listings['max_per_item'] = config_data.get('my_listings').get('max_per_item', None)
+        if self.my_listings['max_per_item'] is not None:
+            __check_int(self.my_listings['max_per_item'], 'my_listings.max_per_item')
+
+        self.shared_cache = config_data.setdefault('shared_cache', {})
+        self.shared_cache['enable'] = config_data.get('shared_cache').get('enable', False)
+        self.shared_cache['path'] = config_data.get('shared_cache').get('path', None)
+        for key, default in (('nameid_ttl', None), ('history_ttl', 3600), ('graph_ttl', 300)):
+            self.shared_cache[key] = config_data.get('shared_cache').get(key, default)
+            if self.shared_cache[key] is not None:
+                __check_int(self.shared_cache[key], 'shared_cache.%s' % key)
+
+        self.bandwidth = config_data.setdefault('bandwidth', {})
+        self.bandwidth['budget'] = config_data.get('bandwidth').get('budget', None)
+        if self.bandwidth['budget'] is not None:
+            __check_int(self.bandwidth['budget'], 'bandwidth.budget')
+        self.bandwidth['low_priority'] = set(config_data.get('bandwidth').get('low_priority', {'search', 'mylistings'}))
+        self.bandwidth['throttle_delay'] = config_data.get('bandwidth').get('throttle_delay', 5)
+        __check_int(self.bandwidth['throttle_delay'], 'bandwidth.throttle_delay')
+
+        self.proxy_pool = config_data.setdefault('proxy_pool', {})
+        self.proxy_pool['enable'] = config_data.get('proxy_pool').get('enable', False)
+        self.proxy_pool['proxies'] = list(config_data.get('proxy_pool').get('proxies', []))
+        for proxy_url in self.proxy_pool['proxies']:
+            if not isinstance(proxy_url, str) or not re.match(r'(http|https|socks5)://.+', proxy_url):
+                raise ConfigFileErrorException('Key: proxy_pool.proxies is in a wrong format')
+        if self.proxy_pool['enable'] and not self.proxy_pool['proxies']:
+            raise ConfigFileErrorException('Key: proxy_pool.proxies is empty')
+        self.proxy_pool['rate'] = config_data.get('proxy_pool').get('rate', 0.5)
+        if self.proxy_pool['rate'] <= 0:
+            raise ConfigFileErrorException("Key: proxy_pool.rate isn't correct")
+        for key, default in (('burst', 3), ('eject_threshold', 3), ('eject_time', 300), ('rate_limit_backoff', 300)):
+            self.proxy_pool[key] = config_data.get('proxy_pool').get(key, default)
+            __check_int(self.proxy_pool[key], 'proxy_pool.%s' % key)
+        if self.proxy_pool['burst'] < 1 or self.proxy_pool['eject_threshold'] < 1:
+            raise ConfigFileErrorException("Key: proxy_pool.burst or proxy_pool.eject_threshold isn't correct")
+        self.proxy_pool['pinned_endpoints'] = set(config_data.get('proxy_pool').get(
+            'pinned_endpoints', {'sellitem', 'mobileconf'}))
+
+        self.distributed = config_data.setdefault('distributed', {})
+        self.distributed['queue_file'] = config_data.get('distributed').get('queue_file', None)
+        for key, default in (('lease', 120), ('max_attempts', 3), ('poll_interval', 2), ('timeout', None),
+                             ('worker_timeout', 300)):
+            self.distributed[key] = config_data.get('distributed').get(key, default)
+            if self.distributed[key] is not None and self.distributed[key] < 1:
+                raise ConfigFileErrorException("Key: distributed.%s isn't correct" % key)
+
+        self.process_pool = config_data.setdefault('process_pool', {})
+        self.process_pool['enable'] = config_data.get('process_pool').get('enable', False)
+        self.process_pool['processes'] = config_data.get('process_pool').get('processes', None)
+        self.process_pool['io_threads'] = config_data.get('process_pool').get('io_threads', 8)
+        if (self.process_pool['processes'] is not None and self.process_pool['processes'] < 1) or \
+                self.process_pool['io_threads'] < 1:
+            raise ConfigFileErrorException("Key: process_pool.processes or process_pool.io_threads isn't correct")
+
+        self.http_archive = config_data.setdefault('http_archive', {})
+        self.http_archive['mode'] = config_data.get('http_archive').get('mode', None) or None
+        if self.http_archive['mode'] not in (None, 'record', 'replay'):
+            raise ConfigFileErrorException("Key: http_archive.mode isn't correct")
+        self.http_archive['path'] = config_data.get('http_archive').get('path', None) or None
+        self.http_archive['latency_scale'] = config_data.get('http_archive').get('latency_scale', 0.0)
+        __price_check(self.http_archive['latency_scale'], 'http_archive.latency_scale')
+        self.http_archive['ignored_params'] = set(config_data.get('http_archive').get('ignored_params', {'t', 'k'}))
+
+        self.mobile_confirmation_setting = config_data.setdefault('mobile_confirmation_setting', {})
+        self.mobile_confirmation_setting['identity_secret'] = \
+            config_data.get('mobile_confirmation_setting').get('identity_secret', None) or None
+        self.mobile_confirmation_setting['device_id'] = \
+            config_data.get('mobile_confirmation_setting').get('device_id', None) or None
+        self.mobile_confirmation_setting['batch_size'] = config_data.get('mobile_confirmation_setting').get(
+            'batch_size', 50)
+        __check_int(self.mobile_confirmation_setting['batch_size'], 'mobile_confirmation_setting.batch_size')
+        if self.mobile_confirmation_setting['batch_size'] < 1:
+            raise ConfigFileErrorException("Key: mobile_confirmation_setting.batch_size isn't correct")
+        self.mobile_confirmation_setting['url'] = config_data.get('mobile_confirmation_setting').get(
+            'url', 'https://steamcommunity.com/mobileconf').rstrip('/')
+
+        default_policy = {'max_attempts': 10, 'backoff_base': 1, 'backoff_max': 60, 'jitter': 0.5,
+                          'rate_limit_backoff': 30}
+        retry_policy = config_data.get('retry_policy', {})
+        default_policy.update(retry_policy.get('default', {}))
+        self.retry_policy = {}
+        for endpoint, policy in [('default', {})] + list(retry_policy.items()):
+            if not isinstance(policy, dict):
+                raise ConfigFileErrorException('Key: retry_policy.%s is in a wrong format' % endpoint)
+            self.retry_policy[endpoint] = dict(default_policy, **policy)
+            for key, value in self.retry_policy[endpoint].items():
+                if key not in default_policy or not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise ConfigFileErrorException('Key: retry_policy.%s.%s is in a wrong format' % (endpoint, key))
+                if key == 'max_attempts' and not isinstance(value, int):
+                    raise ConfigFileErrorException('Key: retry_policy.%s.%s must be an integer' % (endpoint, key))
+                __price_check(value, 'retry_policy.%s.%s' % (endpoint, key))
+            if self.retry_policy[endpoint]['max_attempts'] < 1 or self.retry_policy[endpoint]['jitter'] > 1:
+                raise ConfigFileErrorException("Key: retry_policy.%s isn't correct" % endpoint)
+
+        self.circuit_breaker = config_data.setdefault('circuit_breaker', {})
+        self.circuit_breaker['enable'] = config_data.get('circuit_breaker').get('enable', True)
+        self.circuit_breaker['failure_threshold'] = config_data.get('circuit_breaker').get('failure_threshold', 5)
+        __check_int(self.circuit_breaker['failure_threshold'], 'circuit_breaker.failure_threshold')
+        if self.circuit_breaker['failure_threshold'] < 1:
+            raise ConfigFileErrorException("Key: circuit_breaker.failure_threshold isn't correct")
+        self.circuit_breaker['cooldown'] = config_data.get('circuit_breaker').get('cooldown', 60)
+        __check_int(self.circuit_breaker['cooldown'], 'circuit_breaker.cooldown')
+
     @staticmethod
     def __load_config() -> Dict:
         """
@@ -339,8 +679,7 @@ class Config(object):
         :rtype Dict
         :raises (FileNotFoundError, JSONDecodeError)
         """
-        path = dirname(__file__) + '/config.json'
-        f = open(path, 'r', encoding='utf-8')
+        f = open(CONFIG_PATH, 'r', encoding='utf-8')
         configs = f.read()
         f.close()
         return loads(configs)
@@ -354,4 +693,35 @@ class KeyNotConfigException(Exception):
     """The must config not set"""
 
 
-config = Config()
+config = LazyObject(Config)
+
+
+def reload_config(interval: float = 1.0) -> bool:
+    """
+    Reload config.json if it's changed. The new config gets all the checks of the first load
+    and replaces the old one as a whole, so the running code never sees a half-updated config.
+    A broken file is ignored and the old config is kept
+
+    :param interval: the min seconds between two checks of the file
+    :return: Reloaded = True
+    """
+    global _last_check
+    if not config.is_resolved() or config.mtime is None or monotonic() - _last_check < interval:
+        return False
+    _last_check = monotonic()
+    try:
+        mtime = getmtime(CONFIG_PATH)
+    except OSError:
+        return False
+    if mtime == config.mtime:
+        return False
+    try:
+        new_config = Config()
+        compile(new_config.price_setting['calculation_formula'], '<calculation_formula>', 'eval')
+    except Exception as e:
+        logger.error('The changed config file is not correct, keep the old config. Reason: %s', repr(e))
+        config.mtime = mtime  # Don't check the broken file again until it's changed
+        return False
+    config.set_object(new_config)
+    logger.info('Reloaded the config file')
+    return True
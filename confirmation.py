@@ -0,0 +1,99 @@
+from typing import List, Dict, Set
+from steam.api import (get_my_listings, get_confirmations, accept_confirmations, get_steam_time_offset,
+                       CONFIRMATION_TYPE_MARKET_LISTING)
+from steam.guard import ConfirmationKeyGenerator, IdentitySecretKeyGenerator, generate_device_id
+from steam.exceptions import *
+from requests.exceptions import RequestException
+from common.variables import config
+from common import metrics
+from item import Item
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PendingConfirmations(object):
+    def __init__(self):
+        """
+        The assets listed in this run which wait for the mobile confirmation
+        """
+        self.assetids: Set[str] = set()
+
+    def add(self, item: Item) -> None:
+        """
+        Add the item if its listing needs the mobile confirmation
+
+        :param item: the item listed by ``Item.sell_on_market``
+        :return: None
+        """
+        if item.needs_mobile_confirmation:
+            self.assetids.add(item.assetid)
+
+    def __len__(self) -> int:
+        return len(self.assetids)
+
+
+def get_key_generator() -> ConfirmationKeyGenerator:
+    """
+    :return: the key generator of the account set in the config
+    """
+    return IdentitySecretKeyGenerator(config.mobile_confirmation_setting['identity_secret'])
+
+
+def confirm_listings(pending: PendingConfirmations, key_generator: ConfirmationKeyGenerator = None) -> int:
+    """
+    Accept the listings of the run in bulk: one request for the listings to confirm, one for the confirmations,
+    then one request for every ``batch_size`` confirmations.
+    Only the confirmations of the pending assets are accepted, the others are left for the user
+
+    :param pending: :class:`PendingConfirmations`
+    :param key_generator: :class:`ConfirmationKeyGenerator`, the one of the config if None
+    :return: the number of the accepted listings
+    :raises (LoginCookieExpiredException)
+    """
+    if not pending:
+        return 0
+    if key_generator is None:
+        if config.mobile_confirmation_setting['identity_secret'] is None:
+            logger.warning('No identity_secret in mobile_confirmation_setting, %d listings need to be confirmed '
+                           'on the mobile app', len(pending))
+            return 0
+        key_generator = get_key_generator()
+    device_id = config.mobile_confirmation_setting['device_id'] or generate_device_id(config.steam_id)
+    url = config.mobile_confirmation_setting['url']
+    try:
+        # The keys are signed with the server time, a local clock out of sync gets them rejected
+        time_offset = get_steam_time_offset()
+    except (UnknownSteamErrorException, RequestException):
+        logger.warning('Failed to get the steam server time, sign the confirmations with the local time')
+        time_offset = 0
+    try:
+        # The listings to confirm are returned with the first page whatever the count is
+        _, listings = get_my_listings(config.steam_login_secure, 0, 1, config.language)
+        listingids = {listing['listingid'] for listing in listings if listing['state'] == 'to_confirm' and
+                      (listing['assetid'] in pending.assetids or listing['unowned_assetid'] in pending.assetids)}
+        confirmations = [confirmation for confirmation in get_confirmations(config.steam_login_secure,
+                                                                            config.steam_id, device_id,
+                                                                            key_generator, url, time_offset)
+                         if confirmation['type'] == CONFIRMATION_TYPE_MARKET_LISTING and
+                         confirmation['creator_id'] in listingids]
+    except (ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException):
+        logger.warning('Failed to get the confirmations, %d listings need to be confirmed on the mobile app',
+                       len(pending))
+        return 0
+    logger.info('%d of %d listings are waiting for the mobile confirmation', len(confirmations), len(pending))
+
+    accepted = 0
+    batch_size = config.mobile_confirmation_setting['batch_size']
+    for start in range(0, len(confirmations), batch_size):
+        batch: List[Dict] = confirmations[start:start + batch_size]
+        try:
+            accept_confirmations(config.steam_login_secure, config.steam_id, device_id, key_generator, batch, url,
+                                 time_offset)
+        except (ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException):
+            logger.warning('Failed to accept %d confirmations, confirm them on the mobile app', len(batch))
+            continue
+        accepted += len(batch)
+        metrics.increase('confirmation.accepted', len(batch))
+    logger.info('Accepted %d listings', accepted)
+    return accepted
@@ -0,0 +1,224 @@
+import os
+import socket
+import argparse
+import logging
+from time import sleep, monotonic
+from typing import List, Dict, Callable
+from price import Price, ItemCantSellException, save_item_nameids
+from steam.api import get_inventory
+from steam.exceptions import *
+from requests.exceptions import RequestException
+from common.variables import config, wallet, setup_logging
+from common.cache import CACHE_DIR
+from common.job_queue import JobQueue, DONE, PENDING, LEASED
+from common import metrics
+from item import Item, retrieve_items, hash_descriptions
+from listings import load_listing_index
+from confirmation import PendingConfirmations, confirm_listings
+from pricing_pool import get_pricing_pool
+
+logger = logging.getLogger(__name__)
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Get the job queue set in the config, the coordinator and the workers must use the same file
+
+    :return: :class:`JobQueue`
+    """
+    return JobQueue(config.distributed['queue_file'] or os.path.join(CACHE_DIR, 'jobs.sqlite3'),
+                    config.distributed['lease'], config.distributed['max_attempts'])
+
+
+def start_coordinator() -> None:
+    """
+    Get the inventory, push a pricing job for every item and list the items as the workers price them.
+    Only the coordinator lists items, the workers use the same cookie to get the wallet and the price history.
+    It stops waiting after ``distributed.timeout`` seconds, or when no worker has held a job or finished one
+    for ``distributed.worker_timeout`` seconds, the items not priced by then are left
+
+    :raises (LoginCookieExpiredException, InventoryPrivateException, ApiDoesntReturnSuccessException,
+             ApiDoesntReturnNeededParameterException, RequestException, UnknownSteamErrorException)
+    """
+    assets, descriptions = get_inventory(config.steam_id, config.app_id, config.context_id,
+                                         config.language, config.steam_login_secure)
+    items = retrieve_items(assets, hash_descriptions(descriptions))
+    del assets, descriptions
+    if config.my_listings['enable']:
+        listing_index = load_listing_index()
+        items = [item for item in items if not listing_index.is_listed(item)]
+
+    groups: Dict[str, List[Item]] = {}  # The items with the same market_hash_name share a job
+    for item in items:
+        if item.judge_can_sell():
+            groups.setdefault('%d/%s' % (item.appid, item.market_hash_name), []).append(item)
+        else:
+            logger.info("Item: %s, Asset ID: %s can't be sold Reason: not allowed in config",
+                        item.market_hash_name, item.assetid)
+    queue = get_job_queue()
+    queue.clear()
+    # The workers price with the coordinator's price setting
+    queue.set_meta('price_setting', config.price_setting)
+    queue.push([{'appid': group[0].appid, 'market_hash_name': group[0].market_hash_name,
+                 'currency': wallet.currency} for group in groups.values()])
+    logger.info('Pushed %d pricing jobs of %d items', len(groups), sum(len(group) for group in groups.values()))
+
+    total_sales = 0
+    pending = PendingConfirmations()
+    left = len(groups)
+    started = last_progress = monotonic()
+    while left > 0:
+        results = queue.collect()
+        if not results:
+            now = monotonic()
+            if queue.count_live_leases() > 0:
+                last_progress = now
+            elif now - last_progress > config.distributed['worker_timeout']:
+                logger.error('No worker has worked for %d seconds, is any worker running? %d pricing jobs are left',
+                             config.distributed['worker_timeout'], left)
+                break
+            if config.distributed['timeout'] is not None and now - started > config.distributed['timeout']:
+                logger.error('The workers have not finished in %d seconds, %d pricing jobs are left',
+                             config.distributed['timeout'], left)
+                break
+            sleep(config.distributed['poll_interval'])
+            continue
+        last_progress = monotonic()
+        for result in results:
+            left -= 1
+            total_sales += __list_items(groups.pop('%d/%s' % (result['appid'], result['market_hash_name'])), result,
+                                        pending)
+        logger.info('%d pricing jobs are left', left)
+    logger.info("Total listed %d items", total_sales)
+    if config.mobile_confirmation:
+        confirm_listings(pending)
+
+
+def __list_items(items: List[Item], result: Dict, pending: PendingConfirmations) -> int:
+    """
+    Check the price of a finished job and list its items
+
+    :param items: the items of the job
+    :param result: the job from ``JobQueue.collect``
+    :param pending: the listings waiting for the mobile confirmation are added to it
+    :return: the number of the listed items
+    """
+    if result['state'] != DONE:
+        for item in items:
+            logger.warning("Item: %s, Asset ID: %s can't be priced Reason: %s",
+                           item.market_hash_name, item.assetid, result['error'])
+        return 0
+    if 'rejected' in result['result']:
+        for item in items:
+            logger.info("Item: %s, Asset ID: %s can't be sold Reason: %s",
+                        item.market_hash_name, item.assetid, result['result']['rejected'])
+        return 0
+    listed = 0
+    for item in items:
+        item.price = Price(item.appid, item.market_hash_name)
+        item.price.sell_price = result['result']['sell_price']
+        item.price.features = result['result']['features']
+        if not item.judge_price_can_sell():
+            logger.info("Item: %s, Asset ID: %s can't be sold Reason: price not meet the config",
+                        item.market_hash_name, item.assetid)
+            continue
+        logger.info("Item: %s, Asset ID: %s, Sell Price: %f", item.market_hash_name, item.assetid,
+                    item.price.sell_price)
+        try:
+            if item.sell_on_market():
+                pending.add(item)
+                listed += 1
+        except (ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException):
+            pass
+    return listed
+
+
+def start_worker(worker: str, batch: int = 5, exit_when_idle: bool = False) -> None:
+    """
+    Price the jobs from the queue: fetch the market data, calculate the price and save the compact features
+
+    :param worker: the worker's id
+    :param batch: the jobs leased at once
+    :param exit_when_idle: exit when there's no job left instead of waiting for the next run
+    :raises (LoginCookieExpiredException)
+    """
+    queue = get_job_queue()
+    pricing_pool = get_pricing_pool()
+    if pricing_pool is not None:
+        # Keep every I/O thread busy
+        batch = max(batch, pricing_pool.io_threads)
+    try:
+        while True:
+            price_setting = queue.get_meta('price_setting')
+            # The price history is in the currency of the worker's wallet, the jobs in another currency are left
+            # for the workers of that currency
+            jobs = queue.lease_jobs(worker, batch, wallet.currency) if price_setting is not None else []
+            if not jobs:
+                if exit_when_idle and price_setting is not None and \
+                        queue.count(PENDING, wallet.currency) + queue.count(LEASED, wallet.currency) == 0:
+                    break
+                sleep(config.distributed['poll_interval'])
+                continue
+            config.price_setting = price_setting
+            if pricing_pool is None:
+                for job in jobs:
+                    __price_job(queue, worker, job, lambda: __calculate_price(job))
+            else:
+                for job, future in pricing_pool.price_jobs(jobs):
+                    __price_job(queue, worker, job, future.result)
+    finally:
+        if pricing_pool is not None:
+            pricing_pool.close()
+    save_item_nameids()
+    logger.info('No job left, request metrics: %s', metrics.snapshot())
+
+
+def __calculate_price(job: Dict) -> Dict:
+    """
+    Fetch the market data and calculate the price in this thread
+
+    :return: {'sell_price': float, 'features': Dict}
+    """
+    price = Price(job['appid'], job['market_hash_name'], currency=job['currency'])
+    price.calculate_price()
+    return {'sell_price': price.sell_price, 'features': price.features}
+
+
+def __price_job(queue: JobQueue, worker: str, job: Dict, calculate: Callable[[], Dict]) -> None:
+    """
+    Save the price of the job, or give the job back if it failed
+
+    :param calculate: the function returns {'sell_price': float, 'features': Dict} or raises the failure
+    :raises (LoginCookieExpiredException)
+    """
+    try:
+        result = calculate()
+    except ItemCantSellException as e:
+        result = {'rejected': str(e) or 'orders not meet the config'}
+    except LoginCookieExpiredException:
+        queue.fail(job['id'], worker, 'the worker\'s cookie is expired')
+        raise LoginCookieExpiredException
+    except (ApiDoesntReturnSuccessException, RequestException,
+            UnknownSteamErrorException, ApiDoesntReturnNeededParameterException) as e:
+        logger.warning('Job: %s failed, attempt %d. Reason: %s', job['market_hash_name'], job['attempts'], repr(e))
+        queue.fail(job['id'], worker, repr(e))
+        return
+    except Exception as e:
+        queue.fail(job['id'], worker, 'formula error: %s' % repr(e), retry=False)
+        return
+    if not queue.complete(job['id'], worker, result):
+        logger.warning('The lease of job: %s expired before it was done', job['market_hash_name'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Price the items on several nodes through a shared job queue')
+    parser.add_argument('mode', choices=('coordinator', 'worker'))
+    parser.add_argument('--id', default='%s-%d' % (socket.gethostname(), os.getpid()), help="the worker's id")
+    parser.add_argument('--batch', type=int, default=5, help='the jobs a worker leases at once')
+    parser.add_argument('--exit-when-idle', action='store_true', help='the worker exits when the queue is empty')
+    args = parser.parse_args()
+    setup_logging()
+    if args.mode == 'coordinator':
+        start_coordinator()
+    else:
+        start_worker(args.id, args.batch, args.exit_when_idle)
@@ -0,0 +1,178 @@
+from price import Price, ItemCantSellException
+from steam.api import get_inventory
+from common.variables import config
+from item import Item, retrieve_items, hash_descriptions
+from steam.exceptions import *
+from requests.exceptions import RequestException
+from datetime import datetime
+from json import loads, dumps, JSONDecodeError
+from typing import List, Dict, Tuple
+from time import time
+import csv
+import gzip
+import logging
+
+logger = logging.getLogger(__name__)
+
+SELL = 'would sell'
+
+
+def load_snapshot(path: str) -> Dict:
+    """
+    Load the market data snapshot, a path ends with ``.gz`` is read as gzip
+
+    :param path: the snapshot file path
+    :return: {'time': float, 'inventory': {'assets': List, 'descriptions': List},
+              'market': {'appid/market_hash_name': {'history': List[List[timestamp, price, amount]],
+                                                    'graph': Dict, 'publisher_fee': float or None}}},
+             empty dict if the file doesn't exist
+    """
+    try:
+        with (gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz')
+              else open(path, 'r', encoding='utf-8')) as f:
+            return loads(f.read())
+    except FileNotFoundError:
+        return {}
+    except (OSError, JSONDecodeError):
+        logger.warning('The snapshot file: %s is broken, ignore it', path)
+        return {}
+
+
+def save_snapshot(path: str, snapshot: Dict) -> None:
+    """
+    Save the market data snapshot
+
+    :param path: the snapshot file path
+    :param snapshot: the snapshot from function ``load_snapshot``
+    :return: None
+    """
+    with (gzip.open(path, 'wt', encoding='utf-8') if path.endswith('.gz')
+          else open(path, 'w', encoding='utf-8')) as f:
+        f.write(dumps(snapshot))
+
+
+def evaluate(items: List[Item], market: Dict[str, Dict], now: float, fetch: bool = True) -> List[Tuple[Item, str]]:
+    """
+    Evaluate the calculation formula and the price config for every item without listing anything.
+    The market data is read from ``market`` and the missing one is fetched from steam and added to it
+
+    :param items: the items from function ``retrieve_items``
+    :param market: the ``market`` of the snapshot
+    :param now: the timestamp the history is counted back from
+    :param fetch: fetch the missing market data from steam or not
+    :return: List[(item, result)], the result is ``SELL`` or the reason why it can't be sold
+    :raises (LoginCookieExpiredException)
+    """
+    prices: Dict[str, Tuple[Price, str]] = {}  # The items with the same market_hash_name share a price
+    results = []
+    for item in items:
+        if not item.judge_can_sell():
+            results.append((item, 'not allowed in config'))
+            continue
+        key = '%d/%s' % (item.appid, item.market_hash_name)
+        if key not in prices:
+            prices[key] = __evaluate_price(item, key, market, now, fetch)
+        item.price, reason = prices[key]
+        if reason is None:
+            reason = SELL if item.judge_price_can_sell() else 'price not meet the config'
+        results.append((item, reason))
+    return results
+
+
+def __evaluate_price(item: Item, key: str, market: Dict[str, Dict], now: float, fetch: bool) -> (Price, str):
+    """
+    Calculate the price of an item
+
+    :return: (price, None) or (price, the reason why it can't be sold)
+    :raises (LoginCookieExpiredException)
+    """
+    data = market.get(key)
+    try:
+        if data is not None:
+            price = Price(item.appid, item.market_hash_name, data['history'], data['graph'], now)
+        elif fetch:
+            # The snapshot keeps all the market data for tuning, so fetch both sources
+            price = Price(item.appid, item.market_hash_name, now=now)
+            market[key] = {
+                'history': [[record[0].timestamp() if isinstance(record[0], datetime) else record[0],
+                             record[1], record[2]] for record in price.item_price_history],
+                'graph': price.item_price_graph,
+                'publisher_fee': item.publisher_fee
+            }
+        else:
+            return None, 'market data not in snapshot'
+    except LoginCookieExpiredException:
+        raise LoginCookieExpiredException
+    except (ApiDoesntReturnSuccessException, RequestException,
+            UnknownSteamErrorException, ApiDoesntReturnNeededParameterException) as e:
+        return None, 'market data unavailable: %s' % type(e).__name__
+    try:
+        price.calculate_price()
+    except ItemCantSellException as e:
+        return price, str(e) or 'orders not meet the config'
+    except Exception as e:
+        return price, 'formula error: %s' % repr(e)
+    return price, None
+
+
+def write_report(path: str, results: List[Tuple[Item, str]]) -> None:
+    """
+    Write the evaluation results as a csv table
+
+    :param path: the report file path
+    :param results: the results from function ``evaluate``
+    :return: None
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('assetid', 'market_hash_name', 'type', 'sell_price', 'result'))
+        for item, reason in results:
+            sell_price = getattr(getattr(item, 'price', None), 'sell_price', None)
+            writer.writerow((item.assetid, item.market_hash_name, item.type1,
+                             '%.2f' % sell_price if sell_price is not None else '', reason))
+
+
+def start_dry_run() -> None:
+    """
+    Run the whole pricing without listing anything, and output the would-be prices and the rejection reasons
+
+    :raises (LoginCookieExpiredException, InventoryPrivateException, ApiDoesntReturnSuccessException,
+             ApiDoesntReturnNeededParameterException, RequestException, UnknownSteamErrorException)
+    """
+    path = config.dry_run['snapshot_file']
+    snapshot = load_snapshot(path) if path else {}
+    changed = 'inventory' not in snapshot
+    if not changed:
+        logger.info('Load inventory from snapshot: %s', path)
+        assets, descriptions = snapshot['inventory']['assets'], snapshot['inventory']['descriptions']
+    else:
+        assets, descriptions = get_inventory(config.steam_id, config.app_id, config.context_id,
+                                             config.language, config.steam_login_secure)
+        snapshot['inventory'] = {'assets': assets, 'descriptions': descriptions}
+    items = retrieve_items(assets, hash_descriptions(descriptions))
+    now = snapshot.setdefault('time', time())
+    market = snapshot.setdefault('market', {})
+    market_size = len(market)
+
+    start_time = time()
+    results = evaluate(items, market, now, fetch=not config.dry_run['offline'])
+    logger.info('Evaluated %d items in %.2f seconds', len(results), time() - start_time)
+
+    if path and (changed or market_size != len(market)):
+        save_snapshot(path, snapshot)
+        logger.info('Saved snapshot: %s', path)
+
+    if config.dry_run['report_file']:
+        write_report(config.dry_run['report_file'], results)
+        logger.info('Saved report: %s', config.dry_run['report_file'])
+    else:
+        for item, reason in results:
+            sell_price = getattr(getattr(item, 'price', None), 'sell_price', None)
+            logger.info('Item: %s, Asset ID: %s, Sell Price: %s, Result: %s',
+                        item.market_hash_name, item.assetid,
+                        '%.2f' % sell_price if sell_price is not None else '-', reason)
+    summary = {}
+    for _, reason in results:
+        summary[reason] = summary.get(reason, 0) + 1
+    for reason, count in sorted(summary.items(), key=lambda x: -x[1]):
+        logger.info('%8d  %s', count, reason)
@@ -1,8 +1,10 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional
+from sys import intern
 from steam.api import sell_item_on_market
 from price import Price
 from steam.exceptions import *
 from common.variables import config, wallet
+from common.common import Truncated
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,11 +12,12 @@ logger = logging.getLogger(__name__)
 
 class Item(object):
     price: Price
+    needs_mobile_confirmation: bool = False  # The listing waits for the mobile confirmation
 
     def __init__(self, appid: int, contextid: str, assetid: str, classid: str, instanceid: str, amount: str,
                  tradable: int, marketable: int, name: str, type_detail: str, tags: List[Dict],
                  publisher_fee: float = None,
-                 market_name: str = None, market_hash_name: str = None):
+                 market_name: str = None, market_hash_name: str = None, category: Dict[str, Dict] = None):
         """
         The item class
 
@@ -32,6 +35,7 @@ class Item(object):
         :param publisher_fee: The item's publisher fee
         :param market_name: The item's market name
         :param market_hash_name: The item market hash name
+        :param category: The tags by category, built from ``tags`` if None
         :raises (ApiDoesntReturnNeededParameterException, UnknownSteamErrorException)
         """
         self.appid: int = appid
@@ -48,11 +52,11 @@ class Item(object):
         self.marketable: bool = False if marketable == 0 else True
         self.publisher_fee: float = publisher_fee
         try:
-            self.category: Dict = {tag['category']: tag for tag in tags}
+            self.category: Dict = category if category is not None else {tag['category']: tag for tag in tags}
         except KeyError as e:
-            logger.error('Item: %s, Asset ID: %s; The item category info is not correct' % (self.market_hash_name,
-                                                                                            self.assetid))
-            logger.debug(tags)
+            logger.error('Item: %s, Asset ID: %s; The item category info is not correct',
+                         self.market_hash_name, self.assetid)
+            logger.debug('%s', Truncated(tags))
             raise ApiDoesntReturnNeededParameterException('The item category info is not correct')
 
         # Convert item_class to num
@@ -63,8 +67,8 @@ class Item(object):
                 self.type1 = 21
             else:
                 logger.error(
-                    'Item: %s, Asset ID: %s; Unknown Card Border' % (self.market_hash_name, self.assetid))
-                logger.debug("Card Border: %s" % self.category['cardborder']['internal_name'])
+                    'Item: %s, Asset ID: %s; Unknown Card Border', self.market_hash_name, self.assetid)
+                logger.debug("Card Border: %s", self.category['cardborder']['internal_name'])
                 raise UnknownSteamErrorException('Unknown Card Border')
         else:
             self.type1 = int(self.category['item_class']['internal_name'].split('_')[-1])
@@ -75,7 +79,7 @@ class Item(object):
 
         :return: Can sell = True
         """
-        logger.debug('marketable: %s, type1: %d, type_detail: %s' % (self.marketable, self.type1, self.type_detail))
+        logger.debug('marketable: %s, type1: %d, type_detail: %s', self.marketable, self.type1, self.type_detail)
         return True if self.marketable and \
                        ((not config.allow_to_sell_item['enable'] or
                          (config.allow_to_sell_item['enable'] and
@@ -91,72 +95,110 @@ class Item(object):
                                 self.type_detail not in config.disallow_to_sell_item_detail[
                                     'item_detail_type']))) else False
 
-    def judge_price_can_sell(self) -> bool:
+    def get_price_bounds(self) -> (float, float):
         """
-        Judge the item's selling price meet the price config
+        Get the selling price bounds of the item from the price config
 
-        :return: Can sell = True
+        :return: (lowest_price, highest_price), None means no bound
         """
-        if (config.price_setting['lowest_price'] is not None and
-            self.price.sell_price < config.price_setting['lowest_price']) or \
-                (config.price_setting['highest_price'] is not None and
-                 self.price.sell_price > config.price_setting['highest_price']):
-            return False
+        bounds = [(config.price_setting['lowest_price'], config.price_setting['highest_price'])]
         if self.category['item_class']['internal_name'] == 'item_class_2':
             if self.category['cardborder']['internal_name'] == 'cardborder_0':
-                if (config.price_setting['normal_card']['lowest_price'] is not None and
-                    self.price.sell_price < config.price_setting['normal_card']['lowest_price']) or \
-                        (config.price_setting['normal_card']['highest_price'] is not None and
-                         self.price.sell_price > config.price_setting['normal_card']['highest_price']):
-                    return False
+                bounds.append((config.price_setting['normal_card']['lowest_price'],
+                               config.price_setting['normal_card']['highest_price']))
             if self.category['cardborder']['internal_name'] == 'cardborder_1':
-                if (config.price_setting['foil_card']['lowest_price'] is not None and
-                    self.price.sell_price < config.price_setting['foil_card']['lowest_price']) or \
-                        (config.price_setting['foil_card']['highest_price'] is not None and
-                         self.price.sell_price > config.price_setting['foil_card']['highest_price']):
-                    return False
+                bounds.append((config.price_setting['foil_card']['lowest_price'],
+                               config.price_setting['foil_card']['highest_price']))
         else:
-            if (config.price_setting['other_item']['lowest_price'] is not None and
-                self.price.sell_price < config.price_setting['other_item']['lowest_price']) or \
-                    (config.price_setting['other_item']['highest_price'] is not None and
-                     self.price.sell_price > config.price_setting['other_item']['highest_price']):
-                return False
+            bounds.append((config.price_setting['other_item']['lowest_price'],
+                           config.price_setting['other_item']['highest_price']))
+        lowest_prices = [bound[0] for bound in bounds if bound[0] is not None]
+        highest_prices = [bound[1] for bound in bounds if bound[1] is not None]
+        return max(lowest_prices) if lowest_prices else None, min(highest_prices) if highest_prices else None
+
+    def judge_price_can_sell(self) -> bool:
+        """
+        Judge the item's selling price meet the price config
+
+        :return: Can sell = True
+        """
+        lowest_price, highest_price = self.get_price_bounds()
+        if (lowest_price is not None and self.price.sell_price < lowest_price) or \
+                (highest_price is not None and self.price.sell_price > highest_price):
+            return False
         return True
 
-    def sell_on_market(self) -> None:
+    def sell_on_market(self) -> bool:
         """
         List the item on the steam market
 
+        :return: Listed = True
         :raises (UnknownSteamErrorException, RequestException, ApiDoesntReturnSuccessException)
         """
 
         # Calculate the steam market fee
         fee = wallet.calculate_fee(self.price.sell_price, self.publisher_fee)
         sell_price_without_fee = int(self.price.sell_price * 100 - fee)
-        logger.info('Item: %s, Asset ID: %s, Item sell price: %f, Item fee: %f, Sell price without fee: %f' % (
-            self.market_hash_name, self.assetid, self.price.sell_price, fee / 100, sell_price_without_fee / 100))
-        logger.info('Item: %s, Asset ID: %s starts to list on market' % (self.market_hash_name, self.assetid))
+        logger.info('Item: %s, Asset ID: %s, Item sell price: %f, Item fee: %f, Sell price without fee: %f',
+                    self.market_hash_name, self.assetid, self.price.sell_price, fee / 100,
+                    sell_price_without_fee / 100)
+        logger.info('Item: %s, Asset ID: %s starts to list on market', self.market_hash_name, self.assetid)
         result = sell_item_on_market(config.steam_login_secure, config.steam_id, self.appid, self.contextid,
                                      self.assetid, self.amount, sell_price_without_fee, config.language)
         if result['success']:
-            logger.info('Item: %s list on market successfully. Asset ID: %s' % (self.market_hash_name,
-                                                                                self.assetid))
+            logger.info('Item: %s list on market successfully. Asset ID: %s', self.market_hash_name,
+                        self.assetid)
             if result['requires_confirmation'] == 1:
                 if result['needs_mobile_confirmation']:
-                    logger.info('Item: %s, Asset ID: %s needs mobile confirmation' % (self.market_hash_name,
-                                                                                      self.assetid))
+                    self.needs_mobile_confirmation = True
+                    logger.info('Item: %s, Asset ID: %s needs mobile confirmation', self.market_hash_name,
+                                self.assetid)
                 elif result['needs_email_confirmation']:
-                    logger.info('Item: %s, Asset ID: %s needs email confirmation' % (self.market_hash_name,
-                                                                                     self.assetid))
+                    logger.info('Item: %s, Asset ID: %s needs email confirmation', self.market_hash_name,
+                                self.assetid)
+            return True
         else:
-            logger.warning('Failed to list Item: %s. Asset ID: %s on market; Reason: %s' % (self.market_hash_name,
-                                                                                            self.assetid,
-                                                                                            result.get('message',
-                                                                                                       '')))
-            logger.debug(result)
+            logger.warning('Failed to list Item: %s. Asset ID: %s on market; Reason: %s', self.market_hash_name,
+                           self.assetid, result.get('message', ''))
+            logger.debug('%s', Truncated(result))
+            return False
+
+
+class Description(object):
+    """
+    The fields of an item description used by :class:`Item`, the strings are interned
+    so the items of the same description share them
+    """
+    __slots__ = ('appid', 'classid', 'instanceid', 'tradable', 'marketable', 'name', 'type', 'market_name',
+                 'market_hash_name', 'tags', 'category', 'publisher_fee')
+
+    def __init__(self, description: Dict):
+        """
+        :param description: a description obtained from the Inventory API
+        :raises (KeyError)
+        """
+        self.appid: int = description['appid']
+        self.classid: str = intern(description['classid'])
+        self.instanceid: str = intern(description['instanceid'])
+        self.tradable: int = description['tradable']
+        self.marketable: int = description['marketable']
+        self.name: str = intern(description['name'])
+        self.type: str = intern(description['type'])
+        self.market_name: str = intern(description['market_name'])
+        self.market_hash_name: str = intern(description['market_hash_name'])
+        # Only the category and the internal name of a tag are used, the raw tags are kept only when they're broken
+        self.tags: Optional[List[Dict]] = None
+        try:
+            self.category: Optional[Dict[str, Dict]] = {
+                intern(tag['category']): {key: intern(tag[key]) for key in ('category', 'internal_name') if key in tag}
+                for tag in description['tags']}
+        except KeyError:
+            self.category = None  # Item reports the broken tags
+            self.tags = description['tags']
+        self.publisher_fee: float = description.get('publisher_fee', None)
 
 
-def retrieve_items(assets: List[Dict], descriptions: Dict[int, Dict[str, Dict[str, Dict]]]) -> List[Item]:
+def retrieve_items(assets: List[Dict], descriptions: Dict[Tuple[int, str, str], Description]) -> List[Item]:
     """
     Combine assets and descriptions to Item
 
@@ -166,45 +208,46 @@ def retrieve_items(assets: List[Dict], descriptions: Dict[int, Dict[str, Dict[st
     """
     items = []
     for asset in assets:
-        description = descriptions[asset['appid']][asset['classid']][asset['instanceid']]
+        description = descriptions[(asset['appid'], asset['classid'], asset['instanceid'])]
         try:
             items.append(Item(
-                appid=description['appid'],
-                contextid=asset['contextid'],
+                appid=description.appid,
+                contextid=intern(asset['contextid']),
                 assetid=asset['assetid'],
-                classid=description['classid'],
-                instanceid=description['instanceid'],
-                amount=asset['amount'],
-                tradable=description['tradable'],
-                name=description['name'],
-                type_detail=description['type'],
-                market_name=description['market_name'],
-                market_hash_name=description['market_hash_name'],
-                marketable=description['marketable'],
-                tags=description['tags'],
-                publisher_fee=description.get('publisher_fee', None)
+                classid=description.classid,
+                instanceid=description.instanceid,
+                amount=intern(asset['amount']),
+                tradable=description.tradable,
+                name=description.name,
+                type_detail=description.type,
+                market_name=description.market_name,
+                market_hash_name=description.market_hash_name,
+                marketable=description.marketable,
+                tags=description.tags,
+                publisher_fee=description.publisher_fee,
+                category=description.category
             ))
         except (ApiDoesntReturnNeededParameterException, UnknownSteamErrorException):
             pass
-    logger.info('Get %d items in total' % len(items))
+    logger.info('Get %d items in total', len(items))
     return items
 
 
-def hash_descriptions(descriptions: List[Dict]) -> Dict[int, Dict[str, Dict[str, Dict]]]:
+def hash_descriptions(descriptions: List[Dict]) -> Dict[Tuple[int, str, str], Description]:
     """
-    Make a hash table for descriptions
+    Make a flat hash table for descriptions in one pass, only the used fields are kept
 
     :param descriptions: Descriptions obtained from the Inventory API
-    :return: {'appid': {'classid': {'instanceid': Dict[full_description]}}}
+    :return: {(appid, classid, instanceid): :class:`Description`}
+    :raises (ApiDoesntReturnNeededParameterException)
     """
-    descriptions_old = descriptions
-    descriptions = {}
-    for description in descriptions_old:
+    index = {}
+    for description in descriptions:
         try:
-            descriptions.setdefault(description['appid'], {}).setdefault(description['classid'],
-                                                                         {})[description['instanceid']] = description
+            record = Description(description)
         except KeyError:
             logger.error("Get unknown/wrong parameter when hashing descriptions")
-            logger.debug(description)
+            logger.debug('%s', Truncated(description))
             raise ApiDoesntReturnNeededParameterException('Get unknown/wrong parameter when hashing descriptions')
-    return descriptions
+        index[(record.appid, record.classid, record.instanceid)] = record
+    return index
@@ -0,0 +1,75 @@
+from typing import List, Dict, Set
+from steam.api import get_my_listings
+from steam.exceptions import *
+from requests.exceptions import RequestException
+from common.variables import config
+from item import Item
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+
+class ListingIndex(object):
+    def __init__(self, listings: List[Dict] = None):
+        """
+        The account's market listings indexed by asset and by item
+
+        :param listings: the listings from function ``get_my_listings``
+        """
+        self.assetids: Set[str] = set()
+        self.counts: Dict[str, int] = {}  # 'appid/market_hash_name': number of listings
+        for listing in listings or []:
+            self.add(listing['appid'], listing['market_hash_name'], listing['assetid'], listing['unowned_assetid'])
+
+    def add(self, appid: int, market_hash_name: str, *assetids: str) -> None:
+        """
+        Add a listing
+
+        :param appid: the game's appid
+        :param market_hash_name: The item market hash name
+        :param assetids: the ids the listed asset is known by
+        :return: None
+        """
+        self.assetids.update(assetid for assetid in assetids if assetid)
+        key = '%d/%s' % (appid, market_hash_name)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def is_listed(self, item: Item) -> bool:
+        """
+        :param item: :class:`Item`
+        :return: The asset is on the market or waiting for confirmation = True
+        """
+        return item.assetid in self.assetids
+
+    def get_listings_num(self, item: Item) -> int:
+        """
+        :param item: :class:`Item`
+        :return: the number of the listings of the same item
+        """
+        return self.counts.get('%d/%s' % (item.appid, item.market_hash_name), 0)
+
+
+def load_listing_index() -> ListingIndex:
+    """
+    Page through the account's market listings
+
+    :return: :class:`ListingIndex`, empty if the listings can't be loaded
+    :raises (LoginCookieExpiredException)
+    """
+    listings = []
+    start = 0
+    try:
+        while True:
+            total_count, page = get_my_listings(config.steam_login_secure, start, PAGE_SIZE, config.language)
+            listings.extend(page)
+            start += PAGE_SIZE
+            if start >= total_count or not page:
+                break
+    except (ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException):
+        logger.warning("Failed to load the market listings, the listed items can't be skipped")
+        return ListingIndex()
+    index = ListingIndex(listings)
+    logger.info('Loaded %d market listings of %d items', len(listings), len(index.counts))
+    return index
@@ -1,7 +1,20 @@
-from price import Price, ItemCantSellException, CalculationFormulaWrongException
+from price import Price, ItemCantSellException, CalculationFormulaWrongException, save_item_nameids
 from steam.api import get_inventory
-from common.variables import config
+from common.variables import config, wallet, setup_logging
+from config import reload_config
 from item import retrieve_items, hash_descriptions
+from dry_run import start_dry_run
+from prefetch import prefetch_market_summaries, judge_summary_can_sell, USD
+from scheduler import Budget, prioritize, load_last_prices, save_last_prices
+from listings import ListingIndex, load_listing_index
+from checkpoint import Checkpoint, CHECKPOINT_PATH, LISTING, LISTED, SKIPPED
+from confirmation import PendingConfirmations, confirm_listings
+from common.common import format_memory_usage, Truncated
+from common import metrics
+from collections import deque
+from typing import Dict
+from time import time, sleep
+import argparse
 import logging
 from steam.exceptions import *
 from requests.exceptions import RequestException
@@ -9,48 +22,197 @@ from requests.exceptions import RequestException
 logger = logging.getLogger(__name__)
 
 
-def start() -> None:
-    assets, descriptions = get_inventory(config.steam_id, config.app_id, config.context_id,
-                                         config.language, config.steam_login_secure)
+def start(resume: bool = False) -> None:
+    """
+    :param resume: continue the last broken run from its checkpoint
+    """
+    metrics.reset()  # The metrics and the bandwidth budget are per run
+    if config.dry_run['enable']:
+        start_dry_run()
+        return
+    checkpoint = Checkpoint(CHECKPOINT_PATH if config.checkpoint else None)
+    if resume and checkpoint.load():
+        logger.info('Resume from the checkpoint, the inventory is from the last run')
+        assets, descriptions = checkpoint.resume()
+    else:
+        if resume:
+            logger.warning('No checkpoint to resume, start a new run')
+        assets, descriptions = get_inventory(config.steam_id, config.app_id, config.context_id,
+                                             config.language, config.steam_login_secure)
+        checkpoint.start(assets, descriptions, time())
+    logger.info('Memory usage after getting inventory: %s', format_memory_usage())
     descriptions = hash_descriptions(descriptions)
     items = retrieve_items(assets, descriptions)
     del assets, descriptions
+    logger.info('Memory usage after retrieving items: %s', format_memory_usage())
+    listing_index = ListingIndex()
+    if config.my_listings['enable']:
+        listing_index = load_listing_index()
+        total_items = len(items)
+        items = [item for item in items if not listing_index.is_listed(item)]
+        logger.info('Skip %d items already on the market', total_items - len(items))
+    last_prices = load_last_prices()
+    summaries = {}
+    if config.market_prefetch['enable']:
+        summaries = prefetch_market_summaries([item for item in items if item.judge_can_sell()])
+    if config.scheduler['enable']:
+        # The last known prices are more accurate than the lowest listing prices.
+        # The summary prices are in USD, so they're only mixed with the last prices for the USD wallet
+        estimated_prices = {key: summary['sell_price'] for key, summary in summaries.items()} \
+            if wallet.currency == USD else {}
+        estimated_prices.update(last_prices)
+        items = prioritize(items, estimated_prices)
+    budget = Budget(config.scheduler['time_budget'], config.scheduler['request_budget'])
+    # Pop the items one by one so the finished items can be freed
+    items = deque(items)
+    total_items = len(items)
+    finished = False
+    pending = PendingConfirmations()
+    try:
+        finished = __sell_items(items, total_items, budget, last_prices, summaries, checkpoint, listing_index,
+                                pending)
+    finally:
+        checkpoint.close(finished)
+        save_last_prices(last_prices)
+        save_item_nameids()
+    if config.mobile_confirmation:
+        confirm_listings(pending)
+    logger.info('Memory usage after pricing: %s', format_memory_usage())
+    logger.info('Request metrics: %s', metrics.snapshot())
+
+
+def __sell_items(items: deque, total_items: int, budget: Budget, last_prices: Dict[str, float],
+                 summaries: Dict[str, Dict], checkpoint: Checkpoint, listing_index: ListingIndex,
+                 pending: PendingConfirmations) -> bool:
+    """
+    :return: All the items are done = True
+    """
     total_sales = 0
-    for item in items:
+    while items:
+        if budget.exhausted():
+            logger.warning('Stop pricing, %d items are left', len(items))
+            logger.info("Total listed %d items", total_sales)
+            return False
+        __reload_config()
+        item = items.popleft()
+        if (total_items - len(items)) % 1000 == 0:
+            logger.info('Memory usage after pricing %d items: %s', total_items - len(items), format_memory_usage())
+        state = checkpoint.assets.get(item.assetid)
+        if state is not None:
+            if state == LISTING:
+                logger.warning('Item: %s, Asset ID: %s may have been listed before the last run broke, '
+                               'please check it on the market', item.market_hash_name, item.assetid)
+            continue
+        key = '%d/%s' % (item.appid, item.market_hash_name)
         if item.judge_can_sell():
+            if config.my_listings['max_per_item'] is not None and \
+                    listing_index.get_listings_num(item) >= config.my_listings['max_per_item']:
+                logger.info(
+                    "Item: %s, Asset ID: %s can't be sold Reason: %d listings on the market already",
+                    item.market_hash_name, item.assetid, listing_index.get_listings_num(item))
+                continue
+            summary = summaries.get(key)
+            if summary is not None and not judge_summary_can_sell(item, summary):
+                logger.info(
+                    "Item: %s, Asset ID: %s can't be sold Reason: market summary not meet the config",
+                    item.market_hash_name, item.assetid)
+                continue
+            item.price = Price(item.appid, item.market_hash_name)
             try:
-                item.price = Price(item.appid, item.market_hash_name)
+                if key in checkpoint.prices:
+                    # Priced before the last run broke
+                    if checkpoint.prices[key] is None:
+                        raise ItemCantSellException
+                    item.price.sell_price = checkpoint.prices[key]
+                else:
+                    item.price.calculate_price()
             except LoginCookieExpiredException:
                 raise LoginCookieExpiredException
             except (ApiDoesntReturnSuccessException, RequestException,
                     UnknownSteamErrorException, ApiDoesntReturnNeededParameterException):
                 continue
-            try:
-                item.price.calculate_price()
             except ItemCantSellException:
+                if key not in checkpoint.prices:
+                    checkpoint.record_price(key, None)
+                if config.low_memory:
+                    item.price.release()
                 logger.info(
-                    "Item: %s, Asset ID: %s can't be sold Reason: orders not meet the config" %
-                    (item.market_hash_name, item.assetid))
+                    "Item: %s, Asset ID: %s can't be sold Reason: orders not meet the config",
+                    item.market_hash_name, item.assetid)
                 continue
             except Exception:
                 raise CalculationFormulaWrongException
             else:
+                if key not in checkpoint.prices:
+                    checkpoint.record_price(key, item.price.sell_price)
+                last_prices[key] = item.price.sell_price
+                if config.low_memory:
+                    item.price.release()
                 if item.judge_price_can_sell():
-                    logger.info("Item: %s, Asset ID: %s, Sell Price: %f" % (item.market_hash_name,
-                                                                            item.assetid,
-                                                                            item.price.sell_price))
-                    item.sell_on_market()
-                    total_sales += 1
+                    logger.info("Item: %s, Asset ID: %s, Sell Price: %f", item.market_hash_name,
+                                item.assetid, item.price.sell_price)
+                    checkpoint.record_asset(item.assetid, LISTING)
+                    if item.sell_on_market():
+                        checkpoint.record_asset(item.assetid, LISTED)
+                        listing_index.add(item.appid, item.market_hash_name, item.assetid)
+                        pending.add(item)
+                        total_sales += 1
+                    else:
+                        checkpoint.record_asset(item.assetid, SKIPPED)
                 else:
                     logger.info(
-                        "Item: %s, Asset ID: %s can't be sold Reason: price not meet the config" %
-                        (item.market_hash_name, item.assetid))
+                        "Item: %s, Asset ID: %s can't be sold Reason: price not meet the config",
+                        item.market_hash_name, item.assetid)
         else:
             logger.info(
-                "Item: %s, Asset ID: %s can't be sold Reason: not allowed in config" % (item.market_hash_name,
-                                                                                        item.assetid))
-    logger.info("Total listed %d items" % total_sales)
+                "Item: %s, Asset ID: %s can't be sold Reason: not allowed in config", item.market_hash_name,
+                item.assetid)
+    logger.info("Total listed %d items", total_sales)
+    return True
+
+
+def __reload_config() -> None:
+    """
+    Swap in the changed config file. The caches and the connections are kept,
+    only the state built from the changed keys is rebuilt
+
+    :return: None
+    """
+    steam_id = config.steam_id
+    if reload_config():
+        Truncated.limit = config.log_payload_limit
+        if config.steam_id != steam_id:
+            wallet.set_object(None)  # Load the new account's wallet on next use
+
+
+def start_forever(interval: int, resume: bool = False) -> None:
+    """
+    Run again and again in one process, the config file is reloaded when it's changed,
+    so tuning the price setting doesn't lose the warmed caches
+
+    :param interval: the seconds to wait between two runs
+    :param resume: continue the last broken run from its checkpoint
+    """
+    while True:
+        __reload_config()
+        try:
+            start(resume)
+            resume = False
+        except (SteamException, RequestException, CalculationFormulaWrongException) as e:
+            # The next run continues from the checkpoint, e.g. after the cookie is updated in the config file
+            logger.error('The run is broken, retry in %d seconds. Reason: %s', interval, repr(e))
+            resume = True
+        sleep(interval)
 
 
 if __name__ == '__main__':
-    start()
+    parser = argparse.ArgumentParser(description='List the steam inventory items on the market')
+    parser.add_argument('--resume', action='store_true', help='continue the last broken run from its checkpoint')
+    parser.add_argument('--interval', type=int, default=None,
+                        help='keep running, start a new run every INTERVAL seconds and reload the changed config')
+    args = parser.parse_args()
+    setup_logging()
+    if args.interval is None:
+        start(args.resume)
+    else:
+        start_forever(args.interval, args.resume)
@@ -0,0 +1,72 @@
+from typing import List, Dict, Set
+from steam.api import get_market_search_results
+from steam.exceptions import *
+from requests.exceptions import RequestException
+from common.variables import config, wallet
+from item import Item
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+USD = 1
+
+
+def prefetch_market_summaries(items: List[Item]) -> Dict[str, Dict]:
+    """
+    Bulk load the market summaries of the items with the market search API.
+    Steam community items are searched game by game, the other apps page by page until all items are found.
+    A group stops when all its items are found, at its last page or after ``max_pages`` pages.
+    The results are ordered by name, so a page without any of the items doesn't end the search.
+    The items not found are priced without a summary
+
+    :param items: the items from function ``retrieve_items``
+    :return: {'appid/market_hash_name': {'market_hash_name': str, 'sell_listings': int, 'sell_price': float}}
+    """
+    groups: Dict[tuple, Set[str]] = {}  # (appid, game tag): market_hash_names
+    for item in items:
+        game = item.category.get('Game', {}).get('internal_name') if item.appid == 753 else None
+        groups.setdefault((item.appid, game), set()).add(item.market_hash_name)
+
+    summaries = {}
+    for (appid, game), names in groups.items():
+        filters = {'category_753_Game[]': 'tag_%s' % game} if game else None
+        start = 0
+        found = 0
+        try:
+            for _ in range(config.market_prefetch['max_pages']):
+                total_count, results = get_market_search_results(appid, start, PAGE_SIZE,
+                                                                 filters=filters, language=config.language)
+                for result in results:
+                    key = '%d/%s' % (appid, result['market_hash_name'])
+                    if result['market_hash_name'] in names and key not in summaries:
+                        summaries[key] = result
+                        found += 1
+                start += PAGE_SIZE
+                if not results or start >= total_count or found >= len(names):
+                    break
+        except (ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException):
+            logger.warning('Failed to prefetch the market summaries of app: %d, game: %s', appid, game)
+    logger.info('Prefetched %d market summaries in %d groups', len(summaries), len(groups))
+    return summaries
+
+
+def judge_summary_can_sell(item: Item, summary: Dict) -> bool:
+    """
+    Judge the item can be sold by its market summary, so the items which can't be sold skip the per-item requests.
+    The summary price is in USD, so the price bounds are only checked for the USD wallet
+
+    :param item: :class:`Item`
+    :param summary: the summary from function ``prefetch_market_summaries``
+    :return: Can sell = True
+    """
+    if summary['sell_listings'] < config.price_setting['least_sell_orders']:
+        return False
+    if wallet.currency == USD:
+        tolerance = config.market_prefetch['price_tolerance']
+        lowest_price, highest_price = item.get_price_bounds()
+        if lowest_price is not None and summary['sell_price'] * (1 + tolerance) < lowest_price:
+            return False
+        if highest_price is not None and summary['sell_price'] * (1 - tolerance) > highest_price:
+            return False
+    return True
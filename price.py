@@ -1,113 +1,417 @@
 from steam.api import get_item_price_graph, get_item_price_history, get_item_nameid
-from datetime import timedelta, timezone
-from typing import Dict
+from typing import Dict, List, Set, Callable, Any
+from types import CodeType
 from common.variables import config, wallet
+from common.cache import load_json_cache, save_json_cache
+from common.shared_cache import get_shared_cache
+from common import metrics
 from datetime import datetime
+from bisect import bisect_left, bisect_right
+from time import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+ITEM_NAMEID_CACHE = 'item_nameid.json'
+
+# The names in the formula which need the data source
+HISTORY_NAMES = {'get_history_sales_num', 'get_history_average_price', 'get_history_highest_price',
+                 'history_sales_num'}
+GRAPH_NAMES = {'highest_buy_price', 'lowest_sell_price', 'total_buy_orders', 'total_sell_orders', 'sales_push_back',
+               'depth_at_price', 'spread', 'price_at_quantile'}
+# The formula may reach any data source through these names
+UNSAFE_NAMES = {'self', 'eval', 'exec', 'locals', 'vars', 'globals', 'getattr'}
+
+_formula_cache: Dict[str, CodeType] = {}
+_item_nameids: Dict[str, int] = None
+
+
+def compile_formula(formula: str) -> CodeType:
+    """
+    Compile the calculation formula once and reuse it for every item
+
+    :param formula: the calculation formula
+    :return: the compiled code
+    :raises (CalculationFormulaWrongException)
+    """
+    code = _formula_cache.get(formula)
+    if code is None:
+        try:
+            code = compile(formula, '<calculation_formula>', 'eval')
+        except (SyntaxError, ValueError, TypeError):
+            raise CalculationFormulaWrongException
+        _formula_cache[formula] = code
+    return code
+
+
+def fetch_shared(kind: str, appid: int, market_hash_name: str, currency: int, fetch: Callable[[], Any],
+                 ttl_kind: str = None) -> Any:
+    """
+    Fetch the market data through the shared cache, so the processes on the host fetch a key only once
+
+    :param kind: 'nameid', 'history', 'graph', or 'history_content', 'graph_content' for the raw bodies
+    :param appid: the game's appid
+    :param market_hash_name: The item market hash name
+    :param currency: the currency of the data, 0 if the data doesn't depend on it
+    :param fetch: the function to fetch the data from steam
+    :param ttl_kind: the ttl is ``config.shared_cache['<ttl_kind>_ttl']``, ``kind`` if None
+    :return: the data
+    """
+    shared_cache = get_shared_cache()
+    if shared_cache is None:
+        return fetch()
+    return shared_cache.get_or_fill(kind, appid, market_hash_name, currency,
+                                    config.shared_cache['%s_ttl' % (ttl_kind or kind)], fetch)
+
+
+def get_cached_item_nameid(appid: int, market_hash_name: str) -> int:
+    """
+    Get the item_nameid from the cache, or from steam if it's not cached. The item_nameid never changes
+
+    :param appid: the game's appid
+    :param market_hash_name: The item market hash name
+    :return: item_nameid
+    :raises (UnknownSteamErrorException, RequestException)
+    """
+    global _item_nameids
+    if _item_nameids is None:
+        _item_nameids = load_json_cache(ITEM_NAMEID_CACHE)
+    key = '%d/%s' % (appid, market_hash_name)
+    if key not in _item_nameids:
+        _item_nameids[key] = fetch_shared('nameid', appid, market_hash_name, 0,
+                                          lambda: get_item_nameid(appid, market_hash_name))
+    return _item_nameids[key]
+
+
+def is_item_nameid_cached(appid: int, market_hash_name: str) -> bool:
+    """
+    Judge the item_nameid is cached or not
+
+    :param appid: the game's appid
+    :param market_hash_name: The item market hash name
+    :return: Cached = True
+    """
+    global _item_nameids
+    if _item_nameids is None:
+        _item_nameids = load_json_cache(ITEM_NAMEID_CACHE)
+    return '%d/%s' % (appid, market_hash_name) in _item_nameids
+
+
+def save_item_nameids() -> None:
+    """
+    Save the cached item_nameids
+
+    :return: None
+    """
+    if _item_nameids is not None:
+        save_json_cache(ITEM_NAMEID_CACHE, _item_nameids)
+
+
+def get_code_names(code: CodeType) -> Set[str]:
+    """
+    Get the names used by the code and by the lambdas, comprehensions and generator expressions in it
+
+    :param code: the compiled formula
+    :return: the names
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= get_code_names(const)
+    return names
+
+
+def get_needed_sources(code: CodeType) -> List[str]:
+    """
+    Get the data sources needed by the order gates of ``config.price_setting`` and the formula
+
+    :param code: the compiled formula
+    :return: List['history' | 'graph']
+    """
+    names = get_code_names(code)
+    unsafe = bool(names & UNSAFE_NAMES)
+    sources = []
+    if config.price_setting['hours_least_sells'] > 0 or unsafe or names & HISTORY_NAMES:
+        sources.append('history')
+    else:
+        metrics.increase('price.skipped_history')
+    if config.price_setting['least_buy_orders'] > 0 or config.price_setting['least_sell_orders'] > 0 or \
+            unsafe or names & GRAPH_NAMES:
+        sources.append('graph')
+    else:
+        metrics.increase('price.skipped_graph')
+    return sources
+
+
+class OrderBook(object):
+    def __init__(self, graph: Dict = None):
+        """
+        The order ladders of a price graph in flat arrays, so every query is a bisect
+
+        :param graph: the price graph from function ``get_item_price_graph``, None or empty ladders for no orders
+        """
+        graph = graph or {}
+        sell_order_graph = graph.get('sell_order_graph') or []
+        buy_order_graph = graph.get('buy_order_graph') or []
+        self.highest_buy_price: float = graph.get('highest_buy_order')
+        self.lowest_sell_price: float = graph.get('lowest_sell_order')
+        # The quantities in the graph are cumulative, the sell prices ascend and the buy prices descend
+        self.sell_prices: List[float] = [float(order[0]) for order in sell_order_graph]
+        self.sell_quantities: List[int] = [int(order[1]) for order in sell_order_graph]
+        self.negative_buy_prices: List[float] = [-float(order[0]) for order in buy_order_graph]
+        self.buy_quantities: List[int] = [int(order[1]) for order in buy_order_graph]
+
+    @property
+    def total_sell_orders(self) -> int:
+        return self.sell_quantities[-1] if self.sell_quantities else 0
+
+    @property
+    def total_buy_orders(self) -> int:
+        return self.buy_quantities[-1] if self.buy_quantities else 0
+
+    def sales_push_back(self, back_num: int) -> float:
+        """
+        The price when the cheapest ``back_num`` sell orders are sold
+
+        :raises (CalculationFormulaWrongException, ItemCantSellException)
+        """
+        if not isinstance(back_num, (float, int)) or back_num < 0:
+            raise CalculationFormulaWrongException
+        if not self.sell_prices:
+            raise ItemCantSellException('sell orders not meet the config')
+        index = bisect_left(self.sell_quantities, int(back_num))
+        return self.sell_prices[min(index, len(self.sell_prices) - 1)]
+
+    def depth_at_price(self, price: float, side: str = 'sell') -> int:
+        """
+        The quantity of the sell orders at or below the price, or of the buy orders at or above the price
+
+        :raises (CalculationFormulaWrongException)
+        """
+        if not isinstance(price, (float, int)) or side not in ('sell', 'buy'):
+            raise CalculationFormulaWrongException
+        if side == 'sell':
+            index = bisect_right(self.sell_prices, price)
+            return self.sell_quantities[index - 1] if index > 0 else 0
+        index = bisect_right(self.negative_buy_prices, -price)
+        return self.buy_quantities[index - 1] if index > 0 else 0
+
+    def spread(self) -> float:
+        """
+        The lowest sell price minus the highest buy price
+
+        :raises (ItemCantSellException)
+        """
+        if self.lowest_sell_price is None or self.highest_buy_price is None:
+            raise ItemCantSellException('orders not meet the config')
+        return self.lowest_sell_price - self.highest_buy_price
+
+    def price_at_quantile(self, quantile: float, side: str = 'sell') -> float:
+        """
+        The price where the cumulative quantity reaches the quantile of all the orders on the side
+
+        :raises (CalculationFormulaWrongException, ItemCantSellException)
+        """
+        if not isinstance(quantile, (float, int)) or not 0 <= quantile <= 1 or side not in ('sell', 'buy'):
+            raise CalculationFormulaWrongException
+        prices, quantities = (self.sell_prices, self.sell_quantities) if side == 'sell' else \
+            (self.negative_buy_prices, self.buy_quantities)
+        if not prices:
+            raise ItemCantSellException('%s orders not meet the config' % side)
+        price = prices[min(bisect_left(quantities, quantile * quantities[-1]), len(prices) - 1)]
+        return price if side == 'sell' else -price
+
+    def get_helpers(self) -> Dict:
+        """
+        Get the order values and helpers used by the formula
+
+        :return: {name: value or function}
+        """
+        return {
+            'highest_buy_price': self.highest_buy_price,
+            'lowest_sell_price': self.lowest_sell_price,
+            'total_buy_orders': self.total_buy_orders,
+            'total_sell_orders': self.total_sell_orders,
+            'sales_push_back': self.sales_push_back,
+            'depth_at_price': self.depth_at_price,
+            'spread': self.spread,
+            'price_at_quantile': self.price_at_quantile
+        }
+
 
 class Price(object):
     sell_price: float
+    features: Dict = None  # The small feature set extracted from the raw market data
 
-    def __init__(self, appid: int, market_hash_name: str):
+    def __init__(self, appid: int, market_hash_name: str, item_price_history: List[List] = None,
+                 item_price_graph: Dict = None, now: float = None, currency: int = None):
         """
+        The market data is fetched from steam only when it's needed
+
         :param appid: the game's appid
         :param market_hash_name: The item market hash name
-        :raises (LoginCookieExpiredException, ApiDoesntReturnSuccessException, RequestException,
-                 UnknownSteamErrorException, ApiDoesntReturnNeededParameterException)
+        :param item_price_history: The item's price history, fetch from steam if None.
+                                   The time can be a :class:``datetime`` or a timestamp
+        :param item_price_graph: The item's price graph, fetch from steam if None
+        :param now: The timestamp the history is counted back from, the current time if None
+        :param currency: The currency of the price graph, the wallet's currency if None
         """
         self.appid: int = appid
         self.market_hash_name: str = market_hash_name
-        self.item_price_history = get_item_price_history(appid=appid,
-                                                         market_hash_name=market_hash_name,
-                                                         steam_login_secure=config.steam_login_secure)
-        item_nameid: int = get_item_nameid(appid, market_hash_name)
-        self.item_price_graph: Dict = get_item_price_graph(item_nameid,
-                                                           wallet.currency,
-                                                           config.language)
+        self.now: float = now
+        self.currency: int = currency
+        self.__item_price_history: List[List] = item_price_history
+        self.__item_price_graph: Dict = item_price_graph
+        self.__released: bool = False
+
+    @property
+    def item_price_history(self) -> List[List]:
+        """
+        :raises (LoginCookieExpiredException, ApiDoesntReturnSuccessException, RequestException,
+                 UnknownSteamErrorException, ApiDoesntReturnNeededParameterException)
+        """
+        if self.__item_price_history is None and not self.__released:
+            # The history is in the currency of the account's wallet
+            self.__item_price_history = fetch_shared(
+                'history', self.appid, self.market_hash_name, wallet.currency,
+                lambda: get_item_price_history(appid=self.appid, market_hash_name=self.market_hash_name,
+                                               steam_login_secure=config.steam_login_secure))
+        return self.__item_price_history
+
+    @property
+    def item_price_graph(self) -> Dict:
+        """
+        :raises (ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException)
+        """
+        if self.__item_price_graph is None and not self.__released:
+            currency = self.currency if self.currency is not None else wallet.currency
+            self.__item_price_graph = fetch_shared(
+                'graph', self.appid, self.market_hash_name, currency,
+                lambda: get_item_price_graph(get_cached_item_nameid(self.appid, self.market_hash_name),
+                                             currency, config.language))
+        return self.__item_price_graph
 
     def calculate_price(self) -> None:
         """
-        Calculate the item's selling price
+        Calculate the item's selling price. The data sources are fetched from the cheapest one,
+        and each order gate is judged as soon as its data arrives, so a rejected item skips the rest
 
         :return: None
-        :raises (CalculationFormulaWrongException, ItemCantSellException, Exception)
+        :raises (CalculationFormulaWrongException, ItemCantSellException, LoginCookieExpiredException,
+                 ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException,
+                 ApiDoesntReturnNeededParameterException, Exception)
+        """
+        code = compile_formula(config.price_setting['calculation_formula'])
+        self.features = {}
+        variables = {'self': self}
+        for source in self.__get_needed_sources(code):
+            if source == 'history':
+                variables.update(self.__get_history_helpers())
+                history_sales_num = variables['get_history_sales_num'](config.price_setting['least_sells_hours'])
+                variables['history_sales_num'] = self.features['history_sales_num'] = history_sales_num
+                logger.debug('history_sales_num: %d', history_sales_num)
+                if history_sales_num < config.price_setting['hours_least_sells']:
+                    raise ItemCantSellException('history sales not meet the config')
+            else:
+                order_book = OrderBook(self.item_price_graph)
+                self.features.update(self.__extract_features(order_book))
+                variables.update(order_book.get_helpers())
+                logger.debug('total_buy_orders: %d, total_sell_orders: %d', self.features['total_buy_orders'],
+                             self.features['total_sell_orders'])
+                if self.features['total_buy_orders'] < config.price_setting['least_buy_orders']:
+                    raise ItemCantSellException('buy orders not meet the config')
+                if self.features['total_sell_orders'] < config.price_setting['least_sell_orders']:
+                    raise ItemCantSellException('sell orders not meet the config')
+
+        # Calculate the selling price
+        # The helpers are globals of the formula, so the lambdas and generator expressions in it find them too
+        self.sell_price = eval(code, dict(globals(), **variables))
+
+    def __get_needed_sources(self, code: CodeType) -> List[str]:
+        """
+        Get the data sources needed by the order gates and the formula, the cheapest first
+
+        :param code: the compiled formula
+        :return: List['history' | 'graph']
         """
-        highest_buy_price = self.item_price_graph['highest_buy_order']
-        lowest_sell_price = self.item_price_graph['lowest_sell_order']
-        total_buy_orders = self.item_price_graph['buy_order_graph'][-1][1] \
-            if self.item_price_graph['buy_order_graph'] else 0
-        total_sell_orders = self.item_price_graph['sell_order_graph'][-1][1] \
-            if self.item_price_graph['sell_order_graph'] else 0
+        sources = get_needed_sources(code)
+
+        def __cost(source: str) -> int:
+            if source == 'history':
+                return 0 if self.__item_price_history is not None else 1
+            if self.__item_price_graph is not None:
+                return 0
+            return 1 if is_item_nameid_cached(self.appid, self.market_hash_name) else 2
+
+        return sorted(sources, key=__cost)
+
+    def __get_history_helpers(self) -> Dict[str, Callable]:
+        """
+        Get the history helpers used by the formula
+
+        :return: {name: function}
+        """
+        # The history is in time order, so the records in the last hours can be found by bisect
+        history = [record for record in self.item_price_history if isinstance(record[0], (datetime, int, float))]
+        timestamps = [record[0].timestamp() if isinstance(record[0], datetime) else record[0] for record in history]
+        now = self.now if self.now is not None else time()
 
         def get_history_sales_num(hours: int) -> int:
             if not isinstance(hours, (int, float)) or hours < 0 or hours > 999999:
                 raise CalculationFormulaWrongException
-            hours = int(hours)
-            start = datetime.now(timezone.utc) - timedelta(hours=hours)
-            sales_num = 0
-            for i in range(len(self.item_price_history) - 1, -1, -1):
-                if (start.timestamp() / 3600) <= (self.item_price_history[i][0].timestamp() / 3600):
-                    sales_num += self.item_price_history[i][2]
-                else:
-                    break
-            return sales_num
+            start = bisect_left(timestamps, now - int(hours) * 3600)
+            return sum(record[2] for record in history[start:])
 
         def get_history_average_price(hours: int, weighted: bool = True) -> float:
             if not isinstance(hours, (int, float)) or not isinstance(weighted, bool) or hours < 0 or hours > 999999:
                 raise CalculationFormulaWrongException
-            hours = int(hours)
-            total_price = 0.0
-            weight = 0
-            start = datetime.now(timezone.utc) - timedelta(hours=hours)
-            for i in range(len(self.item_price_history) - 1, -1, -1):
-                if (start.timestamp() / 3600) <= (self.item_price_history[i][0].timestamp() / 3600):
-                    if weighted:
-                        total_price += self.item_price_history[i][1] * self.item_price_history[i][2]
-                        weight += self.item_price_history[i][2]
-                    else:
-                        total_price += self.item_price_history[i][1]
-                        weight += 1
+            start = bisect_left(timestamps, now - int(hours) * 3600)
+            if weighted:
+                total_price = sum(record[1] * record[2] for record in history[start:])
+                weight = sum(record[2] for record in history[start:])
+            else:
+                total_price = sum(record[1] for record in history[start:])
+                weight = len(history) - start
             return total_price / weight
 
         def get_history_highest_price(hours: int) -> float:
             if not isinstance(hours, (int, float)) or hours < 0 or hours > 999999:
                 raise CalculationFormulaWrongException
-            hours = int(hours)
-            start = datetime.now(timezone.utc) - timedelta(hours=hours)
-            highest_price = 0.0
-            for i in range(len(self.item_price_history) - 1, -1, -1):
-                if (start.timestamp() / 3600) <= (self.item_price_history[i][0].timestamp() / 3600):
-                    highest_price = self.item_price_history[i][1] if self.item_price_history[i][1] > highest_price \
-                        else highest_price
-                else:
-                    return highest_price
-            return highest_price
-
-        def sales_push_back(back_num: int) -> float:
-            if not isinstance(back_num, (float, int)) or back_num < 0:
-                raise CalculationFormulaWrongException
-            back_num = int(back_num)
-            for order in self.item_price_graph['sell_order_graph']:
-                if order[1] >= back_num:
-                    return order[0]
-            return self.item_price_graph['sell_order_graph'][-1][0]
-
-        history_sales_num = get_history_sales_num(config.price_setting['least_sells_hours'])
-        logger.debug('history_sales_num: %d, total_buy_orders: %d, total_sell_orders: %d' % (history_sales_num,
-                                                                                             total_buy_orders,
-                                                                                             total_sell_orders))
-
-        # Judge the item's market orders meet the config
-        if history_sales_num < config.price_setting['hours_least_sells'] \
-                or total_buy_orders < config.price_setting['least_buy_orders'] \
-                or total_sell_orders < config.price_setting['least_sell_orders']:
-            raise ItemCantSellException
+            start = bisect_left(timestamps, now - int(hours) * 3600)
+            return max((record[1] for record in history[start:]), default=0.0)
 
-        # Calculate the selling price
-        self.sell_price = eval(config.price_setting['calculation_formula'])
+        return {
+            'get_history_sales_num': get_history_sales_num,
+            'get_history_average_price': get_history_average_price,
+            'get_history_highest_price': get_history_highest_price
+        }
+
+    def release(self) -> None:
+        """
+        Release the raw market data and keep only the features needed by the price bounds
+
+        :return: None
+        """
+        if self.features is None and self.__item_price_graph is not None:
+            self.features = self.__extract_features(OrderBook(self.__item_price_graph))
+        self.__item_price_history = None
+        self.__item_price_graph = None
+        self.__released = True
+
+    @staticmethod
+    def __extract_features(order_book: OrderBook) -> Dict:
+        """
+        Extract the order features from the order book
+
+        :return: {'highest_buy_price': float, 'lowest_sell_price': float,
+                  'total_buy_orders': int, 'total_sell_orders': int}
+        """
+        return {
+            'highest_buy_price': order_book.highest_buy_price,
+            'lowest_sell_price': order_book.lowest_sell_price,
+            'total_buy_orders': order_book.total_buy_orders,
+            'total_sell_orders': order_book.total_sell_orders
+        }
 
 
 class CalculationFormulaWrongException(Exception):
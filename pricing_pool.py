@@ -0,0 +1,124 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, List, Iterator, Optional, Tuple
+from config import Config
+from price import Price, compile_formula, get_needed_sources, get_cached_item_nameid, fetch_shared
+from steam.api import (get_item_price_history_content, get_item_price_graph_content, parse_item_price_history,
+                       parse_item_price_graph)
+from common.variables import config, wallet
+
+logger = logging.getLogger(__name__)
+
+
+def init_process(config_object: Config) -> None:
+    """
+    Set up a pricing process, it uses the config of the parent and never reads config.json
+    """
+    config.set_object(config_object)
+
+
+def fetch_contents(job: Dict, sources: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Fetch the raw bodies of the needed sources, it runs on the I/O threads.
+    The bodies go through the shared cache and the concurrent fetches of an item are coalesced,
+    like the ones of :class:`Price`. They're cached as text apart from the parsed data, with the same ttl
+
+    :param job: {'appid': int, 'market_hash_name': str, 'currency': int}
+    :param sources: the sources from function ``get_needed_sources``
+    :return: (history body, graph body), None if the source is not needed
+    :raises (LoginCookieExpiredException, RequestException, UnknownSteamErrorException)
+    """
+    appid, market_hash_name = job['appid'], job['market_hash_name']
+    history = graph = None
+    if 'history' in sources:
+        # The history is in the currency of the account's wallet, like the one of Price
+        history = fetch_shared(
+            'history_content', appid, market_hash_name, wallet.currency,
+            lambda: get_item_price_history_content(appid, market_hash_name,
+                                                   config.steam_login_secure).decode('utf-8', errors='replace'),
+            'history')
+    if 'graph' in sources:
+        graph = fetch_shared(
+            'graph_content', appid, market_hash_name, job['currency'],
+            lambda: get_item_price_graph_content(get_cached_item_nameid(appid, market_hash_name), job['currency'],
+                                                 config.language).decode('utf-8', errors='replace'),
+            'graph')
+    return history, graph
+
+
+def price_from_contents(appid: int, market_hash_name: str, history: Optional[str], graph: Optional[str],
+                        price_setting: Dict) -> Dict:
+    """
+    Parse the raw bodies and calculate the price, it runs in the pricing processes and needs no network
+
+    :param history: the body from function ``get_item_price_history_content``, None if it's not needed
+    :param graph: the body from function ``get_item_price_graph_content``, None if it's not needed
+    :param price_setting: the price setting to calculate with
+    :return: {'sell_price': float, 'features': Dict}
+    :raises (ItemCantSellException, CalculationFormulaWrongException, ApiDoesntReturnSuccessException,
+             UnknownSteamErrorException, ApiDoesntReturnNeededParameterException, Exception)
+    """
+    config.price_setting = price_setting
+    price = Price(appid, market_hash_name, parse_item_price_history(history) if history is not None else [],
+                  parse_item_price_graph(graph) if graph is not None else {})
+    price.calculate_price()
+    return {'sell_price': price.sell_price, 'features': price.features}
+
+
+class PricingPool(object):
+    def __init__(self, processes: int = None, io_threads: int = 8):
+        """
+        Fetch the market data on I/O threads and parse it and calculate the prices in other processes,
+        so the parsing and the formula don't hold the GIL the fetching threads need.
+        Only the raw bodies go to the processes and only the prices and the features come back
+
+        :param processes: the pricing processes, the number of cores if None
+        :param io_threads: the threads fetching the market data
+        """
+        self.processes: int = processes or os.cpu_count() or 1
+        self.io_threads: int = io_threads
+        self.io_pool = ThreadPoolExecutor(io_threads, thread_name_prefix='fetch')
+        self.process_pool = ProcessPoolExecutor(self.processes, initializer=init_process,
+                                                initargs=(config.get_object(),))
+        logger.info('Price with %d processes and %d I/O threads', self.processes, io_threads)
+
+    def price_jobs(self, jobs: List[Dict]) -> Iterator[Tuple[Dict, Future]]:
+        """
+        Price the jobs with ``config.price_setting``, a job is yielded as soon as its price is done
+
+        :param jobs: List[{'appid': int, 'market_hash_name': str, 'currency': int}]
+        :return: Iterator[(job, future)], the future's result is the one of function ``price_from_contents``,
+                 or it raises the exception of the fetching or the pricing
+        """
+        sources = get_needed_sources(compile_formula(config.price_setting['calculation_formula']))
+        fetches = {self.io_pool.submit(fetch_contents, job, sources): job for job in jobs}
+        jobs_of: Dict[Future, Dict] = dict(fetches)
+        pending = set(fetches)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = jobs_of.pop(future)
+                if future in fetches and future.exception() is None:
+                    history, graph = future.result()
+                    pricing = self.process_pool.submit(price_from_contents, job['appid'], job['market_hash_name'],
+                                                       history, graph, config.price_setting)
+                    jobs_of[pricing] = job
+                    pending.add(pricing)
+                else:
+                    yield job, future
+
+    def close(self) -> None:
+        self.io_pool.shutdown(cancel_futures=True)
+        self.process_pool.shutdown(cancel_futures=True)
+
+
+def get_pricing_pool() -> Optional[PricingPool]:
+    """
+    Get the pricing pool set in the config
+
+    :return: :class:`PricingPool`, None if it's disabled
+    """
+    if not config.process_pool['enable']:
+        return None
+    return PricingPool(config.process_pool['processes'], config.process_pool['io_threads'])
@@ -0,0 +1,93 @@
+from typing import List, Dict
+from time import monotonic
+from item import Item
+from common.cache import load_json_cache, save_json_cache
+from common import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+LAST_PRICES_CACHE = 'last_prices.json'
+
+# Foil cards first, then the other items like backgrounds and emoticons, normal cards last
+TYPE_RANK = {
+    21: 2,
+    20: 0
+}
+
+
+def load_last_prices() -> Dict[str, float]:
+    """
+    Load the last known selling prices
+
+    :return: {'appid/market_hash_name': sell_price}
+    """
+    return load_json_cache(LAST_PRICES_CACHE)
+
+
+def save_last_prices(last_prices: Dict[str, float]) -> None:
+    """
+    Save the last known selling prices
+
+    :param last_prices: the prices from function ``load_last_prices``
+    :return: None
+    """
+    save_json_cache(LAST_PRICES_CACHE, last_prices)
+
+
+def estimate_value(item: Item, last_prices: Dict[str, float]) -> float:
+    """
+    Estimate the item's value without any request: the last known price,
+    or the middle of the configured price bounds of its class
+
+    :param item: :class:`Item`
+    :param last_prices: the prices from function ``load_last_prices``
+    :return: the expected selling price, 0.0 if unknown
+    """
+    last_price = last_prices.get('%d/%s' % (item.appid, item.market_hash_name))
+    if last_price is not None:
+        return last_price
+    lowest_price, highest_price = item.get_price_bounds()
+    if lowest_price is not None and highest_price is not None:
+        return (lowest_price + highest_price) / 2
+    return lowest_price if lowest_price is not None else 0.0
+
+
+def prioritize(items: List[Item], last_prices: Dict[str, float]) -> List[Item]:
+    """
+    Sort the items in descending expected value, so the valuable items are listed before the budget runs out
+
+    :param items: the items from function ``retrieve_items``
+    :param last_prices: the prices from function ``load_last_prices``
+    :return: the sorted items
+    """
+    return sorted(items, key=lambda item: (estimate_value(item, last_prices), TYPE_RANK.get(item.type1, 1)),
+                  reverse=True)
+
+
+class Budget(object):
+    def __init__(self, seconds: int = None, requests: int = None):
+        """
+        The wall-clock and request budget of a run
+
+        :param seconds: the max seconds of the run, None means no limit
+        :param requests: the max requests of the run, None means no limit
+        """
+        self.seconds: int = seconds
+        self.requests: int = requests
+        self.start_time: float = monotonic()
+        self.start_requests: int = metrics.get('requests')
+
+    def exhausted(self) -> bool:
+        """
+        Judge the budget is used up
+
+        :return: Used up = True
+        """
+        if self.seconds is not None and monotonic() - self.start_time >= self.seconds:
+            logger.warning('The time budget: %d seconds is used up', self.seconds)
+            return True
+        if self.requests is not None and metrics.get('requests') - self.start_requests >= self.requests:
+            logger.warning('The request budget: %d requests is used up', self.requests)
+            return True
+        return False
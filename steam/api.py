@@ -1,16 +1,26 @@
 import re
 from typing import List, Dict
-from common.request import requests_get, requests_post
+from common.request import requests_get, requests_post, search_in_stream
 from json import loads, JSONDecodeError
 from steam.exceptions import *
-from common.common import parse_datetime
+from common.common import parse_datetime, Truncated
+from common.singleflight import coalesce
+from steam.guard import ConfirmationKeyGenerator
 from wallet import Wallet
+from time import time
 import logging
 from urllib.parse import quote
+from requests import Response
 
 
 logger = logging.getLogger(__name__)
 
+WALLET_INFO_PATTERN = re.compile(rb'var g_rgWalletInfo = {.*}')
+ITEM_NAMEID_PATTERN = re.compile(rb'Market_LoadOrderSpread\(\s*\d+\s*\)')
+MOBILECONF_URL = 'https://steamcommunity.com/mobileconf'
+QUERY_TIME_URL = 'https://api.steampowered.com/ITwoFactorService/QueryTime/v0001'
+CONFIRMATION_TYPE_MARKET_LISTING = 3
+
 
 def get_inventory(steam_id: str, app_id: int, context_id: str, language: str, steam_login_secure: str = None,
                   assets: List[Dict] = None, descriptions: List[Dict] = None) -> (List[Dict], List[Dict]):
@@ -44,36 +54,38 @@ def get_inventory(steam_id: str, app_id: int, context_id: str, language: str, st
         cookies = {
             'steamLoginSecure': steam_login_secure
         }
-        rp = requests_get(url=url, cookies=cookies, params=params)
+        rp = requests_get(endpoint='inventory', url=url, cookies=cookies, params=params)
         if rp.status_code == 403:  # When the user's inventory is private
-            logger.error("User: %s inventory is private" % steam_id)
+            logger.error("User: %s inventory is private", steam_id)
             raise InventoryPrivateException("the user's inventory you request is private.")
         try:
             data = loads(rp.text)  # TODO: vpn断开连接时可能导致数据传输不完整
         except JSONDecodeError:
             logger.error("The steam didn't response right content when get_inventory")
-            logger.debug(rp.content)
+            logger.debug('%s', Truncated(rp))
             raise UnknownSteamErrorException("The steam didn't response right content")
         if not data or data.get('success', 0) != 1:  # Error when steam getting inventory
             logger.error("The get_inventory API doesn't return a right response.")
-            logger.debug(data)
+            logger.debug('%s', Truncated(data))
             raise ApiDoesntReturnSuccessException("The get_inventory API doesn't return a right response.")
         assets += data.get('assets', [])
         descriptions += data.get('descriptions', [])
         if not data.get('more_items', False):  # If the total number of items is less than 5000
-            logger.info('Success to get user: %s inventory' % steam_id)
-            logger.debug('assets length: %d' % len(assets))
+            logger.info('Success to get user: %s inventory', steam_id)
+            logger.debug('assets length: %d', len(assets))
             return assets, descriptions
         try:
             last_asset_id = data.get('last_assetid')
         except KeyError:
             # When the api doesn't response the last item's asset id
             logger.error("The get_inventory API doesn't give last_assetid when returning more_items.")
-            logger.debug(data)
+            logger.debug('%s', Truncated(data))
             raise ApiDoesntReturnNeededParameterException("The get_inventory API doesn't give "
                                                           "last_assetid when returning more_items.")
 
 
+# The cookie is left out of the key, so it never sits in the calls in flight
+@coalesce('history', key=lambda appid, market_hash_name, *args, **kwargs: (appid, market_hash_name))
 def get_item_price_history(appid: int, market_hash_name: str, steam_login_secure: str) -> List[List]:
     """
     Get item history sales
@@ -86,6 +98,20 @@ def get_item_price_history(appid: int, market_hash_name: str, steam_login_secure
     :raises (LoginCookieExpiredException, ApiDoesntReturnSuccessException, RequestException, UnknownSteamErrorException,
              ApiDoesntReturnNeededParameterException)
     """
+    return parse_item_price_history(get_item_price_history_content(appid, market_hash_name, steam_login_secure))
+
+
+@coalesce('history_content', key=lambda appid, market_hash_name, *args, **kwargs: (appid, market_hash_name))
+def get_item_price_history_content(appid: int, market_hash_name: str, steam_login_secure: str) -> bytes:
+    """
+    Get the raw body of the item's history sales, parsed by function ``parse_item_price_history``
+
+    :param appid: The app's id which the item belows to
+    :param market_hash_name: The value of the item's market_hash_name
+    :param steam_login_secure: The cookie of the browser that has logged in to the steam account
+    :return: the json body
+    :raises (LoginCookieExpiredException, RequestException)
+    """
     url = 'https://steamcommunity.com/market/pricehistory/'
     params = {
         'appid': appid,
@@ -94,26 +120,37 @@ def get_item_price_history(appid: int, market_hash_name: str, steam_login_secure
     cookies = {
         'steamLoginSecure': steam_login_secure
     }
-    rp = requests_get(url=url, cookies=cookies, params=params)
+    rp = requests_get(endpoint='pricehistory', url=url, cookies=cookies, params=params)
     if rp.status_code == 400:  # When steam_login_secure is wrong
         logger.error("The steam cookie is expired")
         raise LoginCookieExpiredException
+    return rp.content
+
+
+def parse_item_price_history(content: bytes) -> List[List]:
+    """
+    Parse the body from function ``get_item_price_history_content``, it needs no network
+
+    :param content: the json body
+    :return: List[List[datetime, float, int]]
+    :raises (ApiDoesntReturnSuccessException, UnknownSteamErrorException, ApiDoesntReturnNeededParameterException)
+    """
     try:
-        data = loads(rp.text)  # TODO: vpn断开连接时可能导致数据传输不完整
-    except JSONDecodeError:
+        data = loads(content)  # TODO: vpn断开连接时可能导致数据传输不完整
+    except (JSONDecodeError, UnicodeDecodeError):
         logger.error("The steam didn't response right content when get_item_price_history")
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(content))
         raise UnknownSteamErrorException("The steam didn't response right content")
     if not data or not data.get('success', False):  # Error when steam getting price history
         logger.error("The get_item_price_history API doesn't return a right response.")
-        logger.debug(data)
+        logger.debug('%s', Truncated(data))
         raise ApiDoesntReturnSuccessException("The get_item_price_history API doesn't return a right response.")
     try:
         prices = data['prices']
     except KeyError:
         # The API's response doesn't contain history price info
         logger.error("The get_item_price_history API doesn't return history price info")
-        logger.debug(data)
+        logger.debug('%s', Truncated(data))
         raise ApiDoesntReturnNeededParameterException("The get_item_price_history API doesn't"
                                                       " return history price info")
     count = 0
@@ -126,7 +163,7 @@ def get_item_price_history(appid: int, market_hash_name: str, steam_login_secure
             if count > 10 or len(price) < 200:
                 # If there are too much error data when parsing history price info then raise an exception
                 logger.error("The get_item_price_history API returns too many errors")
-                logger.debug(data)
+                logger.debug('%s', Truncated(data))
                 raise ApiDoesntReturnNeededParameterException("The get_item_price_history API returns too many errors")
             else:
                 pass
@@ -147,20 +184,21 @@ def get_wallet_fee_info(steam_login_secure: str, steam_id: str) -> Wallet:
     cookies = {
         'steamLoginSecure': steam_login_secure,
     }
-    rp = requests_get(url=url, cookies=cookies)
+    rp = requests_get(endpoint='wallet', url=url, cookies=cookies, stream=True)
     if rp.status_code != 200:
         logger.error("Error when getting wallet fee info")
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(rp))
         raise UnknownSteamErrorException("Error when getting wallet fee info")
+    # The wallet info is in js code, stop reading the page once it's found
+    match = search_in_stream(rp, WALLET_INFO_PATTERN, 'bytes_read.get_wallet_fee_info')
     try:
-        wallet_info = loads(re.search(r'var g_rgWalletInfo = {.*}', rp.text, re.ASCII)[0].split('=')[1])
-    except IndexError:
+        wallet_info = loads(match[0].decode('ascii').split('=', 1)[1])
+    except (TypeError, IndexError, JSONDecodeError):
         logger.error("Didn't get the right wallet info. Maybe cookie expired")
-        logger.debug(rp.text)
         raise UnknownSteamErrorException("Didn't get the right wallet info. Maybe cookie expired")
     if not wallet_info.get('success', False):  # If the cookie is expired, steam will return false in 'success'
         logger.error("The steam cookie is expired")
-        logger.debug(wallet_info)
+        logger.debug('%s', Truncated(wallet_info))
         raise LoginCookieExpiredException
     try:
         logger.debug("Success to get wallet_info")
@@ -169,10 +207,11 @@ def get_wallet_fee_info(steam_login_secure: str, steam_id: str) -> Wallet:
                       float(wallet_info.get('wallet_publisher_fee_percent_default', 0.1)))
     except ValueError:
         logger.error("Didn't get the right wallet info.")
-        logger.debug(wallet_info)
+        logger.debug('%s', Truncated(wallet_info))
         raise UnknownSteamErrorException("Didn't get the right wallet info.")
 
 
+@coalesce('nameid')
 def get_item_nameid(appid: int, market_hash_name: str) -> int:
     """
     Get the item's item_nameid which is needed in function ``get_item_price_graph``
@@ -184,20 +223,21 @@ def get_item_nameid(appid: int, market_hash_name: str) -> int:
     :raises (UnknownSteamErrorException, RequestException)
     """
     url = 'https://steamcommunity.com/market/listings/%d/%s' % (appid, quote(market_hash_name))
-    rp = requests_get(url=url)
+    rp = requests_get(endpoint='listings', url=url, stream=True)
     if rp.status_code != 200:
         logger.error("Error when getting item_nameid")
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(rp))
         raise UnknownSteamErrorException('Error when getting item_nameid')
+    # The item_nameid is in js code so I just use regex, and stop reading the page once it's found
+    match = search_in_stream(rp, ITEM_NAMEID_PATTERN, 'bytes_read.get_item_nameid')
     try:
-        # The item_nameid is in js code so I just use regex
-        return int(re.search(r'Market_LoadOrderSpread\(\s*\d+\s*\)', rp.text, re.ASCII)[0].split()[1])
-    except TypeError:
+        return int(match[0].split()[1])
+    except (TypeError, IndexError):
         logger.error("Error when getting item_nameid")
-        logger.debug(rp.text)
         raise UnknownSteamErrorException('Error when getting item_nameid')
 
 
+@coalesce('graph')
 def get_item_price_graph(item_nameid: int, currency: int, language: str = 'english') -> Dict:
     """
     Get the item's price graph
@@ -210,26 +250,51 @@ def get_item_price_graph(item_nameid: int, currency: int, language: str = 'engli
      'sell_order_graph': List[List[(float)price, (int)amount, (str)comment]]}}
     :raises (UnknownSteamErrorException, RequestException, ApiDoesntReturnSuccessException)
     """
+    return parse_item_price_graph(get_item_price_graph_content(item_nameid, currency, language))
+
+
+@coalesce('graph_content')
+def get_item_price_graph_content(item_nameid: int, currency: int, language: str = 'english') -> bytes:
+    """
+    Get the raw body of the item's price graph, parsed by function ``parse_item_price_graph``
+
+    :param item_nameid: item_nameid from function ``get_item_nameid``
+    :param currency: user's steam account wallet currency number
+    :param language: Preferred language
+    :return: the json body
+    :raises (UnknownSteamErrorException, RequestException)
+    """
     url = 'https://steamcommunity.com/market/itemordershistogram'
     params = {
         'item_nameid': item_nameid,
         'language': language,
         'currency': currency
     }
-    rp = requests_get(url=url, params=params)
+    rp = requests_get(endpoint='itemordershistogram', url=url, params=params)
     if rp.status_code != 200:
         logger.error("Error when getting item price graph")
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(rp))
         raise UnknownSteamErrorException('Error when getting item price graph')
+    return rp.content
+
+
+def parse_item_price_graph(content: bytes) -> Dict:
+    """
+    Parse the body from function ``get_item_price_graph_content``, it needs no network
+
+    :param content: the json body
+    :return: the price graph like function ``get_item_price_graph`` returns
+    :raises (UnknownSteamErrorException, ApiDoesntReturnSuccessException)
+    """
     try:
-        data = loads(rp.text)  # TODO: vpn断开连接时可能导致数据传输不完整
-    except JSONDecodeError:
+        data = loads(content)  # TODO: vpn断开连接时可能导致数据传输不完整
+    except (JSONDecodeError, UnicodeDecodeError):
         logger.error("The steam didn't response right content when get_item_price_graph")
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(content))
         raise UnknownSteamErrorException("The steam didn't response right content")
     if not data or data.get('success', 0) != 1:  # Error when steam getting inventory
         logger.error("The get_item_price_graph API doesn't return a right response.")
-        logger.debug(data)
+        logger.debug('%s', Truncated(data))
         raise ApiDoesntReturnSuccessException("The get_item_price_graph API doesn't return a right response.")
     try:
         return {
@@ -242,10 +307,132 @@ def get_item_price_graph(item_nameid: int, currency: int, language: str = 'engli
         }
     except ValueError:
         logger.error("Didn't get the right price graph.")
-        logger.debug(data)
+        logger.debug('%s', Truncated(data))
         raise UnknownSteamErrorException("Didn't get the right price graph.")
 
 
+def get_market_search_results(appid: int, start: int = 0, count: int = 100, query: str = '',
+                              filters: Dict = None, language: str = 'english') -> (int, List[Dict]):
+    """
+    Get a page of the market summaries of an app, up to 100 items in one request
+
+    :param appid: The app's id you want to search
+    :param start: The index of the first result
+    :param count: The number of results, 100 at most
+    :param query: The search text
+    :param filters: The extra search filters, e.g. {'category_753_Game[]': 'tag_app_440'}
+    :param language: Preferred language
+    :return: (total_count, List[{'market_hash_name': str, 'sell_listings': int, 'sell_price': float}]),
+             the sell_price is the lowest listing price in USD
+    :raises (UnknownSteamErrorException, RequestException, ApiDoesntReturnSuccessException)
+    """
+    url = 'https://steamcommunity.com/market/search/render/'
+    params = {
+        'appid': appid,
+        'start': start,
+        'count': count,
+        'query': query,
+        'search_descriptions': 0,
+        'sort_column': 'name',
+        'sort_dir': 'asc',
+        'norender': 1,
+        'l': language
+    }
+    if filters:
+        params.update(filters)
+    rp = requests_get(endpoint='search', url=url, params=params)
+    if rp.status_code != 200:
+        logger.error("Error when getting market search results")
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException('Error when getting market search results')
+    try:
+        data = loads(rp.text)
+    except JSONDecodeError:
+        logger.error("The steam didn't response right content when get_market_search_results")
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException("The steam didn't response right content")
+    if not data or not data.get('success', False):
+        logger.error("The get_market_search_results API doesn't return a right response.")
+        logger.debug('%s', Truncated(data))
+        raise ApiDoesntReturnSuccessException("The get_market_search_results API doesn't return a right response.")
+    try:
+        return int(data['total_count']), [{
+            'market_hash_name': result['hash_name'],
+            'sell_listings': int(result['sell_listings']),
+            'sell_price': int(result['sell_price']) / 100
+        } for result in data['results']]
+    except (KeyError, TypeError, ValueError):
+        logger.error("Didn't get the right market search results.")
+        logger.debug('%s', Truncated(data))
+        raise UnknownSteamErrorException("Didn't get the right market search results.")
+
+
+def get_my_listings(steam_login_secure: str, start: int = 0, count: int = 100,
+                    language: str = 'english') -> (int, List[Dict]):
+    """
+    Get a page of the account's market listings, up to 100 active listings in one request.
+    The listings on hold and to confirm are not paged, they are returned with the first page
+
+    :param steam_login_secure: The cookie of the browser that has logged in to the steam account
+    :param start: The index of the first active listing
+    :param count: The number of active listings, 100 at most
+    :param language: Preferred language
+    :return: (total_count of the active listings, List[{'listingid': str, 'appid': int, 'contextid': str,
+             'assetid': str, 'unowned_assetid': str, 'market_hash_name': str, 'price': float,
+             'state': 'active' | 'on_hold' | 'to_confirm'}]), the price is what the buyer pays
+    :raises (LoginCookieExpiredException, UnknownSteamErrorException, RequestException,
+             ApiDoesntReturnSuccessException)
+    """
+    url = 'https://steamcommunity.com/market/mylistings/render/'
+    params = {
+        'query': '',
+        'start': start,
+        'count': count,
+        'norender': 1,
+        'l': language
+    }
+    cookies = {
+        'steamLoginSecure': steam_login_secure
+    }
+    rp = requests_get(endpoint='mylistings', url=url, params=params, cookies=cookies)
+    if rp.status_code in (400, 401, 403):  # When steam_login_secure is wrong
+        logger.error("The steam cookie is expired")
+        raise LoginCookieExpiredException
+    if rp.status_code != 200:
+        logger.error("Error when getting my market listings")
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException('Error when getting my market listings')
+    try:
+        data = loads(rp.text)
+    except JSONDecodeError:
+        logger.error("The steam didn't response right content when get_my_listings")
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException("The steam didn't response right content")
+    if not data or not data.get('success', False):
+        logger.error("The get_my_listings API doesn't return a right response.")
+        logger.debug('%s', Truncated(data))
+        raise ApiDoesntReturnSuccessException("The get_my_listings API doesn't return a right response.")
+    groups = [('active', data.get('listings') or [])]
+    if start == 0:
+        groups.append(('on_hold', data.get('listings_on_hold') or []))
+        groups.append(('to_confirm', data.get('listings_to_confirm') or []))
+    try:
+        return int(data['total_count']), [{
+            'listingid': str(listing['listingid']),
+            'appid': int(listing['asset']['appid']),
+            'contextid': str(listing['asset']['contextid']),
+            'assetid': str(listing['asset']['id']),
+            'unowned_assetid': str(listing['asset'].get('unowned_id', '')),
+            'market_hash_name': listing['asset']['market_hash_name'],
+            'price': (int(listing['price']) + int(listing['fee'])) / 100,
+            'state': state
+        } for state, listings in groups for listing in listings]
+    except (KeyError, TypeError, ValueError):
+        logger.error("Didn't get the right market listings.")
+        logger.debug('%s', Truncated(data))
+        raise UnknownSteamErrorException("Didn't get the right market listings.")
+
+
 def sell_item_on_market(steam_login_secure: str, steam_id: str, app_id: int, context_id: str,
                         assetid: str, amount: str, price: int, language: str = 'english') -> Dict:
     """
@@ -281,17 +468,148 @@ def sell_item_on_market(steam_login_secure: str, steam_id: str, app_id: int, con
         'sessionid': '000000000000000000000000',
         'Steam_Language': language
     }
-    rp = requests_post(url=url, headers=headers, data=data, cookies=cookies)
+    rp = requests_post(endpoint='sellitem', url=url, headers=headers, data=data, cookies=cookies)
     if rp.status_code != 200:
         logger.error('Error when listing item on market')
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(rp))
         raise UnknownSteamErrorException('Error when listing item on market')
     try:
         data = loads(rp.text)  # TODO: vpn断开连接时可能导致数据传输不完整
     except JSONDecodeError:
         logger.error("The steam didn't response right content when sell_item_on_market")
-        logger.debug(rp.content)
+        logger.debug('%s', Truncated(rp))
         raise UnknownSteamErrorException("The steam didn't response right content")
     if not data:
         raise ApiDoesntReturnSuccessException("The sell_item_on_market API doesn't return a right response.")
     return data
+
+
+def get_steam_time_offset() -> int:
+    """
+    Get the offset of the steam server time to the local time, the confirmation keys are signed with the server time
+
+    :return: the seconds to add to the local time
+    :raises (UnknownSteamErrorException, RequestException)
+    """
+    rp = requests_post(endpoint='querytime', url=QUERY_TIME_URL, data={'steamid': '0'})
+    try:
+        server_time = int(loads(rp.text)['response']['server_time'])
+    except (JSONDecodeError, KeyError, TypeError, ValueError):
+        logger.error("Didn't get the steam server time")
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException("Didn't get the steam server time")
+    return server_time - int(time())
+
+
+def get_confirmations(steam_login_secure: str, steam_id: str, device_id: str,
+                      key_generator: ConfirmationKeyGenerator, url: str = MOBILECONF_URL,
+                      time_offset: int = 0) -> List[Dict]:
+    """
+    Get all the confirmations waiting on the steam guard mobile app in one request
+
+    :param steam_login_secure: The cookie of the browser that has logged in to the steam account
+    :param steam_id: The steam id logged in
+    :param device_id: The steam guard device id
+    :param key_generator: :class:`ConfirmationKeyGenerator`
+    :param url: The confirmation endpoint
+    :param time_offset: the offset from function ``get_steam_time_offset``
+    :return: List[{'id': str, 'nonce': str, 'type': int, 'creator_id': str}],
+             the creator_id of a market listing confirmation is the listingid
+    :raises (LoginCookieExpiredException, UnknownSteamErrorException, RequestException,
+             ApiDoesntReturnSuccessException)
+    """
+    rp = requests_get(endpoint='mobileconf', url=url + '/getlist',
+                      params=__get_confirmation_params(steam_id, device_id, key_generator, 'list', time_offset),
+                      cookies=__get_confirmation_cookies(steam_login_secure, steam_id))
+    data = __load_confirmation_response(rp, 'get_confirmations')
+    try:
+        return [{
+            'id': str(confirmation['id']),
+            'nonce': str(confirmation['nonce']),
+            'type': int(confirmation['type']),
+            'creator_id': str(confirmation['creator_id'])
+        } for confirmation in data.get('conf') or []]
+    except (KeyError, TypeError, ValueError):
+        logger.error("Didn't get the right confirmations.")
+        logger.debug('%s', Truncated(data))
+        raise UnknownSteamErrorException("Didn't get the right confirmations.")
+
+
+def accept_confirmations(steam_login_secure: str, steam_id: str, device_id: str,
+                         key_generator: ConfirmationKeyGenerator, confirmations: List[Dict],
+                         url: str = MOBILECONF_URL, time_offset: int = 0) -> None:
+    """
+    Accept several confirmations in one request
+
+    :param steam_login_secure: The cookie of the browser that has logged in to the steam account
+    :param steam_id: The steam id logged in
+    :param device_id: The steam guard device id
+    :param key_generator: :class:`ConfirmationKeyGenerator`
+    :param confirmations: the confirmations from function ``get_confirmations``
+    :param url: The confirmation endpoint
+    :param time_offset: the offset from function ``get_steam_time_offset``
+    :return: None
+    :raises (LoginCookieExpiredException, UnknownSteamErrorException, RequestException,
+             ApiDoesntReturnSuccessException)
+    """
+    data = list(__get_confirmation_params(steam_id, device_id, key_generator, 'allow', time_offset).items())
+    data.append(('op', 'allow'))
+    data.extend(('cid[]', confirmation['id']) for confirmation in confirmations)
+    data.extend(('ck[]', confirmation['nonce']) for confirmation in confirmations)
+    rp = requests_post(endpoint='mobileconf', url=url + '/multiajaxop', data=data,
+                       cookies=__get_confirmation_cookies(steam_login_secure, steam_id))
+    __load_confirmation_response(rp, 'accept_confirmations')
+
+
+def __get_confirmation_params(steam_id: str, device_id: str, key_generator: ConfirmationKeyGenerator,
+                              tag: str, time_offset: int = 0) -> Dict:
+    """
+    :param time_offset: the seconds to add to the local time to get the steam server time
+    :return: the params which sign a confirmation request
+    """
+    timestamp = int(time()) + time_offset
+    return {
+        'p': device_id,
+        'a': steam_id,
+        'k': key_generator.generate_key(tag, timestamp),
+        't': timestamp,
+        'm': 'react',
+        'tag': tag
+    }
+
+
+def __get_confirmation_cookies(steam_login_secure: str, steam_id: str) -> Dict:
+    return {
+        'steamLoginSecure': steam_login_secure,
+        'steamid': steam_id,
+        'mobileClient': 'android',
+        'mobileClientVersion': '777777 3.6.4'
+    }
+
+
+def __load_confirmation_response(rp: Response, api_name: str) -> Dict:
+    """
+    :raises (LoginCookieExpiredException, UnknownSteamErrorException, ApiDoesntReturnSuccessException)
+    """
+    if rp.status_code in (401, 403):  # When steam_login_secure is wrong
+        logger.error("The steam cookie is expired")
+        raise LoginCookieExpiredException
+    if rp.status_code != 200:
+        logger.error('Error when calling %s', api_name)
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException('Error when calling %s' % api_name)
+    try:
+        data = loads(rp.text)
+    except JSONDecodeError:
+        logger.error("The steam didn't response right content when %s", api_name)
+        logger.debug('%s', Truncated(rp))
+        raise UnknownSteamErrorException("The steam didn't response right content")
+    if data.get('needauth', False):  # The session of the cookie is gone
+        logger.error("The steam cookie is expired")
+        raise LoginCookieExpiredException
+    if not data.get('success', False):
+        # A wrong key or device id is rejected without a reason
+        logger.error("The %s API doesn't return a right response. Message: %s", api_name, data.get('message', ''))
+        logger.debug('%s', Truncated(data))
+        raise ApiDoesntReturnSuccessException("The %s API doesn't return a right response." % api_name)
+    return data
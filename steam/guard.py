@@ -0,0 +1,45 @@
+import hmac
+import struct
+from abc import ABC, abstractmethod
+from base64 import b64decode, b64encode
+from hashlib import sha1
+
+
+class ConfirmationKeyGenerator(ABC):
+    """
+    Generate the keys which sign the mobile confirmation requests.
+    Subclass it to get the keys from somewhere else, e.g. an authenticator service
+    """
+
+    @abstractmethod
+    def generate_key(self, tag: str, timestamp: int) -> str:
+        """
+        :param tag: the action the key is for, e.g. 'list', 'allow'
+        :param timestamp: the steam server time in seconds
+        :return: the base64 key
+        """
+
+
+class IdentitySecretKeyGenerator(ConfirmationKeyGenerator):
+    def __init__(self, identity_secret: str):
+        """
+        Generate the keys like the steam mobile app does
+
+        :param identity_secret: the identity_secret of the steam guard, base64
+        """
+        self.__identity_secret: bytes = b64decode(identity_secret)
+
+    def generate_key(self, tag: str, timestamp: int) -> str:
+        message = struct.pack('>Q', timestamp) + tag.encode('ascii')[:32]
+        return b64encode(hmac.new(self.__identity_secret, message, sha1).digest()).decode('ascii')
+
+
+def generate_device_id(steam_id: str) -> str:
+    """
+    Derive the steam guard device id from the steam id, like the steam guard tools do
+
+    :param steam_id: Steam id
+    :return: 'android:xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx'
+    """
+    digest = sha1(steam_id.encode('ascii')).hexdigest()
+    return 'android:%s-%s-%s-%s-%s' % (digest[:8], digest[8:12], digest[12:16], digest[16:20], digest[20:32])
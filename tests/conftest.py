@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config, config as lazy_config  # noqa: E402
+
+STEAM_ID = '76561198000000000'
+
+
+def make_config(**config_data) -> Config:
+    """
+    Build a config in memory, no config.json is read
+
+    :param config_data: the keys over the minimal config
+    :return: :class:`Config`
+    """
+    data = {
+        'steam_login_secure': STEAM_ID + '%7C%7Ctest',
+        'steam_id': STEAM_ID,
+        'price_setting': {'calculation_formula': 'lowest_sell_price', 'other_item': {}}
+    }
+    data.update(config_data)
+    return Config(data)
+
+
+@pytest.fixture
+def config():
+    lazy_config.set_object(make_config())
+    return lazy_config
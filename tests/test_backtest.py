@@ -0,0 +1,59 @@
+from random import Random
+import numpy as np
+import pytest
+from backtest import HistoryArrays, calculate_fees
+from common.variables import wallet
+from wallet import Wallet
+
+HOUR = 3600
+
+
+@pytest.fixture
+def history():
+    rng = Random(1)
+    records = [[1000000.0 + i * HOUR * rng.uniform(0.5, 1.5), round(rng.uniform(0.1, 3.0), 2), rng.randint(1, 9)]
+               for i in range(500)]
+    records.sort(key=lambda record: record[0])
+    points = np.arange(records[0][0] - 10 * HOUR, records[-1][0] + 10 * HOUR, 7 * HOUR, dtype=np.float64)
+    return records, points
+
+
+def known(records, point, hours):
+    """The records in the hours before the time point, like Price sees them at that time"""
+    return [record for record in records if point - hours * HOUR <= record[0] <= point]
+
+
+@pytest.mark.parametrize('hours', [0, 1, 24, 168, 100000])
+def test_the_history_helpers_match_a_linear_scan(history, hours):
+    records, points = history
+    arrays = HistoryArrays(records, points)
+    sales = arrays.get_history_sales_num(hours)
+    average = arrays.get_history_average_price(hours)
+    highest = arrays.get_history_highest_price(hours)
+    for i, point in enumerate(points):
+        window = known(records, point, hours)
+        assert sales[i] == sum(record[2] for record in window)
+        assert highest[i] == max((record[1] for record in window), default=0.0)
+        if window:
+            expected = sum(record[1] * record[2] for record in window) / sum(record[2] for record in window)
+            assert average[i] == pytest.approx(expected)
+        else:
+            assert np.isnan(average[i])
+
+
+def test_the_future_highest_price(history):
+    records, points = history
+    future = HistoryArrays(records, points).get_future_highest_price(48)
+    for i, point in enumerate(points):
+        assert future[i] == max((record[1] for record in records if point < record[0] <= point + 48 * HOUR),
+                                default=0.0)
+
+
+def test_the_fees_match_the_wallet(config):
+    wallet.set_object(Wallet(wallet_fee_base=0, wallet_fee_percent=0.05, wallet_fee_minimum=1, currency=1,
+                             wallet_publisher_fee_percent_default=0.1))
+    prices = np.array([0.03, 0.25, 1.0, 1.0, 12.34, 250.0])
+    for publisher_fee in (None, 0.1, 0.2):
+        fees = calculate_fees(prices, publisher_fee)
+        assert list(fees) == [wallet.calculate_fee(price, publisher_fee) / 100 for price in prices]
+    assert (calculate_fees(prices, 0.2) > calculate_fees(prices, 0.1)).any()
@@ -0,0 +1,77 @@
+import pytest
+from checkpoint import Checkpoint, LISTING, LISTED
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'checkpoint.jsonl')
+    checkpoint = Checkpoint(path)
+    checkpoint.start([{'assetid': '1'}, {'assetid': '2'}], [], 1.0)
+    checkpoint.record_price('753/Card', 1.5)
+    checkpoint.record_asset('1', LISTED)
+    checkpoint.close()
+    return path
+
+
+def test_load(path):
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load()
+    assert checkpoint.prices == {'753/Card': 1.5}
+    assert checkpoint.assets == {'1': LISTED}
+    assert checkpoint.resume() == ([{'assetid': '1'}, {'assetid': '2'}], [])
+
+
+def test_resume_after_a_torn_last_line(path):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "asset", "assetid": "2", "sta')
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load()
+    assert checkpoint.assets == {'1': LISTED}
+    checkpoint.resume()
+    checkpoint.record_asset('2', LISTING)
+    checkpoint.close()
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load()
+    assert checkpoint.assets == {'1': LISTED, '2': LISTING}
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read().endswith('{"type": "asset", "assetid": "2", "state": "listing"}\n')
+
+
+def test_a_torn_multibyte_character_is_dropped(path):
+    with open(path, 'ab') as f:
+        f.write('{"type": "price", "key": "753/卡'.encode('utf-8')[:-1])
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load()
+    checkpoint.resume()
+    checkpoint.record_price('753/卡', 2.0)
+    checkpoint.close()
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load()
+    assert checkpoint.prices == {'753/Card': 1.5, '753/卡': 2.0}
+
+
+@pytest.mark.parametrize('line', ['{"no_type": 1}', '42', '{"type": "price"}', '[]'])
+def test_a_record_in_a_wrong_format_is_dropped(path, line):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+    checkpoint = Checkpoint(path)
+    assert checkpoint.load()
+    assert checkpoint.prices == {'753/Card': 1.5}
+    assert checkpoint.assets == {'1': LISTED}
+
+
+def test_a_checkpoint_without_the_inventory_is_ignored(tmp_path):
+    path = tmp_path / 'checkpoint.jsonl'
+    path.write_text('{"type": "asset", "assetid": "1", "state": "listed"}\n', encoding='utf-8')
+    checkpoint = Checkpoint(str(path))
+    assert not checkpoint.load()
+    assert checkpoint.assets == {}
+
+
+def test_finished_run_removes_the_checkpoint(path):
+    checkpoint = Checkpoint(path)
+    checkpoint.load()
+    checkpoint.resume()
+    checkpoint.close(finished=True)
+    assert not Checkpoint(path).load()
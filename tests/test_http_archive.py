@@ -0,0 +1,57 @@
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+from common.http_archive import HttpArchive, RECORD, REPLAY
+
+URL = 'https://steamcommunity.com/market/pricehistory/'
+
+
+def make_response(status: int, body: bytes) -> requests.Response:
+    rp = requests.Response()
+    rp.status_code = status
+    rp.headers = CaseInsensitiveDict({'Content-Type': 'application/json; charset=utf-8',
+                                      'Set-Cookie': 'sessionid=secret', 'Content-Encoding': 'gzip'})
+    rp._content = body
+    return rp
+
+
+@pytest.fixture
+def path(tmp_path, config):
+    path = str(tmp_path / 'archive.sqlite3')
+    archive = HttpArchive(path, RECORD, ignored_params={'_'})
+    key = archive.get_key('GET', URL, {'appid': 753, 'market_hash_name': 'Card', '_': 1})
+    archive.record('pricehistory', key, make_response(429, b''))
+    archive.record('pricehistory', key, make_response(200, b'{"success": true}'))
+    return path
+
+
+def test_the_responses_are_replayed_in_order(path):
+    archive = HttpArchive(path, REPLAY, ignored_params={'_'})
+    # The params are sorted and the ignored ones are left out of the key
+    key = archive.get_key('GET', URL + '?market_hash_name=Card', {'_': 2, 'appid': 753})
+    first, second, third = archive.replay(key), archive.replay(key), archive.replay(key)
+    assert first.status_code == 429
+    assert second.status_code == 200 and second.json() == {'success': True}
+    # The last response is repeated after they're used up
+    assert third.status_code == 200 and third.content == second.content
+    assert b''.join(second.iter_content(4)) == b'{"success": true}'
+
+
+def test_the_cookies_and_the_encoding_are_not_written(path):
+    archive = HttpArchive(path, REPLAY, ignored_params={'_'})
+    rp = archive.replay(archive.get_key('GET', URL, {'appid': 753, 'market_hash_name': 'Card'}))
+    assert 'Set-Cookie' not in rp.headers and 'Content-Encoding' not in rp.headers
+    assert rp.encoding == 'utf-8'
+
+
+def test_a_request_not_in_the_archive_raises(path):
+    archive = HttpArchive(path, REPLAY)
+    with pytest.raises(requests.exceptions.RequestException):
+        archive.replay(archive.get_key('GET', URL, {'appid': 440}))
+
+
+def test_record_clears_the_last_run(path):
+    HttpArchive(path, RECORD)
+    archive = HttpArchive(path, REPLAY, ignored_params={'_'})
+    with pytest.raises(requests.exceptions.RequestException):
+        archive.replay(archive.get_key('GET', URL, {'appid': 753, 'market_hash_name': 'Card'}))
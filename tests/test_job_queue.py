@@ -0,0 +1,107 @@
+import pytest
+from common import job_queue
+from common.job_queue import JobQueue, PENDING, LEASED, DONE, FAILED
+from config import ConfigFileErrorException
+from conftest import make_config
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), lease=60, max_attempts=2)
+    queue.push([{'appid': 753, 'market_hash_name': 'a', 'currency': 1},
+                {'appid': 753, 'market_hash_name': 'b', 'currency': 3}])
+    return queue
+
+
+def test_a_leased_job_is_not_leased_again(queue):
+    assert [job['market_hash_name'] for job in queue.lease_jobs('w1', 1)] == ['a']
+    assert [job['market_hash_name'] for job in queue.lease_jobs('w2', 5)] == ['b']
+    assert queue.lease_jobs('w3', 5) == []
+
+
+def test_an_expired_lease_is_given_to_another_worker(queue, clock):
+    job = queue.lease_jobs('w1', 1)[0]
+    clock.now += 61
+    leased = queue.lease_jobs('w2', 1)
+    assert [(j['id'], j['attempts']) for j in leased] == [(job['id'], 2)]
+    # The first worker lost the lease, its result is dropped
+    assert not queue.complete(job['id'], 'w1', {'sell_price': 1.0})
+    assert queue.complete(job['id'], 'w2', {'sell_price': 2.0})
+    assert queue.collect()[0]['result'] == {'sell_price': 2.0}
+
+
+def test_a_job_fails_after_max_attempts_of_expired_leases(queue, clock):
+    queue.lease_jobs('w1', 1, currency=1)
+    clock.now += 61
+    queue.lease_jobs('w2', 1, currency=1)
+    clock.now += 61
+    assert queue.lease_jobs('w3', 1, currency=1) == []
+    assert queue.count(FAILED) == 1
+
+
+def test_fail_counts_the_attempts(queue):
+    job = queue.lease_jobs('w1', 1, currency=1)[0]
+    queue.fail(job['id'], 'w1', 'timeout')
+    assert queue.count(PENDING, currency=1) == 1
+    job = queue.lease_jobs('w1', 1, currency=1)[0]
+    assert job['attempts'] == 2
+    queue.fail(job['id'], 'w1', 'timeout')
+    assert queue.count(FAILED) == 1
+    assert queue.collect()[0]['error'] == 'timeout'
+
+
+def test_fail_without_retry(queue):
+    job = queue.lease_jobs('w1', 1)[0]
+    queue.fail(job['id'], 'w1', 'formula error', retry=False)
+    assert queue.count(FAILED) == 1
+
+
+def test_fail_by_a_worker_without_the_lease_is_ignored(queue):
+    job = queue.lease_jobs('w1', 1)[0]
+    queue.fail(job['id'], 'w2', 'not mine')
+    assert queue.count(LEASED) == 1
+
+
+def test_the_jobs_in_another_currency_are_not_leased(queue):
+    for _ in range(5):
+        assert [job['market_hash_name'] for job in queue.lease_jobs('w1', 5, currency=3)] in (['b'], [])
+    assert queue.count(PENDING, currency=1) == 1
+    job = queue.lease_jobs('w2', 5, currency=1)[0]
+    assert job['attempts'] == 1
+
+
+def test_collect_once(queue):
+    for job in queue.lease_jobs('w1', 5):
+        queue.complete(job['id'], 'w1', {'sell_price': 1.0})
+    assert queue.count(DONE) == 2
+    assert len(queue.collect()) == 2
+    assert queue.collect() == []
+
+
+def test_live_leases(queue, clock):
+    assert queue.count_live_leases() == 0
+    queue.lease_jobs('w1', 1)
+    assert queue.count_live_leases() == 1
+    clock.now += 61
+    assert queue.count_live_leases() == 0
+
+
+@pytest.mark.parametrize('key', ['lease', 'max_attempts', 'poll_interval', 'timeout', 'worker_timeout'])
+def test_the_distributed_settings_must_be_positive(key):
+    with pytest.raises(ConfigFileErrorException):
+        make_config(distributed={key: 0})
@@ -0,0 +1,77 @@
+from random import Random
+import pytest
+from price import OrderBook, ItemCantSellException, CalculationFormulaWrongException
+
+
+def make_graph(rng: Random, orders_num: int):
+    sell_order_graph, buy_order_graph = [], []
+    sell_total = buy_total = 0
+    for i in range(orders_num):
+        sell_total += rng.randint(1, 20)
+        buy_total += rng.randint(1, 20)
+        sell_order_graph.append([round(1.0 + i * 0.01, 2), sell_total, ''])
+        buy_order_graph.append([round(0.99 - i * 0.005, 3), buy_total, ''])
+    return {'highest_buy_order': buy_order_graph[0][0], 'lowest_sell_order': sell_order_graph[0][0],
+            'sell_order_graph': sell_order_graph, 'buy_order_graph': buy_order_graph}
+
+
+def linear_depth(ladder, price, side):
+    depth = 0
+    for order_price, quantity, _ in ladder:
+        if order_price <= price if side == 'sell' else order_price >= price:
+            depth = quantity
+    return depth
+
+
+def linear_push_back(ladder, back_num):
+    for price, quantity, _ in ladder:
+        if quantity >= back_num:
+            return price
+    return ladder[-1][0]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_the_bisect_queries_match_a_linear_scan(seed):
+    rng = Random(seed)
+    graph = make_graph(rng, rng.randint(1, 200))
+    book = OrderBook(graph)
+    for _ in range(50):
+        price = round(rng.uniform(0.0, 4.0), 3)
+        assert book.depth_at_price(price) == linear_depth(graph['sell_order_graph'], price, 'sell')
+        assert book.depth_at_price(price, 'buy') == linear_depth(graph['buy_order_graph'], price, 'buy')
+        back_num = rng.randint(0, book.total_sell_orders + 10)
+        assert book.sales_push_back(back_num) == linear_push_back(graph['sell_order_graph'], back_num)
+    assert book.total_sell_orders == graph['sell_order_graph'][-1][1]
+    assert book.total_buy_orders == graph['buy_order_graph'][-1][1]
+    assert book.spread() == pytest.approx(graph['lowest_sell_order'] - graph['highest_buy_order'])
+
+
+def test_price_at_quantile():
+    book = OrderBook({'sell_order_graph': [[1.0, 10, ''], [2.0, 50, ''], [3.0, 100, '']],
+                      'buy_order_graph': [[0.9, 40, ''], [0.5, 100, '']]})
+    assert book.price_at_quantile(0) == 1.0
+    assert book.price_at_quantile(0.1) == 1.0
+    assert book.price_at_quantile(0.11) == 2.0
+    assert book.price_at_quantile(1) == 3.0
+    assert book.price_at_quantile(0.4, 'buy') == 0.9
+    assert book.price_at_quantile(0.5, 'buy') == 0.5
+
+
+def test_no_orders():
+    book = OrderBook(None)
+    assert book.total_sell_orders == 0 and book.total_buy_orders == 0
+    assert book.depth_at_price(1.0) == 0
+    with pytest.raises(ItemCantSellException):
+        book.sales_push_back(1)
+    with pytest.raises(ItemCantSellException):
+        book.spread()
+    with pytest.raises(ItemCantSellException):
+        book.price_at_quantile(0.5)
+
+
+@pytest.mark.parametrize('call', [lambda book: book.sales_push_back(-1), lambda book: book.depth_at_price('1'),
+                                  lambda book: book.depth_at_price(1.0, 'ask'),
+                                  lambda book: book.price_at_quantile(1.5)])
+def test_wrong_arguments(call):
+    with pytest.raises(CalculationFormulaWrongException):
+        call(OrderBook({'sell_order_graph': [[1.0, 1, '']]}))
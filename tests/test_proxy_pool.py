@@ -0,0 +1,76 @@
+import pytest
+from config import config as lazy_config
+from common import proxy_pool
+from common.proxy_pool import ProxyPool, get_proxy_pool, OK, RATE_LIMITED, FAILED
+from conftest import make_config
+
+URLS = ['http://a:1', 'http://b:1', 'http://c:1']
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(proxy_pool, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def pool(clock):
+    lazy_config.set_object(make_config(proxy_pool={'enable': True, 'proxies': URLS,
+                                                   'pinned_endpoints': ['sellitem', 'mobileconf']}))
+    return ProxyPool(URLS, rate=1, burst=5, eject_threshold=2, eject_time=60, rate_limit_backoff=30)
+
+
+def use(pool: ProxyPool, endpoint: str, outcome: str = OK) -> str:
+    proxy = pool.acquire(endpoint)
+    pool.release(proxy, outcome)
+    return proxy.url
+
+
+def test_the_unpinned_requests_are_spread(pool):
+    proxies = [pool.acquire('pricehistory') for _ in range(3)]
+    assert sorted(proxy.url for proxy in proxies) == URLS
+
+
+def test_every_pinned_endpoint_keeps_its_own_proxy(pool):
+    sell = use(pool, 'sellitem')
+    for _ in range(3):
+        pool.acquire('pricehistory')
+    confirmation = use(pool, 'mobileconf')
+    assert [use(pool, 'sellitem') for _ in range(3)] == [sell] * 3
+    assert [use(pool, 'mobileconf') for _ in range(3)] == [confirmation] * 3
+    assert set(pool.pinned) == {'sellitem', 'mobileconf'}
+
+
+def test_a_pin_moves_off_a_rate_limited_proxy(pool):
+    sell = use(pool, 'sellitem', RATE_LIMITED)
+    moved = use(pool, 'sellitem')
+    assert moved != sell and pool.pinned['sellitem'].url == moved
+
+
+def test_a_failing_proxy_is_ejected_then_readmitted(pool, clock):
+    failing = pool.proxies[0]
+    for _ in range(2):
+        failing.in_flight += 1
+        pool.release(failing, FAILED)
+    assert failing.paused_until > clock.now
+    assert failing.url not in {use(pool, 'pricehistory') for _ in range(4)}
+    clock.now += 61
+    assert failing.get_wait(clock.now) == 0.0
+
+
+def test_the_pool_is_rebuilt_when_its_settings_change(clock):
+    lazy_config.set_object(make_config(proxy_pool={'enable': True, 'proxies': URLS, 'rate': 1}))
+    pool = get_proxy_pool()
+    assert get_proxy_pool() is pool
+    lazy_config.set_object(make_config(proxy_pool={'enable': True, 'proxies': URLS, 'rate': 2}))
+    rebuilt = get_proxy_pool()
+    assert rebuilt is not pool and rebuilt.proxies[0].rate == 2
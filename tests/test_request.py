@@ -0,0 +1,53 @@
+import io
+import re
+import pytest
+import requests
+from common.request import search_in_stream
+
+PATTERN = re.compile(rb'var g_rgWalletInfo = {.*}')
+CHUNK_SIZES = [1, 5, 64, 1000, 16384, 1 << 20]
+
+
+class RawBody(io.BytesIO):
+    """A raw body which still tells the bytes read after it's closed, like the one of urllib3"""
+    released = False
+
+    def close(self) -> None:
+        self.released = True
+
+
+def make_response(body: bytes) -> requests.Response:
+    rp = requests.Response()
+    rp.status_code = 200
+    rp.raw = RawBody(body)
+    return rp
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_match_in_a_line_longer_than_a_chunk(config, chunk_size):
+    body = (b'<html>\n' + b'x' * 70000 + b' var g_rgWalletInfo = {"success":1,' + b'"a":1,' * 12000 +
+            b'"wallet_currency":1};' + b'y' * 70000 + b'\n</html>\n')
+    match = search_in_stream(make_response(body), PATTERN, 'bytes_read.test', chunk_size=chunk_size)
+    assert match is not None
+    assert match[0].endswith(b'"wallet_currency":1}')
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_match_at_the_end_without_a_newline(config, chunk_size):
+    body = b'<html>\n' * 100 + b'var g_rgWalletInfo = {"success":1}'
+    match = search_in_stream(make_response(body), PATTERN, 'bytes_read.test', chunk_size=chunk_size)
+    assert match is not None and match[0] == b'var g_rgWalletInfo = {"success":1}'
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_no_match(config, chunk_size):
+    body = b'<html>\n' * 1000 + b'var g_rgWalletInfo = \n{"success":1}\n'
+    assert search_in_stream(make_response(body), PATTERN, 'bytes_read.test', chunk_size=chunk_size) is None
+
+
+def test_stops_after_the_line_of_the_match(config):
+    body = b'var g_rgWalletInfo = {"success":1}\n' + b'z' * 1000000
+    rp = make_response(body)
+    assert search_in_stream(rp, PATTERN, 'bytes_read.test', chunk_size=1024) is not None
+    assert rp.raw.released
+    assert rp.raw.tell() < 2048
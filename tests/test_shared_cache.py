@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+from time import time, monotonic, sleep
+import pytest
+from common.shared_cache import SharedCache
+
+KEY = ('history', 753, 'Card', 1)
+
+
+@pytest.fixture
+def cache(tmp_path, config):
+    return SharedCache(str(tmp_path / 'market.sqlite3'), lease=0.5, poll_interval=0.02)
+
+
+def hold_lock(cache: SharedCache, owner: str, seconds: float) -> None:
+    """Leave a fill lock like a process which died while filling the key"""
+    connection = sqlite3.connect(cache.path, isolation_level=None)
+    connection.execute('INSERT INTO fill_locks VALUES (?, ?, ?, ?, ?, ?)', KEY + (owner, time() + seconds))
+    connection.close()
+
+
+def test_fill_once_then_hit(cache):
+    fills = []
+    assert cache.get_or_fill(*KEY, 60, lambda: fills.append(1) or [1, 2]) == [1, 2]
+    assert cache.get_or_fill(*KEY, 60, lambda: fills.append(1) or [3]) == [1, 2]
+    assert fills == [1]
+
+
+def test_an_expired_lease_of_a_dead_filler_is_taken_over(cache):
+    hold_lock(cache, 'dead', cache.lease)
+    start = monotonic()
+    assert cache.get_or_fill(*KEY, 60, lambda: 'filled') == 'filled'
+    assert cache.lease * 0.8 <= monotonic() - start < cache.lease + 2
+
+
+def test_a_live_lease_is_waited_for(cache):
+    hold_lock(cache, 'other', 5)
+
+    def fill_later():
+        sleep(0.2)
+        cache.set(*KEY, value='from the other process', ttl=60)
+
+    filler = threading.Thread(target=fill_later)
+    filler.start()
+    assert cache.get_or_fill(*KEY, 60, lambda: 'mine') == 'from the other process'
+    filler.join()
+
+
+def test_a_failed_fill_releases_the_lease(cache):
+    def fail():
+        raise ValueError('steam is down')
+
+    with pytest.raises(ValueError):
+        cache.get_or_fill(*KEY, 60, fail)
+    start = monotonic()
+    assert cache.get_or_fill(*KEY, 60, lambda: 'retried') == 'retried'
+    assert monotonic() - start < cache.lease
+
+
+def test_concurrent_fills_are_done_once(cache):
+    fills = []
+    results = []
+
+    def fill():
+        fills.append(1)
+        sleep(0.1)
+        return 'value'
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fill(*KEY, 60, fill))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 5
+    assert fills == [1]
+
+
+def test_an_expired_entry_is_filled_again(cache):
+    cache.set(*KEY, value='old', ttl=-1)
+    assert cache.get_or_fill(*KEY, 60, lambda: 'new') == 'new'
@@ -0,0 +1,89 @@
+import threading
+from time import sleep
+from common import metrics
+from common.singleflight import SingleFlight, coalesce
+
+
+def run_together(function, args_list):
+    results = [None] * len(args_list)
+    errors = [None] * len(args_list)
+
+    def run(i, args):
+        try:
+            results[i] = function(*args)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_calls_with_the_same_key_share_one_call():
+    calls = []
+
+    @coalesce('test_shared')
+    def fetch(name):
+        calls.append(name)
+        sleep(0.2)
+        return name.upper()
+
+    results, _ = run_together(fetch, [('a',)] * 5 + [('b',)] * 3)
+    assert results == ['A'] * 5 + ['B'] * 3
+    assert sorted(calls) == ['a', 'b']
+
+
+def test_the_key_function_leaves_arguments_out():
+    calls = []
+
+    @coalesce('test_key', key=lambda appid, name, *args, **kwargs: (appid, name))
+    def fetch(appid, name, cookie):
+        calls.append(cookie)
+        sleep(0.2)
+        return cookie
+
+    results, _ = run_together(fetch, [(753, 'a', 'cookie %d' % i) for i in range(4)])
+    assert len(calls) == 1 and results == calls * 4
+
+
+def test_the_exception_is_raised_to_every_caller():
+    calls = []
+
+    @coalesce('test_error')
+    def fetch():
+        calls.append(1)
+        sleep(0.2)
+        raise ValueError('steam is down')
+
+    _, errors = run_together(fetch, [()] * 3)
+    assert len(calls) == 1
+    assert all(isinstance(error, ValueError) for error in errors)
+
+
+def test_a_result_is_not_reused_after_the_call():
+    calls = []
+    group = SingleFlight('test_sequential')
+    for _ in range(3):
+        group.do('key', lambda: calls.append(1))
+    assert len(calls) == 3 and group.calls == {}
+
+
+def test_the_key_is_not_logged(caplog):
+    group = SingleFlight('test_log')
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        sleep(0.2)
+
+    leader = threading.Thread(target=group.do, args=(('secret cookie',), slow))
+    leader.start()
+    started.wait()
+    with caplog.at_level('DEBUG', logger='common.singleflight'):
+        group.do(('secret cookie',), slow)
+    leader.join()
+    assert caplog.records and all('secret' not in record.getMessage() for record in caplog.records)
+    assert metrics.get('coalesced.test_log') == 1